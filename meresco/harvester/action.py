@@ -45,7 +45,7 @@ from .eventlogger import CompositeLogger, EventLogger
 from .harvester import Harvester, NOTHING_TO_DO
 from .harvesterlog import HarvesterLog
 from .state import State
-from .ids import readIds, writeIds
+from .ids import writeIds, sortedIds, idsDifference
 
 
 class Action(object):
@@ -79,8 +79,14 @@ class Action(object):
     def info(self):
         return  str(self.__class__.__name__)
 
+    def _createHarvesterLog(self):
+        return HarvesterLog(self._stateDir, self._logDir, self._repository.id,
+                logBufferSize=self._repository.logBufferSize,
+                logFlushInterval=self._repository.logFlushInterval,
+                logSync=self._repository.logSync)
+
     def _createHarvester(self):
-        harvesterLog = HarvesterLog(self._stateDir, self._logDir, self._repository.id)
+        harvesterLog = self._createHarvesterLog()
         eventlogger = CompositeLogger([
             (['*'], harvesterLog.eventLogger()),
             (['ERROR', 'INFO', 'WARN'], self._generalHarvestLog)
@@ -89,7 +95,10 @@ class Action(object):
         mapping = self._repository.mapping()
         oairequest = self._repository.oairequest()
         helix = \
-            (Harvester(self._repository),
+            (Harvester(self._repository,
+                    prefetchDepth=self._repository.prefetchDepth,
+                    maxPages=self._repository.maxPages,
+                    maxTime=self._repository.maxHarvestTime),
                 (oairequest,),
                 (harvesterLog,),
                 (eventlogger,),
@@ -101,7 +110,7 @@ class Action(object):
         return [harvesterLog], be(helix)
 
     def _createDeleteIds(self):
-        harvesterLog = HarvesterLog(self._stateDir, self._logDir, self._repository.id)
+        harvesterLog = self._createHarvesterLog()
         deleteIdsLog = EventLogger(join(self._logDir, 'deleteids.log'))
         eventlogger = CompositeLogger([
             (['*'], deleteIdsLog),
@@ -165,6 +174,7 @@ class SmoothAction(Action):
         Action.__init__(self, repository, stateDir, logDir, generalHarvestLog)
         self.filename = join(self._stateDir, self._repository.id + '.ids')
         self.oldfilename = self.filename + ".old"
+        self.deletefilename = self.filename + '.delete'
 
     def do(self):
         if self._repository.shopClosed():
@@ -172,11 +182,13 @@ class SmoothAction(Action):
 
         if not isfile(self.oldfilename):
             result, hasResumptionToken = self._smoothinit(), True
+        elif isfile(self.deletefilename):
+            result, hasResumptionToken = NOTHING_TO_DO, False
         else:
             result, hasResumptionToken = self._harvest()
         if result == NOTHING_TO_DO:
             result = self._finish()
-            hasResumptionToken = False
+            hasResumptionToken = result != DONE
         return result == DONE, 'Smooth reharvest: ' + result, hasResumptionToken
 
     def resetState(self):
@@ -188,7 +200,7 @@ class SmoothAction(Action):
 
     def _smoothinit(self):
         if isfile(self.filename):
-            writeIds(self.oldfilename, sorted(set(readIds(self.filename) + readIds(self.invalidIdsFilename))))
+            writeIds(self.oldfilename, sortedIds([self.filename, self.invalidIdsFilename], tempDir=self._stateDir))
             writeIds(self.filename, set())
         else:
             open(self.oldfilename, 'w').close()
@@ -201,18 +213,18 @@ class SmoothAction(Action):
         return 'initialized.'
 
     def _finish(self):
-        deletefilename = self.filename + '.delete'
-        if not isfile(deletefilename):
-            writeIds(deletefilename, sorted(set(readIds(self.oldfilename)) - set(readIds(self.filename))))
-        self._delete(deletefilename)
+        if not isfile(self.deletefilename):
+            writeIds(self.deletefilename, idsDifference(sortedIds([self.oldfilename], tempDir=self._stateDir), sortedIds([self.filename], tempDir=self._stateDir)))
+        if not self._delete(self.deletefilename):
+            return DELETING
         remove(self.oldfilename)
-        remove(deletefilename)
+        remove(self.deletefilename)
         return DONE
 
     def _delete(self, filename):
         loggers, d = self._createDeleteIds()
         try:
-            d.deleteFile(filename)
+            return d.deleteFile(filename, timeBudget=self._repository.maxHarvestTime)
         finally:
             for each in loggers:
                 each.close()
@@ -226,6 +238,7 @@ class SmoothAction(Action):
                 each.close()
 
 DONE = 'Done.'
+DELETING = 'Deleting, continued in a next run.'
 
 class ActionException(Exception):
     pass
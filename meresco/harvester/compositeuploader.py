@@ -75,6 +75,16 @@ class CompositeUploader(VirtualUploader):
         for delegate in self._delegates:
             delegate.delete(uploadId)
 
+    def deleteMany(self, uploads):
+        for delegate in self._delegates:
+            delegate.deleteMany(uploads)
+
+    def flushUploads(self):
+        rejected = []
+        for delegate in self._delegates:
+            rejected.extend(delegate.flushUploads())
+        return rejected
+
     def info(self):
         result = []
         return "Composite Uploader: " + str(result)
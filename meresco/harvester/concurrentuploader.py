@@ -0,0 +1,200 @@
+## begin license ##
+#
+# "Meresco Harvester" consists of two subsystems, namely an OAI-harvester and
+# a web-control panel.
+# "Meresco Harvester" is originally called "Sahara" and was developed for
+# SURFnet by:
+# Seek You Too B.V. (CQ2) http://www.cq2.nl
+#
+# Copyright (C) 2026 Seecr (Seek You Too B.V.) https://seecr.nl
+#
+# This file is part of "Meresco Harvester"
+#
+# "Meresco Harvester" is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# "Meresco Harvester" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "Meresco Harvester"; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+## end license ##
+
+
+from collections import deque
+from copy import copy, deepcopy
+from queue import Queue
+from threading import Thread, Lock
+from zlib import crc32
+
+from .virtualuploader import VirtualUploader, InvalidDataException
+
+
+class ConcurrentUploader(VirtualUploader):
+    """Runs send and delete of the wrapped uploader in a number of worker
+        threads, with at most queueSize uploads waiting per worker. All
+        uploads for the same id go to the same worker, so they are done in
+        the order they were given. flushUploads waits for all uploads in
+        flight. When the wrapped uploader logs to a QueuedLogger, its log
+        lines are written from the harvester thread.
+
+        Workers get uploads with a copy of the record, made in the harvester
+        thread, because a streamed response releases every record as soon as
+        the next one is read."""
+    def __init__(self, uploader, eventlogger, concurrency, queueSize=10, uploaderLogger=None):
+        VirtualUploader.__init__(self, eventlogger)
+        self._uploader = uploader
+        self._uploaderLogger = uploaderLogger
+        self._concurrency = concurrency
+        self._queueSize = queueSize
+        self._queues = []
+        self._threads = []
+        self._rejected = []
+        self._error = None
+        self._lock = Lock()
+
+    def start(self):
+        self._uploader.start()
+        self._queues = [Queue(maxsize=self._queueSize) for i in range(self._concurrency)]
+        self._threads = [Thread(target=self._work, args=(queue,), daemon=True) for queue in self._queues]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        try:
+            self._waitForUploads()
+            for queue in self._queues:
+                queue.put(None)
+            for thread in self._threads:
+                thread.join()
+            self._queues, self._threads = [], []
+            self._writeLog()
+            for exception in self._takeRejected():
+                self._logWarning("Upload rejected: %s" % exception.originalMessage, id=exception.uploadId)
+        finally:
+            self._uploader.stop()
+        self._raiseError()
+
+    def send(self, anUpload):
+        self._submit(self._uploader.send, anUpload)
+
+    def delete(self, anUpload):
+        self._submit(self._uploader.delete, anUpload)
+
+    def deleteMany(self, uploads):
+        """Splits uploads over the workers, every worker deletes its part
+            with one deleteMany of the wrapped uploader."""
+        self._writeLog()
+        self._raiseError()
+        if not self._queues:
+            self._uploader.deleteMany(uploads)
+            return
+        parts = {}
+        for anUpload in uploads:
+            parts.setdefault(self._queueIndex(anUpload.id), []).append(_detached(anUpload))
+        for index, part in sorted(parts.items()):
+            self._queues[index].put((self._uploader.deleteMany, part))
+
+    def flushUploads(self):
+        self._waitForUploads()
+        self._writeLog()
+        self._raiseError()
+        rejected = self._takeRejected()
+        return rejected + self._uploader.flushUploads()
+
+    def info(self):
+        return '%s (concurrency: %d)' % (self._uploader.info(), self._concurrency)
+
+    def _submit(self, method, anUpload):
+        self._writeLog()
+        self._raiseError()
+        if not self._queues:
+            method(anUpload)
+            return
+        self._queueFor(anUpload.id).put((method, _detached(anUpload)))
+
+    def _queueFor(self, uploadId):
+        return self._queues[self._queueIndex(uploadId)]
+
+    def _queueIndex(self, uploadId):
+        return crc32(uploadId.encode()) % self._concurrency
+
+    def _work(self, queue):
+        while True:
+            item = queue.get()
+            try:
+                if item is None:
+                    return
+                method, anUpload = item
+                if self._error is not None:
+                    continue
+                try:
+                    method(anUpload)
+                except InvalidDataException as e:
+                    with self._lock:
+                        self._rejected.append(e)
+                except Exception as e:
+                    with self._lock:
+                        if self._error is None:
+                            self._error = e
+            finally:
+                queue.task_done()
+
+    def _waitForUploads(self):
+        for queue in self._queues:
+            queue.join()
+
+    def _takeRejected(self):
+        with self._lock:
+            rejected, self._rejected = self._rejected, []
+        return rejected
+
+    def _writeLog(self):
+        if self._uploaderLogger is not None:
+            self._uploaderLogger.writeTo(self._logger)
+
+    def _raiseError(self):
+        with self._lock:
+            error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+
+def _detached(anUpload):
+    record = getattr(anUpload, 'record', None)
+    if record is None:
+        return anUpload
+    result = copy(anUpload)
+    result.record = deepcopy(record)
+    return result
+
+
+class QueuedLogger(object):
+    """Logger for an uploader that runs in worker threads. Log calls are
+        queued and written by writeTo, from the thread that owns the real
+        event logger, which is not thread safe."""
+    def __init__(self):
+        self._calls = deque()
+
+    def logLine(self, *args, **kwargs):
+        self._calls.append(('logLine', args, kwargs))
+
+    def logWarning(self, *args, **kwargs):
+        self._calls.append(('logWarning', args, kwargs))
+
+    def logError(self, *args, **kwargs):
+        self._calls.append(('logError', args, kwargs))
+
+    def logInfo(self, *args, **kwargs):
+        self._calls.append(('logInfo', args, kwargs))
+
+    def writeTo(self, logger):
+        while self._calls:
+            name, args, kwargs = self._calls.popleft()
+            getattr(logger, name)(*args, **kwargs)
@@ -0,0 +1,182 @@
+## begin license ##
+#
+# "Meresco Harvester" consists of two subsystems, namely an OAI-harvester and
+# a web-control panel.
+# "Meresco Harvester" is originally called "Sahara" and was developed for
+# SURFnet by:
+# Seek You Too B.V. (CQ2) http://www.cq2.nl
+#
+# Copyright (C) 2026 Seecr (Seek You Too B.V.) https://seecr.nl
+#
+# This file is part of "Meresco Harvester"
+#
+# "Meresco Harvester" is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# "Meresco Harvester" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "Meresco Harvester"; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+## end license ##
+
+
+from http.client import HTTPConnection, HTTPSConnection, BadStatusLine
+from urllib.error import HTTPError
+from urllib.parse import urlsplit, urljoin
+from threading import Lock
+from time import time
+
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 5
+
+class ConnectionPool(object):
+    """Keeps idle keep-alive connections per host, so consecutive requests
+        to the same host do not pay a new TCP and TLS handshake.
+        urlopen is a drop-in replacement for urllib.request.urlopen; only
+        GET requests follow redirects, at most MAX_REDIRECTS."""
+    def __init__(self, maxConnections=2, idleTimeout=60, _now=None):
+        self._maxConnections = maxConnections
+        self._idleTimeout = idleTimeout
+        self._now = _now or time
+        self._idle = {}
+        self._counts = {}
+        self._lock = Lock()
+
+    def urlopen(self, request, timeout=None, context=None):
+        url = request.full_url
+        method = request.get_method()
+        headers = dict(request.header_items())
+        for redirect in range(MAX_REDIRECTS + 1):
+            response = self._open(url, method, request.data, headers, timeout, context)
+            location = response.getheader('Location')
+            if method != 'GET' or response.status not in REDIRECT_CODES or not location:
+                break
+            if redirect == MAX_REDIRECTS:
+                raise HTTPError(url, response.status, 'Too many redirects (%d): %s' % (MAX_REDIRECTS, response.reason), response.headers, response)
+            response.read()
+            response.close()
+            url = urljoin(url, location)
+        if response.status >= 400:
+            raise HTTPError(url, response.status, response.reason, response.headers, response)
+        return response
+
+    def counts(self, host):
+        """Returns (new, reused) connection counts for host."""
+        with self._lock:
+            return tuple(self._counts.get(host, (0, 0)))
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection, lastUsed in connections:
+                connection.close()
+
+    def _open(self, url, method, body, headers, timeout, context):
+        scheme, netloc, path, query, _ = urlsplit(url)
+        key = (scheme, netloc, context)
+        selector = (path or '/') + ('?' + query if query else '')
+        connection, reused = self._acquire(key, timeout)
+        try:
+            connection.request(method, selector, body=body, headers=headers)
+            response = connection.getresponse()
+        except (ConnectionError, BadStatusLine):
+            connection.close()
+            if not reused:
+                raise
+            # server closed the idle connection in the meantime
+            connection = self._newConnection(key, timeout)
+            connection.request(method, selector, body=body, headers=headers)
+            response = connection.getresponse()
+        return PooledResponse(self, key, connection, response)
+
+    def _acquire(self, key, timeout):
+        now = self._now()
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle:
+                connection, lastUsed = idle.pop()
+                if now - lastUsed > self._idleTimeout:
+                    connection.close()
+                    continue
+                self._count(key, reused=True)
+                connection.timeout = timeout
+                if connection.sock is not None:
+                    connection.sock.settimeout(timeout)
+                return connection, True
+        return self._newConnection(key, timeout), False
+
+    def _newConnection(self, key, timeout):
+        scheme, netloc, context = key
+        with self._lock:
+            self._count(key, reused=False)
+        if scheme == 'https':
+            return HTTPSConnection(netloc, timeout=timeout, context=context)
+        return HTTPConnection(netloc, timeout=timeout)
+
+    def _release(self, key, connection):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self._maxConnections:
+                idle.append((connection, self._now()))
+                return
+        connection.close()
+
+    def _count(self, key, reused):
+        counts = self._counts.setdefault(key[1], [0, 0])
+        counts[1 if reused else 0] += 1
+
+
+class PooledResponse(object):
+    """File-like wrapper around an http.client.HTTPResponse that hands its
+        connection back to the pool once the body has been read completely."""
+    def __init__(self, pool, key, connection, response):
+        self._pool = pool
+        self._key = key
+        self._connection = connection
+        self._response = response
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+
+    def getheader(self, name, default=None):
+        return self._response.getheader(name, default)
+
+    def read(self, *args):
+        data = self._response.read(*args)
+        self._releaseIfDone()
+        return data
+
+    def readinto(self, buffer):
+        result = self._response.readinto(buffer)
+        self._releaseIfDone()
+        return result
+
+    def close(self):
+        if self._connection is None:
+            return
+        self._response.close()
+        self._connection.close()
+        self._connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _releaseIfDone(self):
+        if self._connection is None or not self._response.isclosed():
+            return
+        connection, self._connection = self._connection, None
+        if self._response.will_close:
+            connection.close()
+        else:
+            self._pool._release(self._key, connection)
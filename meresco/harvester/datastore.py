@@ -27,20 +27,99 @@
 #
 ## end license ##
 
-from os.path import join, isdir, isfile
-from os import makedirs, rename, listdir, remove
+from os.path import join, isdir, isfile, dirname
+from os import makedirs, rename, listdir, remove, stat, scandir
 from uuid import uuid4
 from meresco.components.json import JsonDict
 from shutil import copy
+from time import time
+
+CHECK_INTERVAL = 1.0
+
+class DataCache(object):
+    """Parsed data files and directory listings by path. Changes made
+        through the store are seen at once; the modification time and size
+        of a file or directory are checked at most once every checkInterval
+        seconds, so edits by other processes are noticed shortly after.
+        get returns a shared object that must not be modified; load returns
+        a fresh copy."""
+    def __init__(self, checkInterval=CHECK_INTERVAL, _time=time):
+        self._checkInterval = checkInterval
+        self._time = _time
+        self._files = {}
+        self._listings = {}
+
+    def get(self, path):
+        return self._entry(path)[1]
+
+    def load(self, path):
+        return _copy(self._entry(path)[1])
+
+    def listdir(self, path):
+        now = self._time()
+        cached = self._listings.get(path)
+        if cached is not None and now - cached[2] < self._checkInterval:
+            return cached[1]
+        stamp = _stamp(path)
+        names = listdir(path) if cached is None or cached[0] != stamp else cached[1]
+        self._listings[path] = (stamp, names, now)
+        return names
+
+    def invalidate(self, path):
+        self._files.pop(path, None)
+        self._listings.pop(dirname(path), None)
+
+    def _entry(self, path):
+        now = self._time()
+        cached = self._files.get(path)
+        if cached is not None and now - cached[2] < self._checkInterval:
+            return cached
+        try:
+            stamp = _stamp(path)
+        except IOError:
+            self._files.pop(path, None)
+            raise
+        if cached is None or cached[0] != stamp:
+            with open(path) as f:
+                data = JsonDict.loads(f.read())
+        else:
+            data = cached[1]
+        cached = self._files[path] = (stamp, data, now)
+        return cached
+
+def _copy(data):
+    if isinstance(data, dict):
+        return type(data)((key, _copy(value)) for key, value in data.items())
+    if isinstance(data, list):
+        return type(data)(_copy(value) for value in data)
+    return data
+
+def _stamp(path):
+    st = stat(path)
+    return st.st_mtime_ns, st.st_size
+
+def dataVersion(path):
+    """Changes whenever a data file in path is written, added or removed,
+        without reading any of them."""
+    newest, count = 0, 0
+    with scandir(path) as entries:
+        for entry in entries:
+            if entry.is_file():
+                count += 1
+                newest = max(newest, entry.stat().st_mtime_ns)
+    return '%s-%s-%s' % (stat(path).st_mtime_ns, count, newest)
+
 
 class OldDataStore(object):
-    def __init__(self, dataPath, id_fn=lambda: str(uuid4())):
+    def __init__(self, dataPath, id_fn=lambda: str(uuid4()), _time=time):
         self._dataPath = dataPath
         isdir(self._dataPath) or makedirs(self._dataPath)
         self.id_fn = id_fn
+        self._cache = DataCache(_time=_time)
 
     def addData(self, identifier, datatype, data, newId=True):
         filename = '{}.{}'.format(identifier, datatype)
+        self._cache.invalidate(join(self._dataPath, filename))
         with open(join(self._dataPath, filename), 'w') as f:
             JsonDict(data).dump(f, indent=4, sort_keys=True)
 
@@ -50,21 +129,33 @@ class OldDataStore(object):
         if guid is not None:
             raise NotImplementedError()
         try:
-            d = JsonDict.load(fpath)
+            d = self._cache.load(fpath)
         except IOError:
             raise ValueError(filename)
         return d
 
+    def getCachedData(self, identifier, datatype):
+        """Like getData, but returns a shared object that must not be modified."""
+        filename = '{}.{}'.format(identifier, datatype)
+        try:
+            return self._cache.get(join(self._dataPath, filename))
+        except IOError:
+            raise ValueError(filename)
+
     def listForDatatype(self, datatype):
         ext = '.{}'.format(datatype)
-        return sorted([d.split(ext,1)[0] for d in listdir(self._dataPath) if d.endswith(ext)])
+        return sorted([d.split(ext,1)[0] for d in self._cache.listdir(self._dataPath) if d.endswith(ext)])
 
     def exists(self, identifier, datatype):
         return isfile(join(self._dataPath, '{}.{}'.format(identifier, datatype)))
 
+    def version(self):
+        return dataVersion(self._dataPath)
+
     def deleteData(self, identifier, datatype):
         filename = '{}.{}'.format(identifier, datatype)
         fpath = join(self._dataPath, filename)
+        self._cache.invalidate(fpath)
         remove(fpath)
 
     def getGuid(self, guid):
@@ -72,14 +163,16 @@ class OldDataStore(object):
 
 
 class DataStore(object):
-    def __init__(self, dataPath, id_fn=lambda: str(uuid4())):
+    def __init__(self, dataPath, id_fn=lambda: str(uuid4()), _time=time):
         self._dataPath = dataPath
         self._dataIdPath = join(dataPath, '_')
         isdir(self._dataIdPath) or makedirs(self._dataIdPath)
         self.id_fn = id_fn
+        self._cache = DataCache(_time=_time)
 
     def addData(self, identifier, datatype, data, newId=True):
         filename = '{}.{}'.format(identifier, datatype)
+        self._cache.invalidate(join(self._dataPath, filename))
         if '@id' in data and newId:
             copy(join(self._dataPath, filename), join(self._dataIdPath, filename) + '.' + data['@id'])
             data['@base'] = data['@id']
@@ -90,32 +183,54 @@ class DataStore(object):
 
     def getData(self, identifier, datatype, guid=None):
         filename = '{}.{}'.format(identifier, datatype)
-        fpath = join(self._dataPath, filename)
         if guid is not None:
-            fpath = join(self._dataIdPath, filename) + '.' + guid
+            return self._getHistoryData(identifier, datatype, guid)
         try:
-            d = JsonDict.load(fpath)
+            d = self._cache.load(join(self._dataPath, filename))
         except IOError:
-            if guid is not None:
-                result = self.getData(identifier, datatype)
-                if result['@id'] == guid:
-                    return result
             raise ValueError(filename)
-        if guid is None and '@id' not in d:
+        if '@id' not in d:
             self.addData(identifier, datatype, d)
         return d
 
+    def getCachedData(self, identifier, datatype):
+        """Like getData, but returns a shared object that must not be modified."""
+        filename = '{}.{}'.format(identifier, datatype)
+        try:
+            d = self._cache.get(join(self._dataPath, filename))
+        except IOError:
+            raise ValueError(filename)
+        if '@id' not in d:
+            return self.getData(identifier, datatype)
+        return d
+
+    def _getHistoryData(self, identifier, datatype, guid):
+        """Earlier versions are only asked for now and then, so they are not
+            kept in the cache."""
+        filename = '{}.{}'.format(identifier, datatype)
+        try:
+            return JsonDict.load(join(self._dataIdPath, filename) + '.' + guid)
+        except IOError:
+            result = self.getData(identifier, datatype)
+            if result['@id'] == guid:
+                return result
+            raise ValueError(filename)
+
     def listForDatatype(self, datatype):
         ext = '.{}'.format(datatype)
-        return sorted([d.split(ext,1)[0] for d in listdir(self._dataPath) if d.endswith(ext)])
+        return sorted([d.split(ext,1)[0] for d in self._cache.listdir(self._dataPath) if d.endswith(ext)])
 
     def exists(self, identifier, datatype):
         return isfile(join(self._dataPath, '{}.{}'.format(identifier, datatype)))
 
+    def version(self):
+        return dataVersion(self._dataPath)
+
     def deleteData(self, identifier, datatype):
         filename = '{}.{}'.format(identifier, datatype)
         fpath = join(self._dataPath, filename)
         curId = JsonDict.load(fpath)['@id']
+        self._cache.invalidate(fpath)
         rename(fpath, join(self._dataIdPath, filename) + '.' + curId)
 
     def getGuid(self, guid):
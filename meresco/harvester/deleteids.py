@@ -37,62 +37,150 @@
 ## end license ##
 
 import sys
+from hashlib import sha1
+from time import time
+from os import remove, rename
+from os.path import isfile
 from traceback import format_exception
 
 from meresco.core import Observable
+from meresco.components.json import JsonDict
 
 from .mapping import Upload
-from .ids import idfilename
 
 class DeleteIds(Observable):
-    def __init__(self, repository, stateDir, batchSize=1000):
+    """Deletes ids in batches: every batch goes to the uploaders with one
+        deleteMany and is flushed before the next one starts. Ids of the
+        repository are removed batch by batch, except those of rejected
+        deletes, which stay to be deleted again; for other id files the offset
+        up to which they are deleted is kept next to the file, so an
+        interrupted delete resumes at that offset. With a time budget a
+        delete stops after the batch that exceeds it, to be resumed by a next
+        run."""
+    def __init__(self, repository, stateDir, batchSize=1000, _now=time):
         Observable.__init__(self)
         self._stateDir = stateDir
         self._repository = repository
         self._batchSize = batchSize
+        self._now = _now
         self._invalid = self._deleteIds = False
+        self._filename = None
+        self._timeBudget = None
 
     def ids(self):
         return self.call.getIds(invalid=self._invalid, deleteIds=self._deleteIds)
 
     def delete(self):
+        """Returns whether all ids are deleted."""
         self.do.start()
         try:
-            self._delete()
+            return self._delete()
         finally:
             self.do.stop()
 
-    def deleteFile(self, filename):
+    def deleteFile(self, filename, timeBudget=None):
         self._invalid = filename.endswith("_invalid.ids")
         self._deleteIds = filename.endswith(".delete")
+        self._filename = filename
+        self._timeBudget = timeBudget
         try:
-            self.delete()
+            return self.delete()
         finally:
             self._invalid = False
             self._deleteIds = False
+            self._filename = None
+            self._timeBudget = None
 
     def _delete(self):
+        if self._invalid or self._deleteIds:
+            progress = DeleteProgress(self._filename)
+        else:
+            progress = _RemainingIds()
         ids = self.ids()
-        processed = 0
+        offset = progress.start(ids)
+        started = self._now()
         try:
-            for id in ids:
+            for start in range(offset, len(ids), self._batchSize):
+                batch = ids[start:start + self._batchSize]
                 try:
-                    anUpload = Upload(repository=self._repository)
-                    anUpload.id = id
-                    self.do.notifyHarvestedRecord(anUpload.id)
-                    self.do.delete(anUpload)
+                    uploads = []
+                    for id in batch:
+                        anUpload = Upload(repository=self._repository)
+                        anUpload.id = id
+                        self.do.notifyHarvestedRecord(anUpload.id)
+                        uploads.append(anUpload)
+                    self.do.deleteMany(uploads)
+                    rejected = set()
+                    for exception in self.call.flushUploads() or []:
+                        self.do.logWarning("Delete rejected: %s" % exception.originalMessage, id=exception.uploadId)
+                        rejected.add(exception.uploadId)
                     if not self._invalid and not self._deleteIds:
-                        self.do.deleteIdentifier(id)
-                    processed += 1
-                    if processed % self._batchSize == 0 and processed > 0:
-                        self.call.flushIds(invalid=self._invalid, deleteIds=self._deleteIds)
+                        self.do.deleteIdentifiers([id for id in batch if id not in rejected])
                 except:
                     xtype, xval, xtb = sys.exc_info()
                     errorMessage = '|'.join(map(str.strip,format_exception(xtype, xval, xtb)))
-                    self.do.logError(errorMessage, id=id)
+                    self.do.logError(errorMessage, id=getattr(xval, 'uploadId', batch[0]))
                     raise
+                done = start + len(batch)
+                progress.checkpoint(done)
+                elapsed = self._now() - started
+                self.do.markDeleteProgress(done=done, remaining=len(ids) - done, rate=(done - offset) / elapsed if elapsed > 0 else 0.0)
+                if self._timeBudget is not None and elapsed >= self._timeBudget and done < len(ids):
+                    return False
+            progress.done()
+            self.do.clearDeleteProgress()
+            return True
         finally:
             self.call.flushIds(invalid=self._invalid, deleteIds=self._deleteIds)
 
     def markDeleted(self):
         self.do.markDeleted()
+
+
+class DeleteProgress(object):
+    """The offset up to which a list of ids is deleted, kept with the count
+        and a checksum of that list, so it only applies to the same ids."""
+    def __init__(self, filename):
+        self._filename = filename + '.deleting'
+        self._count = 0
+        self._checksum = None
+
+    def start(self, ids):
+        """Returns the offset of an interrupted delete of the same ids, or 0."""
+        self._count, self._checksum = len(ids), _checksum(ids)
+        try:
+            progress = JsonDict.load(self._filename) if isfile(self._filename) else {}
+        except ValueError:
+            progress = {}
+        if progress.get('count') == self._count and progress.get('checksum') == self._checksum:
+            return progress.get('offset', 0)
+        self.checkpoint(0)
+        return 0
+
+    def checkpoint(self, offset):
+        with open(self._filename + '.tmp', 'w') as f:
+            JsonDict(count=self._count, checksum=self._checksum, offset=offset).dump(f)
+        rename(self._filename + '.tmp', self._filename)
+
+    def done(self):
+        isfile(self._filename) and remove(self._filename)
+
+
+class _RemainingIds(object):
+    "The ids of the repository are removed as they are deleted, so an interrupted delete resumes with what is left."
+    def start(self, ids):
+        return 0
+
+    def checkpoint(self, offset):
+        pass
+
+    def done(self):
+        pass
+
+
+def _checksum(ids):
+    checksum = sha1()
+    for id in ids:
+        checksum.update(id.encode('utf-8', 'surrogateescape'))
+        checksum.update(b'\n')
+    return checksum.hexdigest()
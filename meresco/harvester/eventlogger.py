@@ -37,56 +37,89 @@
 
 from re import compile
 from datetime import datetime
-from os.path import dirname, isdir
-from os import makedirs, rename
+from time import time, sleep
+from threading import Thread, RLock
+from os.path import dirname, isdir, isfile, getsize
+from os import makedirs, rename, fsync, remove, SEEK_END
+from meresco.components.json import JsonDict
 
 LOGLINE_RE=compile(r'^\[([^\]]*)\]\t([\w ]+)\t\[([^\]]*)\]\t(.*)$')
 
+FLUSH_EVENTS = ('ERROR', 'SUCCES', 'ENDHARVEST')
+
+READ_BLOCK_SIZE = 64 * 1024
+
 class BasicEventLogger(object):
-    def __init__(self, logfile, maxLogLines=20000):
+    """With a bufferSize (in characters) lines are collected and written
+        together once the buffer is full, flushInterval seconds have passed
+        since the last flush, or an event from FLUSH_EVENTS is logged. While
+        lines are buffered a thread writes them every flushInterval seconds,
+        so they are written even when no new lines are logged.
+        Listeners are told about every logged line with logLine(date, event,
+        comments) and are saved on close."""
+    def __init__(self, logfile, maxLogLines=20000, bufferSize=0, flushInterval=1.0, listeners=None, _now=None):
         self._numberOfLogLines = 0
         self._maxLogLines = maxLogLines
+        self._bufferSize = bufferSize
+        self._flushInterval = flushInterval
+        self._listeners = listeners or []
+        self._now = _now or time
+        self._buffer = []
+        self._bufferedSize = 0
+        self._lastFlush = self._now()
+        self._lock = RLock()
+        self._flusher = None
         self._logfilePath = logfile
         self._logfile = self._openlogfile(self._logfilePath)
 
     def close(self):
-        if self._logfile:
-            self._logfile.close()
-            self._logfile = None
+        with self._lock:
+            if self._logfile:
+                self.flush()
+                self._logfile.close()
+                self._logfile = None
+                for listener in self._listeners:
+                    listener.save()
 
     def logLine(self, event, comments, id=''):
-        self._time()
-        self._space()
-        self._event(event)
-        self._space()
-        self._id(id)
-        self._space()
-        self._comments(comments)
-        self._flush()
-        self._clearExcessLogLines()
-
-    def _time(self):
-        now = datetime.utcnow()
-        ms = ('%03i'%now.microsecond)[:3]
-        self._logfile.write('[' + now.strftime('%Y-%m-%d %H:%M:%S.') + ms + ']')
-
-    def _id(self, id):
-        self._logfile.write('[')
-        self._writeStripped(id)
-        self._logfile.write(']')
-
-    def _event(self,event):
-        self._writeStripped(event)
-
-    def _comments(self, comments):
-        self._writeStripped(comments)
-        self._logfile.write('\n')
-
-    def _space(self):
-        self._logfile.write('\t')
-
-    def _writeStripped(self, aString):
-        self._logfile.write(' '.join(str(aString).split()))
+        date = _formatDate(datetime.utcnow())
+        event, comments = _stripped(event), _stripped(comments)
+        line = '[%s]\t%s\t[%s]\t%s\n' % (date, event, _stripped(id), comments)
+        with self._lock:
+            if self._bufferSize > 0:
+                self._buffer.append(line)
+                self._bufferedSize += len(line)
+                if self._bufferedSize >= self._bufferSize or event in FLUSH_EVENTS or self._now() - self._lastFlush >= self._flushInterval:
+                    self.flush()
+                elif self._flusher is None:
+                    self._flusher = Thread(target=self._flushBuffered, daemon=True)
+                    self._flusher.start()
+            else:
+                self._logfile.write(line)
+                self._flush()
+            for listener in self._listeners:
+                listener.logLine(date, event, comments)
+            self._clearExcessLogLines()
+
+    def flush(self, sync=False):
+        with self._lock:
+            if self._buffer:
+                self._logfile.write(''.join(self._buffer))
+                self._buffer = []
+                self._bufferedSize = 0
+            self._lastFlush = self._now()
+            self._flush()
+            if sync:
+                fsync(self._logfile.fileno())
+
+    def _flushBuffered(self):
+        while True:
+            sleep(self._flushInterval)
+            with self._lock:
+                if not self._buffer or not self._logfile:
+                    self._flusher = None
+                    return
+                self.flush()
 
     def _flush(self):
         self._logfile.flush()
@@ -94,29 +127,39 @@ class BasicEventLogger(object):
     def getEventLogger(self):
         return self
 
+def _formatDate(now):
+    return '%s%s' % (now.strftime('%Y-%m-%d %H:%M:%S.'), ('%03i' % now.microsecond)[:3])
+
+def _stripped(aString):
+    return ' '.join(str(aString).split())
+
 class EventLogger(BasicEventLogger):
-    def __init__(self, logfile, maxLogLines=20000):
-        super(EventLogger, self).__init__(logfile, maxLogLines=maxLogLines)
+    """Logs to logfile, the active segment. Once it holds maxLogLines / 2
+        lines it is renamed to a numbered segment and a new active segment
+        is started; older segments are removed as long as the remaining
+        ones still hold maxLogLines / 2 lines. Line counts are kept in a small
+        index file, so opening the logger does not read the log."""
+    _segments = None
+
+    def __init__(self, logfile, maxLogLines=20000, **kwargs):
+        super(EventLogger, self).__init__(logfile, maxLogLines=maxLogLines, **kwargs)
+
+    def close(self):
+        logfile = self._logfile
+        BasicEventLogger.close(self)
+        if logfile and self._segments is not None:
+            self._segments.save(self._numberOfLogLines)
 
     def _openlogfile(self, logfile):
-        self._numberOfLogLines = 0
         isdir(dirname(logfile)) or makedirs(dirname(logfile))
-        f = open(logfile, 'a+')
-        f.seek(0)
-        for line in f:
-            self._numberOfLogLines += 1
-        return f
+        self._segments = EventSegments(logfile)
+        self._numberOfLogLines = self._segments.activeLineCount()
+        return open(logfile, 'a')
 
     def _clearExcessLogLines(self):
-        if self._numberOfLogLines >= self._maxLogLines:
-            self._logfile.seek(0)
-            tmpFile = open(self._logfilePath + ".tmp", 'w')
-            for i, line in enumerate(self._logfile):
-                if i >= self._maxLogLines // 2:
-                    tmpFile.write(line)
-            tmpFile.close()
+        if self._numberOfLogLines >= self._maxLogLines // 2:
             self.close()
-            rename(self._logfilePath + ".tmp", self._logfilePath)
+            self._segments.rotate(self._numberOfLogLines, keepLines=self._maxLogLines // 2)
             self._logfile = self._openlogfile(self._logfilePath)
 
     def logLine(self, *args, **kwargs):
@@ -166,6 +209,10 @@ class CompositeLogger(EventLogger):
             if events == ['*'] or event in events:
                 logger.logLine(event, comments, id)
 
+    def flush(self, sync=False):
+        for events, logger in self._loggers:
+            logger.flush(sync=sync)
+
 class NilEventLogger(EventLogger):
         def __init__(self):
             EventLogger.__init__(self, None)
@@ -179,5 +226,87 @@ class NilEventLogger(EventLogger):
         def logLine(self, event, comments, id=''):
             pass
 
+        def flush(self, sync=False):
+            pass
+
         def close(self):
             pass
+
+
+class EventSegments(object):
+    """Numbered segments logfile.1, logfile.2, ... (oldest first) of an
+        events log with logfile itself as the active segment, and their
+        line counts in logfile.index."""
+    def __init__(self, logfile):
+        self._logfile = logfile
+        self._indexfile = logfile + '.index'
+        index = JsonDict.load(self._indexfile) if isfile(self._indexfile) else {}
+        self._segments = [tuple(segment) for segment in index.get('segments', [])]
+        self._lines = index.get('lines', 0)
+        self._size = index.get('size', 0)
+
+    def filenames(self):
+        return ['%s.%s' % (self._logfile, sequence) for sequence, lines in self._segments] + [self._logfile]
+
+    def activeLineCount(self):
+        size = getsize(self._logfile) if isfile(self._logfile) else 0
+        if size == self._size:
+            return self._lines
+        offset, lines = (self._size, self._lines) if size > self._size else (0, 0)
+        with open(self._logfile, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                lines += 1
+        return lines
+
+    def rotate(self, lines, keepLines):
+        sequence = self._segments[-1][0] + 1 if self._segments else 1
+        rename(self._logfile, '%s.%s' % (self._logfile, sequence))
+        self._segments.append((sequence, lines))
+        while sum(segmentLines for _, segmentLines in self._segments[1:]) >= keepLines:
+            oldest, _ = self._segments.pop(0)
+            if isfile('%s.%s' % (self._logfile, oldest)):
+                remove('%s.%s' % (self._logfile, oldest))
+        self.save(0)
+
+    def save(self, lines):
+        self._lines = lines
+        self._size = getsize(self._logfile) if isfile(self._logfile) else 0
+        with open(self._indexfile + '.tmp', 'w') as f:
+            JsonDict(segments=self._segments, lines=self._lines, size=self._size).dump(f)
+        rename(self._indexfile + '.tmp', self._indexfile)
+
+
+def eventsFilenames(logfile):
+    """Existing segment files of an events log, oldest first."""
+    return [filename for filename in EventSegments(logfile).filenames() if isfile(filename)]
+
+def readEventLines(logfile):
+    for filename in eventsFilenames(logfile):
+        with open(filename) as fp:
+            for line in fp:
+                yield line
+
+def readEventLinesReversed(logfile, blockSize=READ_BLOCK_SIZE):
+    """Lines of an events log, newest first and without line ends. Files
+        are read backwards in blocks of blockSize bytes, so a reader that
+        stops early never reads more than it needs."""
+    for filename in reversed(eventsFilenames(logfile)):
+        for line in _readLinesReversed(filename, blockSize):
+            yield line
+
+def _readLinesReversed(filename, blockSize):
+    with open(filename, 'rb') as fp:
+        position = fp.seek(0, SEEK_END)
+        remainder = b''
+        while position > 0:
+            size = min(blockSize, position)
+            position -= size
+            fp.seek(position)
+            lines = (fp.read(size) + remainder).split(b'\n')
+            remainder = lines.pop(0)
+            for line in reversed(lines):
+                if line:
+                    yield line.decode()
+        if remainder:
+            yield remainder.decode()
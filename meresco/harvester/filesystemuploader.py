@@ -39,86 +39,272 @@
 #
 from .virtualuploader import VirtualUploader, UploaderException
 import os
-from xml.sax.saxutils import escape as xmlEscape
-from io import StringIO
-from lxml.etree import parse, tostring, XML, XMLParser
+from copy import deepcopy
+from hashlib import md5, sha1
+from threading import Lock
+from lxml.etree import Element, SubElement, tostring
 from time import gmtime, strftime, time
-from escaping import escapeFilename
+from escaping import escapeFilename, unescapeFilename
 from meresco.components import lxmltostring
 
-OAI_ENVELOPE = """<?xml version="1.0"?>
-<OAI-PMH
-    xmlns="http://www.openarchives.org/OAI/2.0/"
-    xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
-    xsi:schemaLocation="http://www.openarchives.org/OAI/2.0/ http://www.openarchives.org/OAI/2.0/OAI-PMH.xsd"
->
-    <responseDate>%(responseDate)s</responseDate>
-    <request
-        verb="GetRecord"
-        metadataPrefix="%(metadataPrefix)s"
-        identifier="%(identifier)s"
-    >%(baseurl)s</request>
-    <GetRecord>%(recordData)s</GetRecord>
-</OAI-PMH>"""
+OAI_NS = "http://www.openarchives.org/OAI/2.0/"
+XSI_NS = "http://www.w3.org/2001/XMLSchema-instance"
+OAI_SCHEMALOCATION = "http://www.openarchives.org/OAI/2.0/ http://www.openarchives.org/OAI/2.0/OAI-PMH.xsd"
+
+RECORD_SUFFIX = '.record'
+MANIFEST = 'records.manifest'
+DELETED_RECORDS = 'deleted_records'
+DEFAULT_SHARD_WIDTH = 2
+MANIFEST_COMPACT_AFTER = 10000
+
+def shardDirectories(filename, levels, width=DEFAULT_SHARD_WIDTH):
+    """Directories below the repository directory for a record file: levels
+        of width hex characters of the md5 of the filename, giving a fan-out
+        of 16**width per level."""
+    if not levels:
+        return []
+    digest = md5(filename.encode('utf-8', 'surrogateescape')).hexdigest()
+    return [digest[i * width:(i + 1) * width] for i in range(levels)]
+
+def readManifest(filename):
+    """Reads a manifest into a dict of relative record filename to checksum.
+        Later lines win; a checksum of '-' marks a deleted record."""
+    result = {}
+    if not os.path.isfile(filename):
+        return result
+    with open(filename) as f:
+        for line in f:
+            checksum, _, relativeName = line.rstrip('\n').partition('\t')
+            relativeName = unescapeFilename(relativeName)
+            if checksum == '-':
+                result.pop(relativeName, None)
+            else:
+                result[relativeName] = checksum
+    return result
+
+def writeManifest(filename, entries):
+    with open(filename + '.tmp', 'w') as f:
+        for relativeName, checksum in sorted(entries.items()):
+            f.write(_manifestLine(checksum, relativeName))
+    os.rename(filename + '.tmp', filename)
+
+def migrateRepositoryDirectory(directory, levels, width=DEFAULT_SHARD_WIDTH, manifest=False):
+    """Moves the record files of a repository directory into the layout for
+        levels and width, flat or sharded, and removes directories left
+        empty. An existing manifest, or with manifest a new one, is rewritten
+        from the files on disk. Returns the number of records moved."""
+    moved = 0
+    filenames = []
+    for dirpath, dirnames, names in os.walk(directory, topdown=False):
+        for name in names:
+            if not name.endswith(RECORD_SUFFIX):
+                continue
+            newDirectory = os.path.join(directory, *shardDirectories(name, levels, width))
+            newFilename = os.path.join(newDirectory, name)
+            oldFilename = os.path.join(dirpath, name)
+            if newFilename != oldFilename:
+                os.makedirs(newDirectory, exist_ok=True)
+                os.rename(oldFilename, newFilename)
+                moved += 1
+            filenames.append(newFilename)
+        if dirpath != directory and not os.listdir(dirpath):
+            os.rmdir(dirpath)
+    manifestFilename = os.path.join(directory, MANIFEST)
+    if manifest or os.path.isfile(manifestFilename):
+        entries = {}
+        for filename in filenames:
+            with open(filename, 'rb') as f:
+                entries[os.path.relpath(filename, directory)] = sha1(f.read()).hexdigest()
+        writeManifest(manifestFilename, entries)
+    return moved
+
+def _manifestLine(checksum, relativeName):
+    return '%s\t%s\n' % (checksum, escapeFilename(relativeName))
 
 class FileSystemUploader(VirtualUploader):
+    """Writes every record to a file. Directories known to exist are
+        remembered for the run. With a batchSize records are written per
+        batch and when uploads are flushed; with fsync the written files and
+        their directories are synced to disk when uploads are flushed,
+        which the harvester does at the end of every page.
 
-    def __init__(self, aTarget, aLogger, aCollection):
+        With shardLevels records are spread over hashed subdirectories of
+        the repository directory and deleted ids are kept per repository.
+        With manifest every written or deleted record is appended to a
+        manifest in the repository directory, with its checksum. A manifest
+        is compacted after compactAfter appended lines."""
+    def __init__(self, aTarget, aLogger, aCollection, compactAfter=MANIFEST_COMPACT_AFTER, _fsync=os.fsync):
         VirtualUploader.__init__(self, aLogger)
         self._target = aTarget
-        if not os.path.isdir(self._target.path):
-            os.makedirs(self._target.path)
+        self._batchSize = int(aTarget.batchSize or 1)
+        self._sync = bool(aTarget.fsync)
+        self._shardLevels = int(aTarget.shardLevels or 0)
+        self._shardWidth = int(aTarget.shardWidth or DEFAULT_SHARD_WIDTH)
+        self._manifest = bool(aTarget.manifest)
+        self._compactAfter = compactAfter
+        self._appendedLines = {}
+        self._fsync = _fsync
+        self._directories = set()
+        self._pending = []
+        self._written = set()
+        self._lock = Lock()
+        self._ensureDirectory(self._target.path)
 
     def tznow(self):
         return strftime("%Y-%m-%dT%H:%M:%SZ", gmtime())
 
+    def stop(self):
+        self.flushUploads()
+
     def send(self, anUpload):
         """
         Writes the original header and metadata to a file.
         """
         try:
             filename = self._filenameFor(anUpload)
-            dirname = os.path.dirname(filename)
-            if not os.path.isdir(dirname):
-                os.makedirs(os.path.dirname(filename))
-            with open(filename, "wb") as f:
-                f.write(tostring(self._createOutput(anUpload), xml_declaration=True))
+            repositoryDirectory = self._repositoryDirectory(anUpload) if self._manifest else None
+            data = tostring(self._createOutput(anUpload), xml_declaration=True)
         except Exception as e:
             raise UploaderException(uploadId=anUpload.id, message=str(e))
+        with self._lock:
+            self._pending.append((anUpload.id, repositoryDirectory, filename, data))
+            full = len(self._pending) >= self._batchSize
+        if full:
+            self._writePending()
+
+    def flushUploads(self):
+        self._writePending()
+        if self._sync:
+            self._syncWritten()
+        return []
+
+    def _writePending(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        manifestLines = {}
+        for uploadId, repositoryDirectory, filename, data in pending:
+            try:
+                self._ensureDirectory(os.path.dirname(filename))
+                with open(filename, "wb") as f:
+                    f.write(data)
+            except Exception as e:
+                raise UploaderException(uploadId=uploadId, message=str(e))
+            self._wrote(filename)
+            if self._manifest:
+                manifestLines.setdefault(repositoryDirectory, []).append(
+                    _manifestLine(sha1(data).hexdigest(), os.path.relpath(filename, repositoryDirectory)))
+        self._appendManifests(manifestLines)
+
+    def _appendManifests(self, manifestLines):
+        for repositoryDirectory, lines in manifestLines.items():
+            manifestFilename = os.path.join(repositoryDirectory, MANIFEST)
+            with self._lock:
+                with open(manifestFilename, 'a') as f:
+                    f.write(''.join(lines))
+                appended = self._appendedLines.get(manifestFilename, 0) + len(lines)
+                if appended >= self._compactAfter:
+                    writeManifest(manifestFilename, readManifest(manifestFilename))
+                    appended = 0
+                self._appendedLines[manifestFilename] = appended
+            self._wrote(manifestFilename)
+
+    def _wrote(self, filename):
+        if self._sync:
+            with self._lock:
+                self._written.add(filename)
+
+    def _syncWritten(self):
+        with self._lock:
+            written, self._written = self._written, set()
+        for filename in sorted(written):
+            if os.path.isfile(filename):
+                fd = os.open(filename, os.O_RDONLY)
+                try:
+                    self._fsync(fd)
+                finally:
+                    os.close(fd)
+        for dirname in sorted(set(os.path.dirname(filename) for filename in written)):
+            fd = os.open(dirname, os.O_RDONLY)
+            try:
+                self._fsync(fd)
+            finally:
+                os.close(fd)
+
+    def _ensureDirectory(self, dirname):
+        if dirname in self._directories:
+            return
+        os.makedirs(dirname, exist_ok=True)
+        self._directories.add(dirname)
 
     def _createOutput(self, anUpload):
         if not self._target.oaiEnvelope:
             return anUpload.record
-        envelopedata = {
-            'identifier': xmlEscape(anUpload.recordIdentifier),
-            'metadataPrefix': xmlEscape(str(anUpload.repository.metadataPrefix)),
-            'baseurl': xmlEscape(str(anUpload.repository.baseurl)),
-            'responseDate': self.tznow(),
-            'recordData': lxmltostring(anUpload.record)
-        }
-        return parse(StringIO(OAI_ENVELOPE % envelopedata), XMLParser(ns_clean=True)).getroot()
+        envelope = Element('{%s}OAI-PMH' % OAI_NS, nsmap={None: OAI_NS, 'xsi': XSI_NS})
+        envelope.set('{%s}schemaLocation' % XSI_NS, OAI_SCHEMALOCATION)
+        SubElement(envelope, '{%s}responseDate' % OAI_NS).text = self.tznow()
+        request = SubElement(envelope, '{%s}request' % OAI_NS,
+            verb='GetRecord',
+            metadataPrefix=str(anUpload.repository.metadataPrefix),
+            identifier=anUpload.recordIdentifier)
+        request.text = str(anUpload.repository.baseurl)
+        record = deepcopy(anUpload.record)
+        record.tail = None
+        SubElement(envelope, '{%s}GetRecord' % OAI_NS).append(record)
+        return envelope
 
     def _properFilename(self, anId):
         if anId in ['.', '..'] or chr(0) in anId or len(anId) > 255 or \
             len(anId) == 0:
             anId = "_malformed_id." + str(time())
-        return str(anId).replace(os.path.sep, '_SLASH_') + ".record"
+        return str(anId).replace(os.path.sep, '_SLASH_') + RECORD_SUFFIX
+
+    def _repositoryDirectory(self, anUpload):
+        return os.path.join(self._target.path, anUpload.repository.repositoryGroupId, anUpload.repository.id)
 
     def _filenameFor(self, anUpload):
         filename = self._properFilename(anUpload.id)
-        return os.path.join(self._target.path, anUpload.repository.repositoryGroupId, anUpload.repository.id, filename)
+        return os.path.join(self._repositoryDirectory(anUpload), *(shardDirectories(filename, self._shardLevels, self._shardWidth) + [filename]))
 
     def delete(self, anUpload):
-        filename = self._filenameFor(anUpload)
-        if not self._target.oaiEnvelope:
+        self.deleteMany([anUpload])
+
+    def deleteMany(self, uploads):
+        self._writePending()
+        manifestLines = {}
+        if self._target.oaiEnvelope:
+            for anUpload in uploads:
+                filename = self._filenameFor(anUpload)
+                data = lxmltostring(self._createOutput(anUpload)).encode()
+                self._ensureDirectory(os.path.dirname(filename))
+                with open(filename, 'wb') as fd:
+                    fd.write(data)
+                self._wrote(filename)
+                self._addManifestLine(manifestLines, anUpload, filename, sha1(data).hexdigest())
+                self._logDelete(anUpload.id)
+            self._appendManifests(manifestLines)
+            return
+        deletedIds = {}
+        for anUpload in uploads:
+            filename = self._filenameFor(anUpload)
             os.path.isfile(filename) and os.remove(filename)
-            with open(os.path.join(self._target.path, 'deleted_records'),'a') as f:
-                f.write('%s\n' % escapeFilename(anUpload.id))
-        else:
-            xmlResult = self._createOutput(anUpload)
-            with open(filename, 'w') as fd:
-                fd.write(lxmltostring(xmlResult))
-        self._logDelete(anUpload.id)
+            self._addManifestLine(manifestLines, anUpload, filename, '-')
+            directory = self._repositoryDirectory(anUpload) if self._shardLevels else self._target.path
+            deletedIds.setdefault(directory, []).append(anUpload.id)
+        for directory, ids in deletedIds.items():
+            deletedRecords = os.path.join(directory, DELETED_RECORDS)
+            self._ensureDirectory(directory)
+            with open(deletedRecords, 'a') as f:
+                f.write(''.join('%s\n' % escapeFilename(anId) for anId in ids))
+            self._wrote(deletedRecords)
+        self._appendManifests(manifestLines)
+        for anUpload in uploads:
+            self._logDelete(anUpload.id)
+
+    def _addManifestLine(self, manifestLines, anUpload, filename, checksum):
+        if self._manifest:
+            repositoryDirectory = self._repositoryDirectory(anUpload)
+            manifestLines.setdefault(repositoryDirectory, []).append(
+                _manifestLine(checksum, os.path.relpath(filename, repositoryDirectory)))
 
     def info(self):
         return 'Writing records to path:%s' % (self._target.path)
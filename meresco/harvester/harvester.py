@@ -36,6 +36,9 @@
 ## end license ##
 
 import sys
+from queue import Queue, Full
+from threading import Thread, Event
+from time import time
 from meresco.core import Observable
 
 from .virtualuploader import InvalidDataException, TooMuchInvalidDataException
@@ -46,10 +49,12 @@ NOTHING_TO_DO = 'Nothing to do!'
 HARVESTED = 'Harvested.'
 
 class Harvester(Observable):
-    def __init__(self, repository):
+    def __init__(self, repository, prefetchDepth=0, maxPages=1, maxTime=30*60):
         Observable.__init__(self)
         self._repository = repository
-        self._MAXTIME= 30*60 # 30 minutes
+        self._prefetchDepth = prefetchDepth
+        self._maxPages = maxPages
+        self._maxTime = maxTime
 
     def getRecord(self, id):
         return self.call.getRecord(metadataPrefix=self._repository.metadataPrefix, identifier=id)
@@ -69,13 +74,6 @@ class Harvester(Observable):
                 kwargs['set'] = set
         return self.call.listRecords(**kwargs)
 
-    def fetchRecords(self, from_, token):
-        response = self.listRecords(from_, token, self._repository.set)
-        for record in response.records:
-            response.selectRecord(record)
-            self.upload(response)
-        return response
-
     def upload(self, oaiResponse):
         upload = self.call.createUpload(self._repository, oaiResponse)
         self.do.notifyHarvestedRecord(upload.id)
@@ -87,11 +85,19 @@ class Harvester(Observable):
                 self.do.send(upload)
                 self.do.uploadIdentifier(upload.id)
             except InvalidDataException as e:
-                self.do.logInvalidData(upload.id, e.originalMessage)
-                maxIgnore = self._repository.maxIgnore()
-                if self.call.totalInvalidIds() > maxIgnore:
-                    raise TooMuchInvalidDataException(upload.id, maxIgnore)
-                self.do.logIgnoredIdentifierWarning(upload.id)
+                self._ignoreInvalidData(e)
+
+    def _flushUploads(self):
+        for e in self.call.flushUploads():
+            self.do.rejectIdentifier(e.uploadId)
+            self._ignoreInvalidData(e)
+
+    def _ignoreInvalidData(self, e):
+        self.do.logInvalidData(e.uploadId, e.originalMessage)
+        maxIgnore = self._repository.maxIgnore()
+        if self.call.totalInvalidIds() > maxIgnore:
+            raise TooMuchInvalidDataException(e.uploadId, maxIgnore)
+        self.do.logIgnoredIdentifierWarning(e.uploadId)
 
     def _harvestLoop(self):
         try:
@@ -100,14 +106,52 @@ class Harvester(Observable):
             from_ = state.from_
             if from_ and not self._repository.continuous:
                 from_ = from_.split('T')[0]
-            response = self.fetchRecords(from_, state.token)
-            self.do.endRepository(response.resumptionToken, response.responseDate)
-            return response.resumptionToken
+            return self._harvestPages(from_, state.token)
         except:
             exType, exValue, exTb = sys.exc_info()
             self.do.endWithException(exType, exValue, exTb)
             raise
 
+    def _harvestPages(self, from_, token):
+        deadline = time() + self._maxTime
+        prefetcher = self._prefetcher(from_, token)
+        pages = iter(prefetcher) if prefetcher else None
+        try:
+            pageNumber = 0
+            while True:
+                pageNumber += 1
+                if pages:
+                    response, requestInfo = next(pages)
+                else:
+                    response, requestInfo = self.listRecords(from_, token, self._repository.set), None
+                for record in response.records:
+                    response.selectRecord(record)
+                    self.upload(response)
+                if requestInfo is None:
+                    requestInfo = self._requestInfo()
+                self._flushUploads()
+                self.do.endRepository(response.resumptionToken, response.responseDate)
+                self._logRequestInfo(requestInfo)
+                token = response.resumptionToken.strip()
+                if not token or pageNumber == self._maxPages or time() > deadline:
+                    return token
+                self.do.startRepository()
+        finally:
+            if prefetcher:
+                prefetcher.close()
+
+    def _prefetcher(self, from_, token):
+        """Prefetched pages are read completely before they are queued, so
+            their resumptionToken and request info are known up front; a
+            streamed page only knows its token after its records are read."""
+        if self._prefetchDepth <= 0:
+            return None
+        return PagePrefetcher(lambda token: self._fetchPage(from_, token), token, depth=self._prefetchDepth, maxPages=self._maxPages)
+
+    def _fetchPage(self, from_, token):
+        response = self.listRecords(from_, token, self._repository.set)
+        return (response, self._requestInfo()), response.resumptionToken.strip()
+
     def _harvest(self):
         try:
             self.do.logLine('STARTHARVEST', '',id=self._repository.id)
@@ -119,8 +163,17 @@ class Harvester(Observable):
             finally:
                 self.do.stop()
         finally:
+            self.do.logInfo(self.call.mappingInfo(), id=self._repository.id)
             self.do.logLine('ENDHARVEST','',id=self._repository.id)
 
+    def _requestInfo(self):
+        return [self.call.hostWaitInfo(), self.call.connectionInfo(), self.call.transferInfo()]
+
+    def _logRequestInfo(self, requestInfo):
+        for info in requestInfo:
+            if info:
+                self.do.logInfo(info, id=self._repository.id)
+
     def harvest(self):
         try:
             if self.call.hasWork(continuousInterval=self._repository.continuous):
@@ -131,3 +184,49 @@ class Harvester(Observable):
                 return NOTHING_TO_DO, False
         finally:
             self.do.close()
+
+
+class PagePrefetcher(object):
+    """Fetches pages in a background thread, at most depth pages ahead of
+        the consumer. fetch(token) returns the page and the token for the
+        next one; fetching stops when there is no next token or maxPages
+        (0 for no limit) pages are fetched."""
+    def __init__(self, fetch, token, depth, maxPages=0):
+        self._fetch = fetch
+        self._maxPages = maxPages
+        self._queue = Queue(maxsize=depth)
+        self._stopped = Event()
+        self._thread = Thread(target=self._run, args=(token,), daemon=True)
+        self._thread.start()
+
+    def __iter__(self):
+        while True:
+            page, hasNext, exception = self._queue.get()
+            if exception is not None:
+                raise exception
+            yield page
+            if not hasNext:
+                return
+
+    def close(self):
+        self._stopped.set()
+
+    def _run(self, token):
+        try:
+            pageCount = 0
+            while not self._stopped.is_set():
+                page, token = self._fetch(token)
+                pageCount += 1
+                self._put((page, bool(token), None))
+                if not token or pageCount == self._maxPages:
+                    return
+        except Exception as e:
+            self._put((None, False, e))
+
+    def _put(self, item):
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except Full:
+                pass
@@ -50,6 +50,7 @@ class HarvesterData(object):
             raise TypeError('Missing dataPath or datastore')
         self._store = OldDataStore(dataPath, id_fn=id_fn) if datastore is None else datastore
         self.id_fn = id_fn
+        self._repositoryGroupIdIndex = {}
 
     #domain
     def getDomainIds(self):
@@ -74,7 +75,7 @@ class HarvesterData(object):
 
     #repositorygroup
     def getRepositoryGroupIds(self, domainId):
-        return self.getDomain(domainId).get('repositoryGroupIds', [])
+        return list(self._store.getCachedData(domainId, 'domain').get('repositoryGroupIds', []))
 
     def getRepositoryGroup(self, identifier, domainId, guid=None):
         return self._store.getData(id_combine(domainId, identifier), 'repositoryGroup', guid)
@@ -110,12 +111,26 @@ class HarvesterData(object):
         result = JsonList()
         allIds = self.getRepositoryGroupIds(domainId) if repositoryGroupId is None else [repositoryGroupId]
         for repositoryGroupId in allIds:
-            jsonData = self.getRepositoryGroup(repositoryGroupId, domainId)
+            jsonData = self._store.getCachedData(id_combine(domainId, repositoryGroupId), 'repositoryGroup')
             result.extend(jsonData.get('repositoryIds', []))
         return result
 
     def getRepositoryGroupId(self, domainId, repositoryId):
-        return self.getRepository(repositoryId, domainId)['repositoryGroupId']
+        groupId = self._repositoryGroupIds(domainId).get(repositoryId)
+        if groupId is None:
+            return self._store.getCachedData(id_combine(domainId, repositoryId), 'repository')['repositoryGroupId']
+        return groupId
+
+    def _repositoryGroupIds(self, domainId):
+        """repositoryId -> repositoryGroupId for a domain, rebuilt when the
+            cached domain or one of its groups was reloaded."""
+        domain = self._store.getCachedData(domainId, 'domain')
+        groups = [self._store.getCachedData(id_combine(domainId, groupId), 'repositoryGroup') for groupId in domain.get('repositoryGroupIds', [])]
+        sources, index = self._repositoryGroupIdIndex.get(domainId, ([], {}))
+        if len(sources) != len(groups) + 1 or any(a is not b for a, b in zip(sources, [domain] + groups)):
+            index = dict((repositoryId, group['identifier']) for group in groups for repositoryId in group.get('repositoryIds', []))
+            self._repositoryGroupIdIndex[domainId] = ([domain] + groups, index)
+        return index
 
     def getRepositories(self, domainId, repositoryGroupId=None):
         try:
@@ -193,7 +208,7 @@ class HarvesterData(object):
         self._store.addData(domainId, 'domain', domain)
         return identifier
 
-    def updateTarget(self, identifier, name, username, port, targetType, delegateIds, path, baseurl, bucket, accessKey, secretKey, oaiEnvelope):
+    def updateTarget(self, identifier, name, username, port, targetType, delegateIds, path, baseurl, bucket, accessKey, secretKey, oaiEnvelope, batchSize=1, concurrency=1, fsync=False, shardLevels=0, shardWidth=2, manifest=False):
         target = self.getTarget(identifier)
         target['name'] = name
         target['username'] = username
@@ -206,6 +221,12 @@ class HarvesterData(object):
         target['path'] = path
         target['baseurl'] = baseurl
         target['oaiEnvelope'] = oaiEnvelope
+        target['batchSize'] = batchSize
+        target['concurrency'] = concurrency
+        target['fsync'] = fsync
+        target['shardLevels'] = shardLevels
+        target['shardWidth'] = shardWidth
+        target['manifest'] = manifest
         self._store.addData(identifier, 'target', target)
 
     def deleteTarget(self, identifier, domainId):
@@ -281,6 +302,30 @@ upload.parts['meta'] = """<meta xmlns="http://meresco.org/namespace/harvester/me
         self._store.deleteData(identifier, 'mapping')
         self._store.addData(domainId, 'domain', domain)
 
+    #snapshot
+    def getDomainSnapshot(self, domainId):
+        "A domain with all its repository groups, repositories, targets and mappings"
+        domain = self.getDomain(domainId)
+        repositoryGroups = self.getRepositoryGroups(domainId)
+        return JsonDict(
+                domain=domain,
+                repositoryGroups=dict((group['identifier'], group) for group in repositoryGroups),
+                repositories=dict((repository['identifier'], repository) for repository in self._readableRepositories(domainId)),
+                targets=dict((targetId, self.getTarget(targetId)) for targetId in domain.get('targetIds', []) if self._store.exists(targetId, 'target')),
+                mappings=dict((mappingId, self.getMapping(mappingId)) for mappingId in domain.get('mappingIds', []) if self._store.exists(mappingId, 'mapping')),
+            )
+
+    def getDataVersion(self):
+        "Changes whenever the data changes; cheaper than reading the data"
+        return self._store.version()
+
+    def _readableRepositories(self, domainId):
+        for repositoryId in self.getRepositoryIds(domainId):
+            try:
+                yield self.getRepository(repositoryId, domainId)
+            except ValueError:
+                pass
+
     def getPublicRecord(self, guid):
         "Retrieves a record given its uuid only"
         return self._store.getGuid(guid)
@@ -193,6 +193,12 @@ class HarvesterDataActions(PostActions):
                 accessKey=arguments.get('accessKey', [''])[0],
                 secretKey=arguments.get('secretKey', [''])[0],
                 oaiEnvelope='oaiEnvelope' in arguments,
+                batchSize=int(arguments.get('batchSize', [''])[0] or '1'),
+                concurrency=int(arguments.get('concurrency', [''])[0] or '1'),
+                fsync='fsync' in arguments,
+                shardLevels=int(arguments.get('shardLevels', [''])[0] or '0'),
+                shardWidth=int(arguments.get('shardWidth', [''])[0] or '2'),
+                manifest='manifest' in arguments,
                 delegateIds=arguments.get('delegate',[]),
             )
 
@@ -30,9 +30,11 @@
 #
 ## end license ##
 
+from hashlib import sha1
+
 from weightless.core import NoneOfTheObserversRespond
 from meresco.core import Observable
-from meresco.components.http.utils import okJson
+from meresco.components.http.utils import okJson, CRLF, ContentTypeHeader, ContentTypeJson
 from meresco.components.json import JsonDict
 
 
@@ -53,8 +55,26 @@ class HarvesterDataRetrieve(Observable):
                 return
         yield self.handleGet(path=path, **kwargs)
 
-    def handleGet(self, arguments, **kwargs):
+    def handleGet(self, arguments, Headers=None, **kwargs):
+        verb = arguments.get('verb', [None])[0]
+        if verb in VERSIONED_VERBS:
+            yield self._handleVersionedGet(arguments, Headers or {})
+            return
         yield okJson
+        yield self._response(arguments).dumps()
+
+    def _handleVersionedGet(self, arguments, headers):
+        version = self.call.getDataVersion()
+        etag = '"%s"' % sha1(repr((version, sorted(arguments.items()))).encode()).hexdigest()
+        ifNoneMatch = dict((key.lower(), value) for key, value in headers.items()).get('if-none-match')
+        if ifNoneMatch == etag:
+            yield 'HTTP/1.0 304 Not Modified' + CRLF + 'ETag: ' + etag + CRLF * 2
+            return
+        body = self._response(arguments).dumps()
+        yield 'HTTP/1.0 200 OK' + CRLF + ContentTypeHeader + ContentTypeJson + CRLF + 'ETag: ' + etag + CRLF * 2
+        yield body
+
+    def _response(self, arguments):
         verb = arguments.get('verb', [None])[0]
         messageKwargs = dict((k,values[0]) for k,values in list(arguments.items()) if k != 'verb')
         request = dict(**messageKwargs)
@@ -75,8 +95,10 @@ class HarvesterDataRetrieve(Observable):
             response['error'] = error('badVerb')
         except Exception as e:
             response['error'] = error(str(e), repr(e))
-        yield response.dumps()
+        return response
+
 
+VERSIONED_VERBS = ['GetDomainSnapshot']
 
 messages = {
     'badDomain': 'The domain does not exist.',
@@ -38,10 +38,12 @@
 from .eventlogger import EventLogger
 from .ids import Ids
 import traceback
-from os.path import join, isdir, isfile, dirname
-from os import makedirs, remove
+from os.path import join, isdir, isfile
+from os import makedirs, remove, listdir
 from shutil import rmtree
 from .state import State
+from .statusindex import StatusIndex, statusFilename
+from .throughputanalyser import ThroughputRollup, rollupFilename
 from escaping import escapeFilename
 from seecr.zulutime import ZuluTime
 
@@ -55,7 +57,7 @@ def ensureDirectory(directoryPath):
     isdir(directoryPath) or makedirs(directoryPath)
 
 class HarvesterLog(object):
-    def __init__(self, stateDir, logDir, name):
+    def __init__(self, stateDir, logDir, name, logBufferSize=0, logFlushInterval=1.0, logSync=False):
         self._name = name
         self._logDir = logDir
         ensureDirectory(logDir)
@@ -63,7 +65,12 @@ class HarvesterLog(object):
         self._ids = Ids(stateDir, name)
         self._invalidIds = Ids(stateDir, name + "_invalid")
         self._state = State(stateDir, name)
-        self._eventlogger = EventLogger(logDir + '/' + name +'.events')
+        eventsfile = logDir + '/' + name +'.events'
+        self._statusIndex = StatusIndex(statusFilename(stateDir, name), eventsfile, invalidIds=self._invalidIds)
+        self._throughputRollup = ThroughputRollup.open(rollupFilename(logDir, name), eventsfile)
+        self._eventlogger = EventLogger(eventsfile, bufferSize=logBufferSize, flushInterval=logFlushInterval, listeners=[self._statusIndex, self._throughputRollup])
+        self._logSync = logSync
+        self._invalidDataMessageFiles = {}
         self._resetCounts()
 
     def isCurrentDay(self, date):
@@ -93,7 +100,15 @@ class HarvesterLog(object):
         self._state.markDeleted()
         self._eventlogger.logSuccess('Harvested/Uploaded/Deleted/Total: 0/0/0/0, Done: Deleted all ids.', id=self._name)
 
+    def markDeleteProgress(self, done, remaining, rate):
+        self._state.markDeleteProgress(done, remaining, rate)
+
+    def clearDeleteProgress(self):
+        self._state.clearDeleteProgress()
+
     def endRepository(self, token, responseDate):
+        # events logged for this page are on disk before its token is
+        self._eventlogger.flush(sync=self._logSync)
         self._state.markHarvested(self.countsSummary(), token, responseDate)
         self._eventlogger.logSuccess('Harvested/Uploaded/Deleted/Total: %s, ResumptionToken: %s' % (self.countsSummary(), token), id=self._name)
 
@@ -119,10 +134,19 @@ class HarvesterLog(object):
         self._ids.add(uploadid)
         self._uploadedCount += 1
 
+    def rejectIdentifier(self, uploadid):
+        if uploadid in self._ids:
+            self._ids.remove(uploadid)
+            self._uploadedCount -= 1
+
     def deleteIdentifier(self, uploadid):
         self._ids.remove(uploadid)
         self._deletedCount += 1
 
+    def deleteIdentifiers(self, uploadids):
+        self._ids.removeMany(uploadids)
+        self._deletedCount += len(uploadids)
+
     def getIds(self, invalid=False, deleteIds=False):
         if deleteIds:
             return self._ids.getDeleteIds()
@@ -137,10 +161,11 @@ class HarvesterLog(object):
 
     def logInvalidData(self, uploadid, message):
         self._invalidIds.add(uploadid)
-        filePath = self._invalidDataMessageFilePath(uploadid)
-        ensureDirectory(dirname(filePath))
-        with open(filePath, 'w') as fp:
+        directory, filename = self._invalidDataMessageFile(uploadid)
+        ensureDirectory(directory)
+        with open(join(directory, filename), 'w') as fp:
             fp.write(message)
+        self._existingMessageFiles(directory).add(filename)
 
     def logIgnoredIdentifierWarning(self, uploadid):
         self._eventlogger.logWarning('IGNORED', uploadid)
@@ -150,6 +175,8 @@ class HarvesterLog(object):
             if id.startswith("%s:" % repositoryId):
                 self._invalidIds.remove(id)
         rmtree(join(self._logDir, INVALID_DATA_MESSAGES_DIR, repositoryId))
+        self._invalidDataMessageFiles.clear()
+        self._statusIndex.save()
 
     def hasWork(self, continuousInterval=None):
         if self._state.token:
@@ -170,12 +197,23 @@ class HarvesterLog(object):
 
     def _removeFromInvalidData(self, uploadid):
         self._invalidIds.remove(uploadid)
-        invalidDataMessageFilePath = self._invalidDataMessageFilePath(uploadid)
-        if isfile(invalidDataMessageFilePath):
-            remove(invalidDataMessageFilePath)
-
-    def _invalidDataMessageFilePath(self, uploadid):
+        directory, filename = self._invalidDataMessageFile(uploadid)
+        existingFiles = self._existingMessageFiles(directory)
+        if filename in existingFiles:
+            existingFiles.remove(filename)
+            if isfile(join(directory, filename)):
+                remove(join(directory, filename))
+
+    def _existingMessageFiles(self, directory):
+        # read once per run, so records without a message cost no filesystem access
+        existingFiles = self._invalidDataMessageFiles.get(directory)
+        if existingFiles is None:
+            existingFiles = set(listdir(directory)) if isdir(directory) else set()
+            self._invalidDataMessageFiles[directory] = existingFiles
+        return existingFiles
+
+    def _invalidDataMessageFile(self, uploadid):
         repositoryId, recordId = uploadid.split(":", 1)
-        return join(self._logDir, INVALID_DATA_MESSAGES_DIR, escapeFilename(repositoryId), escapeFilename(recordId))
+        return join(self._logDir, INVALID_DATA_MESSAGES_DIR, escapeFilename(repositoryId)), escapeFilename(recordId)
 
 
@@ -0,0 +1,160 @@
+## begin license ##
+#
+# "Meresco Harvester" consists of two subsystems, namely an OAI-harvester and
+# a web-control panel.
+# "Meresco Harvester" is originally called "Sahara" and was developed for
+# SURFnet by:
+# Seek You Too B.V. (CQ2) http://www.cq2.nl
+#
+# Copyright (C) 2026 Seecr (Seek You Too B.V.) https://seecr.nl
+#
+# This file is part of "Meresco Harvester"
+#
+# "Meresco Harvester" is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# "Meresco Harvester" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "Meresco Harvester"; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+## end license ##
+
+
+from os import makedirs, open as osopen, close, O_RDWR, O_CREAT
+from os.path import join
+from fcntl import flock, LOCK_EX, LOCK_NB, LOCK_UN
+from time import time, sleep
+from json import loads, dumps
+
+from escaping import escapeFilename
+
+POLL_INTERVAL = 0.1
+
+
+class HostLimiter(object):
+    """Politeness per OAI-PMH host, shared by all harvester processes that
+        use the same directory: at most maxConcurrent requests to a host at
+        a time, at most rate requests per second with bursts of burst
+        requests (a token bucket), and no requests to a host that asked to
+        retry after some time. 0 means no limit."""
+    def __init__(self, directory, maxConcurrent=0, rate=0, burst=1, _time=time, _sleep=sleep):
+        self._directory = directory
+        self._maxConcurrent = maxConcurrent
+        self._rate = rate
+        self._burst = max(1, burst)
+        self._time = _time
+        self._sleep = _sleep
+        makedirs(directory, exist_ok=True)
+
+    def acquire(self, host):
+        """Waits until a request to host is allowed; the returned slot
+            must be released when the response has been read."""
+        start = self._time()
+        slot = self._acquireSlot(host)
+        try:
+            while True:
+                wait = self._takeToken(host)
+                if wait <= 0:
+                    break
+                self._sleep(wait)
+        except:
+            slot.release()
+            raise
+        slot.waited = self._time() - start
+        return slot
+
+    def retryAfter(self, host, seconds):
+        """Blocks requests to host for seconds, for all processes."""
+        with _Locked(self._bucketFilename(host)) as bucket:
+            values = bucket.read()
+            values['blockedUntil'] = max(values.get('blockedUntil', 0), self._time() + seconds)
+            bucket.write(values)
+
+    def _acquireSlot(self, host):
+        if not self._maxConcurrent:
+            return HostSlot(None)
+        while True:
+            for i in range(self._maxConcurrent):
+                fd = osopen(join(self._directory, '%s.slot.%d' % (escapeFilename(host), i)), O_RDWR | O_CREAT)
+                try:
+                    flock(fd, LOCK_EX | LOCK_NB)
+                except BlockingIOError:
+                    close(fd)
+                    continue
+                return HostSlot(fd)
+            self._sleep(POLL_INTERVAL)
+
+    def _takeToken(self, host):
+        """Takes a token for host; returns 0, or the seconds to wait before
+            asking again."""
+        with _Locked(self._bucketFilename(host)) as bucket:
+            values = bucket.read()
+            now = self._time()
+            blockedUntil = values.get('blockedUntil', 0)
+            if blockedUntil > now:
+                return blockedUntil - now
+            if not self._rate:
+                return 0
+            tokens = min(self._burst, values.get('tokens', self._burst) + (now - values.get('updated', now)) * self._rate)
+            if tokens < 1:
+                return (1 - tokens) / self._rate
+            values.update(tokens=tokens - 1, updated=now)
+            bucket.write(values)
+            return 0
+
+    def _bucketFilename(self, host):
+        return join(self._directory, '%s.bucket' % escapeFilename(host))
+
+
+class HostSlot(object):
+    """A taken slot; released by release, on leaving a with block, or
+        when it is garbage collected."""
+    def __init__(self, fd):
+        self._fd = fd
+        self.waited = 0.0
+
+    def release(self):
+        if self._fd is not None:
+            flock(self._fd, LOCK_UN)
+            close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def __del__(self):
+        self.release()
+
+
+class _Locked(object):
+    def __init__(self, filename):
+        self._filename = filename
+
+    def __enter__(self):
+        self._file = open(self._filename, 'a+')
+        flock(self._file.fileno(), LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._file.close()
+
+    def read(self):
+        self._file.seek(0)
+        data = self._file.read()
+        return loads(data) if data.strip() else {}
+
+    def write(self, values):
+        self._file.seek(0)
+        self._file.truncate()
+        self._file.write(dumps(values))
+        self._file.flush()
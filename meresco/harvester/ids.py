@@ -39,26 +39,104 @@
 import os
 
 from os import makedirs
-from os.path import isdir, join, basename
+from os.path import isdir, isfile, join, basename
+from heapq import merge
+from itertools import groupby
+from tempfile import TemporaryFile
 from escaping import escapeFilename, unescapeFilename
 
 def idfilename(stateDir, name):
     isdir(stateDir) or makedirs(stateDir)
     return join(stateDir, name + '.ids')
 
+TOMBSTONE = '%-'
+COMPACT_MINIMUM = 1000
+SORT_CHUNK_SIZE = 100000
+
 def readIds(filename):
-    uniqueIds = set()
-    ids = []
+    ids, lineCount = _readIds(filename)
+    return list(ids)
+
+def _readIds(filename):
+    """Replays an ids file: every line adds an escaped id, unless it is a
+        tombstone (TOMBSTONE + escaped id), which removes it again. An
+        escaped id never starts with TOMBSTONE. Returns the ids in order of
+        addition and the number of lines read."""
+    ids = {}
+    lineCount = 0
     with open(filename, 'a+') as fp:
         fp.seek(0)
-        for id in (unescapeFilename(id) for id in fp):
-            if id[-1] == '\n':
-                id = id[:-1]
-            if id in uniqueIds:
+        for line in fp:
+            lineCount += 1
+            if line.startswith(TOMBSTONE):
+                ids.pop(_unescapeLine(line[len(TOMBSTONE):]), None)
                 continue
-            ids.append(id)
-            uniqueIds.add(id)
-    return ids
+            ids.setdefault(_unescapeLine(line), None)
+    return ids, lineCount
+
+def _unescapeLine(line):
+    id = unescapeFilename(line)
+    if id[-1:] == '\n':
+        id = id[:-1]
+    return id
+
+def sortedIds(filenames, chunkSize=SORT_CHUNK_SIZE, tempDir=None):
+    """Yields the ids of the ids files sorted and unique, as readIds of each
+        file would give them, holding at most chunkSize lines in memory.
+        Lines are sorted per chunk into temporary files in tempDir, which
+        are merged; the last line of an id in a file decides whether that
+        file has the id. Missing files have no ids."""
+    chunks = []
+    try:
+        chunk = []
+        for line in _numberedLines(filenames):
+            chunk.append(line)
+            if len(chunk) >= chunkSize:
+                chunks.append(_writeChunk(chunk, tempDir))
+                chunk = []
+        chunk.sort()
+        lines = merge(chunk, *[_readChunk(f) for f in chunks])
+        for id, idLines in groupby(lines, key=lambda line: line[0]):
+            present = {}
+            for _, fileIndex, lineNumber, isTombstone in idLines:
+                present[fileIndex] = not isTombstone
+            if any(present.values()):
+                yield id
+    finally:
+        for f in chunks:
+            f.close()
+
+def idsDifference(ids, otherIds):
+    """Yields the ids that are not in otherIds; both sorted and unique."""
+    otherIds = iter(otherIds)
+    other = next(otherIds, None)
+    for id in ids:
+        while other is not None and other < id:
+            other = next(otherIds, None)
+        if other != id:
+            yield id
+
+def _numberedLines(filenames):
+    for fileIndex, filename in enumerate(filenames):
+        if not isfile(filename):
+            continue
+        with open(filename) as fp:
+            for lineNumber, line in enumerate(fp):
+                isTombstone = line.startswith(TOMBSTONE)
+                yield _unescapeLine(line[len(TOMBSTONE):] if isTombstone else line), fileIndex, lineNumber, isTombstone
+
+def _writeChunk(chunk, tempDir):
+    chunk.sort()
+    f = TemporaryFile('w+', dir=tempDir)
+    for id, fileIndex, lineNumber, isTombstone in chunk:
+        f.write('%d %d %d %s\n' % (fileIndex, lineNumber, isTombstone, escapeFilename(id)))
+    f.seek(0)
+    return f
+
+def _readChunk(f):
+    for line in f:
+        fileIndex, lineNumber, isTombstone, id = line.split(' ', 3)
+        yield _unescapeLine(id), int(fileIndex), int(lineNumber), isTombstone == '1'
 
 def writeIds(filename, ids):
     idfilenew = open(filename + '.new', 'w')
@@ -70,36 +148,51 @@ def writeIds(filename, ids):
     os.rename(filename + '.new', filename)
 
 class Ids(object):
+    """Ids in order of addition, kept in a dict for constant time add and
+        remove. On disk it is an append-only log; removals are written as
+        tombstones. The log is compacted to a plain list of ids when it
+        holds more dead lines than ids, and on close."""
     def __init__(self, stateDir, name):
         self._filename = idfilename(stateDir, name)
         self._idsfile = None
         self._ids = None
+        self._lineCount = 0
         self.reopen()
 
     def reopen(self):
         self._idsfile and self.close()
-        self._ids = readIds(self._filename)
+        self._ids, self._lineCount = _readIds(self._filename)
         self.open()
 
     def __len__(self):
         return len(self._ids)
 
+    def __contains__(self, uploadid):
+        return uploadid in self._ids
+
     def __iter__(self):
         for id in self._ids:
             yield unescapeFilename(id)
 
+    def __reversed__(self):
+        for id in reversed(self._ids):
+            yield unescapeFilename(id)
+
     def clear(self):
-        self._ids = []
+        self._ids = {}
+        self._compact()
 
     def open(self):
         self._idsfile = open(self._filename, 'a')
 
     def close(self):
         self._idsfile.close()
-        writeIds(self._filename, self._ids)
+        if self._lineCount != len(self._ids):
+            writeIds(self._filename, self._ids)
+            self._lineCount = len(self._ids)
 
     def getIds(self):
-        return self._ids[:] #[unescapeFilename(each) for each in self._ids[:]]
+        return list(self._ids)
 
     def getDeleteIds(self):
         return readIds("{}.delete".format(self._filename))
@@ -108,14 +201,35 @@ class Ids(object):
     def add(self, uploadid):
         if uploadid in self._ids:
             return
-        self._ids.append(uploadid)
-        self._idsfile.write('{}\n'.format(escapeFilename(uploadid)))
-        self._idsfile.flush()
+        self._ids[uploadid] = None
+        self._append(escapeFilename(uploadid))
 
     def remove(self, uploadid):
         if uploadid in self._ids:
-            self._ids.remove(uploadid)
-            self.close()
-            self.open()
+            del self._ids[uploadid]
+            self._append(TOMBSTONE + escapeFilename(uploadid))
+            if self._lineCount - len(self._ids) > max(COMPACT_MINIMUM, len(self._ids)):
+                self._compact()
+
+    def removeMany(self, uploadids):
+        lines = []
+        for uploadid in uploadids:
+            if uploadid in self._ids:
+                del self._ids[uploadid]
+                lines.append(TOMBSTONE + escapeFilename(uploadid))
+        if not lines:
+            return
+        self._append(*lines)
+        if self._lineCount - len(self._ids) > max(COMPACT_MINIMUM, len(self._ids)):
+            self._compact()
 
+    def _append(self, *lines):
+        self._idsfile.write(''.join('{}\n'.format(line) for line in lines))
+        self._idsfile.flush()
+        self._lineCount += len(lines)
 
+    def _compact(self):
+        self._idsfile.close()
+        writeIds(self._filename, self._ids)
+        self._lineCount = len(self._ids)
+        self.open()
@@ -35,18 +35,37 @@ from meresco.harvester.mapping import Mapping
 from meresco.harvester.target import Target
 from meresco.harvester.repository import Repository
 from urllib.parse import urlencode
-from urllib.request import urlopen
+from urllib.request import urlopen, Request
+from urllib.error import HTTPError
+from os import rename, getpid
+from os.path import join, isfile, isdir
+from time import time
 
 class InternalServerProxy(object):
-    def __init__(self, internalurl, doSetActionDone=True):
+    """With useSnapshot repositories, targets and mappings are read from a
+        domain snapshot (GetDomainSnapshot) instead of one request each. The
+        snapshot is revalidated with its ETag once it is older than
+        snapshotMaxAge seconds. With a snapshotDir it is shared on disk, so
+        a new process only has to revalidate it."""
+    def __init__(self, internalurl, doSetActionDone=True, useSnapshot=False, snapshotDir=None, snapshotMaxAge=5, _time=time):
         self._internalurl = internalurl
         self._geturl = '%s/get?' % internalurl
         self._doSetActionDone = doSetActionDone
+        self._useSnapshot = useSnapshot
+        self._snapshotDir = snapshotDir
+        self._snapshotMaxAge = snapshotMaxAge
+        self._time = _time
+        self._snapshots = {}
 
     def getRepositoryGroup(self, identifier, domainId):
         return self.urlJsonDict(verb='GetRepositoryGroup', identifier=identifier, domainId=domainId)['response']['GetRepositoryGroup']
 
     def getRepository(self, identifier, domainId):
+        snapshot = self._domainSnapshot(domainId)
+        if snapshot is not None:
+            repository = snapshot['repositories'].get(identifier)
+            if repository is not None:
+                return repository
         return self.urlJsonDict(verb='GetRepository', identifier=identifier, domainId=domainId)['response']['GetRepository']
 
     def getRepositoryObject(self, identifier, domainId):
@@ -58,9 +77,17 @@ class InternalServerProxy(object):
         return self.urlJsonDict(verb='GetRepositories', domainId=domainId, repositoryGroupId=repositoryGroupId)['response']['GetRepositories']
 
     def getRepositoryIds(self, domainId, repositoryGroupId=None):
+        snapshot = self._domainSnapshot(domainId)
+        if snapshot is not None:
+            groupIds = [repositoryGroupId] if repositoryGroupId else snapshot['domain'].get('repositoryGroupIds', [])
+            if all(groupId in snapshot['repositoryGroups'] for groupId in groupIds):
+                return [repositoryId for groupId in groupIds for repositoryId in snapshot['repositoryGroups'][groupId].get('repositoryIds', [])]
         return self.urlJsonDict(verb='GetRepositoryIds', domainId=domainId, repositoryGroupId=repositoryGroupId)['response']['GetRepositoryIds']
 
     def getTarget(self, identifier):
+        target = self._fromSnapshots('targets', identifier)
+        if target is not None:
+            return target
         return self.urlJsonDict(verb='GetTarget', identifier=identifier)['response']['GetTarget']
 
     def getTargetObject(self, identifier):
@@ -69,6 +96,9 @@ class InternalServerProxy(object):
         return result
 
     def getMapping(self, identifier):
+        mapping = self._fromSnapshots('mappings', identifier)
+        if mapping is not None:
+            return mapping
         return self.urlJsonDict(verb='GetMapping', identifier=identifier)['response']['GetMapping']
 
     def getMappingObject(self, identifier):
@@ -85,6 +115,59 @@ class InternalServerProxy(object):
     def getStatus(self, **kwargs):
         return self.urlJsonDict(verb='GetStatus', **kwargs)['response']['GetStatus']
 
+    def getDomainSnapshot(self, domainId):
+        etag, snapshot, checked = self._snapshots.get(domainId) or self._loadSnapshot(domainId)
+        if snapshot is not None and self._time() - checked < self._snapshotMaxAge:
+            return snapshot
+        request = Request("{}/get?{}".format(self._internalurl, urlencode(dict(verb='GetDomainSnapshot', domainId=domainId))))
+        if etag:
+            request.add_header('If-None-Match', etag)
+        try:
+            response = self._urlopen(request)
+        except HTTPError as e:
+            if e.code != 304:
+                raise
+        else:
+            result = JsonDict.load(response)
+            if 'error' in result:
+                raise ValueError(result['error']['message'])
+            etag, snapshot = response.headers.get('ETag'), result['response']['GetDomainSnapshot']
+            self._saveSnapshot(domainId, etag, snapshot)
+        self._snapshots[domainId] = (etag, snapshot, self._time())
+        return snapshot
+
+    def _domainSnapshot(self, domainId):
+        "The snapshot when in use and available, otherwise None; callers fall back on the per item verbs"
+        if not self._useSnapshot:
+            return None
+        try:
+            return self.getDomainSnapshot(domainId)
+        except Exception:
+            return None
+
+    def _fromSnapshots(self, kind, identifier):
+        for etag, snapshot, checked in list(self._snapshots.values()):
+            if identifier in snapshot[kind]:
+                return snapshot[kind][identifier]
+        return None
+
+    def _snapshotFilename(self, domainId):
+        return join(self._snapshotDir, '%s.snapshot' % domainId)
+
+    def _loadSnapshot(self, domainId):
+        if self._snapshotDir is None or not isfile(self._snapshotFilename(domainId)):
+            return None, None, 0
+        data = JsonDict.load(self._snapshotFilename(domainId))
+        return data['etag'], data['snapshot'], 0
+
+    def _saveSnapshot(self, domainId, etag, snapshot):
+        if self._snapshotDir is None or not isdir(self._snapshotDir) or not etag:
+            return
+        tmpFilename = '%s.%s' % (self._snapshotFilename(domainId), getpid())
+        with open(tmpFilename, 'w') as f:
+            JsonDict(etag=etag, snapshot=snapshot).dump(f)
+        rename(tmpFilename, self._snapshotFilename(domainId))
+
     def repositoryActionDone(self, domainId, repositoryId):
         if self._doSetActionDone:
             data = urlencode({'domainId': domainId, 'identifier': repositoryId})
@@ -36,6 +36,7 @@
 ## end license ##
 
 from xml.sax.saxutils import escape as xmlEscape
+from time import time
 from .eventlogger import NilEventLogger
 from urllib.parse import urljoin
 from urllib.parse import urlencode
@@ -83,6 +84,13 @@ def read(filename):
 def noimport(*args, **kwargs):
     raise DataMapException('Import not allowed')
 
+class ReadOnlyBuiltins(dict):
+    """Restricted builtins shared by all records of a mapping; code of one
+        record cannot change them for the next."""
+    def _readOnly(self, *args, **kwargs):
+        raise TypeError('builtins of a mapping are read-only')
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readOnly
+
 class DataMapException(Exception):
     pass
 
@@ -137,14 +145,36 @@ class Upload(object):
             self.id = str(self.id)
 
 
+class CompiledMapping(object):
+    def __init__(self, code):
+        self.code = code
+        t0 = time()
+        self.codeObject = compile(code, '<string>', 'exec')
+        self.compileTime = time() - t0
+        self.executeTime = 0.0
+        self.executeCount = 0
+        builtins = __builtins__.copy()
+        builtins['__import__'] = noimport
+        self.builtins = ReadOnlyBuiltins(builtins)
+
+
 class Mapping(SaharaObject, Observable):
     def __init__(self, mappingId):
         SaharaObject.__init__(self,['name', 'description', 'code'])
         Observable.__init__(self)
         self.id = mappingId
+        self._compiled = None
 
     def mappingInfo(self):
-        return "Mappingname '%s'" % self.name
+        info = "Mappingname '%s'" % self.name
+        if self._compiled is not None and self._compiled.executeCount:
+            info += ", Compile/Execute time: %.3fs/%.3fs for %d records" % (self._compiled.compileTime, self._compiled.executeTime, self._compiled.executeCount)
+        return info
+
+    def compiled(self):
+        if self._compiled is None or self._compiled.code != self.code:
+            self._compiled = CompiledMapping(self.code)
+        return self._compiled
 
     def setCode(self, aString):
         self.code = aString
@@ -154,13 +184,12 @@ class Mapping(SaharaObject, Observable):
         if upload.isDeleted:
             return upload
 
-        builtinscopy = __builtins__.copy()
-        builtinscopy['__import__'] = noimport
-
+        compiled = self.compiled()
         assertionMethod = doAsserts and doAssert or doNotAssert
 
+        t0 = time()
         try:
-            exec(self.code, {
+            exec(compiled.codeObject, {
                 'input': upload, # backwards compatible
                 'upload': upload,
                 'isUrl': isUrl,
@@ -173,7 +202,7 @@ class Mapping(SaharaObject, Observable):
                 'xpath': xpath,
                 'xpathFirst': xpathFirst,
                 'lxmltostring': lxmltostring,
-                '__builtins__': builtinscopy
+                '__builtins__': compiled.builtins
             })
             upload.ensureStrings()
         except DataMapAssertionException as ex:
@@ -182,6 +211,9 @@ class Mapping(SaharaObject, Observable):
         except DataMapSkip as e:
             self.do.logLine('SKIP', id=upload.id, comments=str(e))
             upload.skip = True
+        finally:
+            compiled.executeTime += time() - t0
+            compiled.executeCount += 1
         return upload
 
     def skipSimple(self, comment):
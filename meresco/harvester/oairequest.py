@@ -36,25 +36,36 @@
 ## end license ##
 
 from urllib.request import urlopen, install_opener, build_opener, Request
-from urllib.error import URLError
+from urllib.error import URLError, HTTPError
 from ssl import SSLError, SSLContext, PROTOCOL_TLSv1_2
+from zlib import decompressobj, MAX_WBITS
 from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+from email.utils import parsedate_to_datetime
+from time import sleep, time
 
-from lxml.etree import parse
+from lxml.etree import parse, iterparse
 
 from seecr.zulutime import ZuluTime
 from .__version__ import VERSION
 
-from meresco.harvester.namespaces import xpathFirst, xpath
+from meresco.harvester.namespaces import namespaces, xpathFirst, xpath
 
 class OaiRequest(object):
-    def __init__(self, url, userAgent=None, authorizationKey=None, _urlopen=None):
+    def __init__(self, url, userAgent=None, authorizationKey=None, streaming=False, connectionPool=None, hostLimiter=None, maxRetryAfter=None, _urlopen=None, _sleep=sleep):
         self._url = url
         self._urlElements = urlparse(url)
         self._argslist = parse_qsl(self._urlElements[QUERY_POSITION_WITHIN_URLPARSE_RESULT])
         self._userAgent = userAgent or ''
         self._authorizationKey = authorizationKey or ''
-        self._urlopen = _urlopen or urlopen
+        self._streaming = streaming
+        self._connectionPool = connectionPool
+        self._urlopen = _urlopen or (connectionPool.urlopen if connectionPool else urlopen)
+        self._hostLimiter = hostLimiter
+        self._maxRetryAfter = MAX_RETRY_AFTER if maxRetryAfter is None else maxRetryAfter
+        self._sleep = _sleep
+        self._sslContext = None
+        self._body = None
+        self._hostWait = None
 
     def listRecords(self, **kwargs):
         if 'from_' in kwargs:
@@ -75,8 +86,25 @@ class OaiRequest(object):
     def identify(self):
         return self.request({'verb':'Identify'})
 
+    def connectionInfo(self):
+        if self._connectionPool is None:
+            return None
+        new, reused = self._connectionPool.counts(self._urlElements.netloc)
+        return 'Connections new/reused: %d/%d' % (new, reused)
+
+    def transferInfo(self):
+        if self._body is None:
+            return None
+        return 'Bytes received/uncompressed: %d/%d' % (self._body.bytesReceived, self._body.bytesDecoded)
+
+    def hostWaitInfo(self):
+        if not self._hostWait:
+            return None
+        return 'Waited for host %s: %.3f seconds' % (self._urlElements.netloc, self._hostWait)
+
     def request(self, args=None):
         args = {} if args is None else args
+        streaming = self._streaming and args.get('verb') == 'ListRecords'
         try:
             argslist = []
             if 'verb' in args:
@@ -84,20 +112,73 @@ class OaiRequest(object):
             for k, v in args.items():
                 if k != 'verb' and v:
                     argslist.append((k,v))
-            result = self._request(argslist)
+            if streaming:
+                response = self._streamingRequest(argslist)
+            else:
+                response = OaiResponse(self._request(argslist))
         except Exception as e:
             raise OaiRequestException(self._buildRequestUrl(argslist), message=repr(e))
-        if xpathFirst(result, '/oai:OAI-PMH/oai:error') is not None:
-            raise OAIError.create(self._buildRequestUrl(argslist), OaiResponse(result))
-        return OaiResponse(result)
+        if xpathFirst(response.response, '/oai:OAI-PMH/oai:error') is not None:
+            raise OAIError.create(self._buildRequestUrl(argslist), response)
+        return response
 
     def _headers(self):
-        headers = {'User-Agent': self._userAgent.strip() or "Meresco Harvester {}".format(VERSION)}
+        headers = {
+            'User-Agent': self._userAgent.strip() or "Meresco Harvester {}".format(VERSION),
+            'Accept-Encoding': 'gzip, deflate',
+        }
         if self._authorizationKey.strip():
             headers['Authorization'] = "Bearer {}".format(self._authorizationKey)
         return headers
 
     def _request(self, argslist):
+        with self._openBody(argslist) as body:
+            return parse(body)
+
+    def _streamingRequest(self, argslist):
+        body = self._openBody(argslist)
+        try:
+            return OaiStreamingResponse(body, url=self._buildRequestUrl(argslist))
+        except:
+            body.close()
+            raise
+
+    def _openBody(self, argslist):
+        result, slot = self._openHostRequest(argslist)
+        headers = getattr(result, 'headers', None)
+        self._body = ResponseBody(result, contentEncoding=None if headers is None else headers.get('Content-Encoding'), onClose=None if slot is None else slot.release)
+        return self._body
+
+    def _openHostRequest(self, argslist):
+        """Opens the request when the host limiter allows it; a 503 with a
+            Retry-After of at most maxRetryAfter seconds is retried after
+            that time."""
+        host = self._urlElements.netloc
+        self._hostWait = 0.0
+        for attempt in range(MAX_RETRY_AFTER_ATTEMPTS + 1):
+            slot = None
+            if self._hostLimiter is not None:
+                slot = self._hostLimiter.acquire(host)
+                self._hostWait += slot.waited
+            try:
+                return self._openRequest(argslist), slot
+            except HTTPError as e:
+                if slot is not None:
+                    slot.release()
+                seconds = retryAfterSeconds(e)
+                if e.code != 503 or seconds is None or seconds > self._maxRetryAfter or attempt == MAX_RETRY_AFTER_ATTEMPTS:
+                    raise
+                if self._hostLimiter is not None:
+                    self._hostLimiter.retryAfter(host, seconds)
+                else:
+                    self._sleep(seconds)
+                    self._hostWait += seconds
+            except:
+                if slot is not None:
+                    slot.release()
+                raise
+
+    def _openRequest(self, argslist):
         def doUrlopen(context=None):
             return self._urlopen(
                 Request(
@@ -107,11 +188,14 @@ class OaiRequest(object):
                 timeout=5*60,
                 context=context)
         try:
-            result = doUrlopen()
+            return doUrlopen(context=self._sslContext)
         except (SSLError, URLError) as e:
-            result = doUrlopen(context=SSLContext(PROTOCOL_TLSv1_2))
-
-        return parse(result)
+            if self._sslContext is not None or isinstance(e, HTTPError):
+                raise
+            context = SSLContext(PROTOCOL_TLSv1_2)
+            result = doUrlopen(context=context)
+            self._sslContext = context
+            return result
 
     def _buildRequestUrl(self, argslist):
         """Builds the url from the repository's base url + query parameters.
@@ -143,6 +227,160 @@ class OaiResponse(object):
         return ZuluTime().zulu()
 
 
+class OaiStreamingResponse(OaiResponse):
+    """ListRecords response that is parsed while it is being read.
+        records is a one-shot iterator; every record is cleared (together with
+        its processed siblings) as soon as the next one is requested, so only
+        one record is kept in memory. resumptionToken is known after records
+        has been exhausted."""
+    def __init__(self, stream, url=None):
+        self._stream = stream
+        self._url = url
+        self._events = iterparse(stream, events=('end',), tag=[OAI_RECORD, OAI_RESPONSEDATE, OAI_RESUMPTIONTOKEN, OAI_ERROR])
+        self.response = None
+        self.resumptionToken = ''
+        self.responseDate = None
+        self._firstRecord = self._nextRecord()
+        if self.response is None:
+            raise ValueError('No OAI-PMH response')
+        if not self.responseDate:
+            self.responseDate = self._zulu()
+        self.records = self._iterRecords()
+        self.selectRecord(None)
+
+    def _iterRecords(self):
+        record = self._firstRecord
+        self._firstRecord = None
+        try:
+            while record is not None:
+                yield record
+                _release(record)
+                try:
+                    record = self._nextRecord()
+                except Exception as e:
+                    raise OaiRequestException(self._url, message=repr(e))
+        finally:
+            self._close()
+
+    def _nextRecord(self):
+        for _, element in self._events:
+            if self.response is None:
+                self.response = element.getroottree()
+            if element.tag == OAI_RECORD and element.getparent().tag == OAI_LISTRECORDS:
+                return element
+            elif element.tag == OAI_RESPONSEDATE:
+                self.responseDate = (element.text or '').strip()
+            elif element.tag == OAI_RESUMPTIONTOKEN:
+                self.resumptionToken = element.text or ''
+            elif element.tag == OAI_ERROR:
+                break
+        self._close()
+        return None
+
+    def _close(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+
+def _release(element):
+    element.clear()
+    parent = element.getparent()
+    while element.getprevious() is not None:
+        del parent[0]
+    parent.remove(element)
+
+
+class ResponseBody(object):
+    """Reads a response, decompressing gzip or deflate content-encoding
+        chunk by chunk, and counts the bytes received and decoded."""
+    def __init__(self, stream, contentEncoding=None, onClose=None):
+        self._stream = stream
+        self._onClose = onClose
+        self._contentEncoding = (contentEncoding or '').strip().lower()
+        if self._contentEncoding not in ['gzip', 'x-gzip', 'deflate']:
+            self._contentEncoding = None
+        self._decompressor = None
+        self._eof = False
+        self.bytesReceived = 0
+        self.bytesDecoded = 0
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            return self._readAll()
+        if size == 0:
+            return self._stream.read(0)
+        if self._contentEncoding is None:
+            data = self._stream.read(size)
+            self.bytesReceived += len(data)
+            self.bytesDecoded += len(data)
+            return data
+        while not self._eof:
+            data = self._decompressor.unconsumed_tail if self._decompressor else b''
+            if not data:
+                data = self._stream.read(BODY_CHUNKSIZE)
+                self.bytesReceived += len(data)
+            if not data:
+                self._eof = True
+                result = self._decompressor.flush() if self._decompressor else b''
+            else:
+                result = self._decompress(data, size)
+            if result:
+                self.bytesDecoded += len(result)
+                return result
+        return b''
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            if self._onClose is not None:
+                self._onClose()
+                self._onClose = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _readAll(self):
+        result = []
+        while True:
+            data = self.read(BODY_CHUNKSIZE)
+            if not data:
+                return data[:0].join(result)
+            result.append(data)
+
+    def _decompress(self, data, maxLength):
+        if self._decompressor is None:
+            if self._contentEncoding == 'deflate':
+                # 'deflate' is sent both zlib-wrapped and raw in the wild
+                wbits = MAX_WBITS if _hasZlibHeader(data) else -MAX_WBITS
+            else:
+                wbits = 16 + MAX_WBITS
+            self._decompressor = decompressobj(wbits)
+        return self._decompressor.decompress(data, maxLength)
+
+
+def retryAfterSeconds(httpError):
+    """Seconds from the Retry-After header of httpError, given as seconds
+        or as an HTTP date; None if absent or invalid."""
+    value = (httpError.headers or {}).get('Retry-After')
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    try:
+        return max(0, parsedate_to_datetime(value).timestamp() - time())
+    except (TypeError, ValueError):
+        return None
+
+def _hasZlibHeader(data):
+    return len(data) >= 2 and data[0] & 0x0f == 8 and (data[0] * 256 + data[1]) % 31 == 0
+
+
 class OaiRequestException(Exception):
     def __init__(self, url, message):
         Exception.__init__(self, 'occurred with repository at "%s", message: "%s"' % (url, message))
@@ -167,3 +405,12 @@ class OAIError(OaiRequestException):
         )
 
 QUERY_POSITION_WITHIN_URLPARSE_RESULT=4
+BODY_CHUNKSIZE = 64 * 1024
+MAX_RETRY_AFTER = 5 * 60
+MAX_RETRY_AFTER_ATTEMPTS = 3
+
+OAI_RECORD = '{%s}record' % namespaces['oai']
+OAI_LISTRECORDS = '{%s}ListRecords' % namespaces['oai']
+OAI_RESPONSEDATE = '{%s}responseDate' % namespaces['oai']
+OAI_RESUMPTIONTOKEN = '{%s}resumptionToken' % namespaces['oai']
+OAI_ERROR = '{%s}error' % namespaces['oai']
@@ -64,6 +64,15 @@ class Repository(SaharaObject):
         self.id = repositoryId
         self.mockUploader = None
         self.uploadfulltext = True
+        self.streaming = False
+        self.connectionPool = None
+        self.hostLimiter = None
+        self.prefetchDepth = 0
+        self.maxPages = 1
+        self.maxHarvestTime = 30*60
+        self.logBufferSize = 0
+        self.logFlushInterval = 1.0
+        self.logSync = False
         self._oaiRequestClass = oaiRequestClass or OaiRequest
 
     def closedSlots(self):
@@ -74,7 +83,8 @@ class Repository(SaharaObject):
                 self._closedslots = []
         return self._closedslots
 
-    def shopClosed(self, dateTuple = localtime()[:5]):
+    def shopClosed(self, dateTuple=None):
+        dateTuple = localtime()[:5] if dateTuple is None else dateTuple
         return reduce(lambda lhs, rhs: lhs or rhs, [x.areWeWithinTimeslot( dateTuple) for x in self.closedSlots()], False)
 
     def target(self):
@@ -92,7 +102,7 @@ class Repository(SaharaObject):
         return UploaderFactory().createUploader(self.target(), logger, self.collection)
 
     def oairequest(self):
-        return self._oaiRequestClass(self.baseurl, userAgent=self.userAgent or None, authorizationKey=self.authorizationKey or None)
+        return self._oaiRequestClass(self.baseurl, userAgent=self.userAgent or None, authorizationKey=self.authorizationKey or None, streaming=self.streaming, connectionPool=self.connectionPool, hostLimiter=self.hostLimiter)
 
     def _createAction(self, stateDir, logDir, generalHarvestLog):
         return Action.create(self, stateDir=stateDir, logDir=logDir, generalHarvestLog=generalHarvestLog)
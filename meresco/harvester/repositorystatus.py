@@ -31,21 +31,19 @@
 #
 ## end license ##
 
-from os.path import join, isfile
+from os.path import join, isfile, isdir
 from lxml.etree import parse
-from re import compile
-from itertools import islice
 from meresco.components.json import JsonDict, JsonList
 from meresco.core import Observable
-from escaping import escapeFilename, unescapeFilename
+from escaping import escapeFilename
 from simplejson import load as jsonLoad
 
 from .harvesterlog import INVALID_DATA_MESSAGES_DIR
+from .ids import readIds
+from .statusindex import statusFilename, loadStatus, saveStatus, statusFromEvents, RECENT
 from weightless.core import asList
 
 
-NUMBERS_RE = compile(r'.*Harvested/Uploaded/Deleted/Total:\s*(\d+)/(\d+)/(\d+)/(\d+).*')
-
 class RepositoryStatus(Observable):
     def __init__(self, logPath, statePath, name=None):
         Observable.__init__(self, name)
@@ -83,12 +81,7 @@ class RepositoryStatus(Observable):
         invalidFile = join(self._statePath, domainId, escapeFilename("%s_invalid.ids" % repositoryId))
         if not isfile(invalidFile):
             return []
-        with open(invalidFile) as fp:
-            return reversed(
-                [x[:-1] if x[-1] == '\n' else x for x in
-                    (unescapeFilename(line) for line in fp if line.strip())
-                ]
-            )
+        return reversed([anId for anId in readIds(invalidFile) if anId])
 
     def getInvalidRecord(self, domainId, repositoryId, recordId):
         invalidDir = join(self._logPath, domainId, INVALID_DATA_MESSAGES_DIR)
@@ -96,71 +89,31 @@ class RepositoryStatus(Observable):
             return parse(fp)
 
     def _getRepositoryStatus(self, domainId, groupId, repoId):
-        stats = self._parseEventsFile(domainId, repoId)
+        status = loadStatus(statusFilename(join(self._statePath, domainId), repoId))
+        if status is None:
+            status = self._rebuildStatus(domainId, repoId)
         return JsonDict(
                 repositoryId=repoId,
                 repositoryGroupId=groupId,
-                lastHarvestDate=stats.get('lastHarvestDate'),
-                harvested=int(stats.get('harvested', 0)),
-                uploaded=int(stats.get('uploaded', 0)),
-                deleted=int(stats.get('deleted', 0)),
-                total=int(stats.get('total', 0)),
-                totalerrors=int(stats.get('totalerrors', 0)),
-                recenterrors=[dict(date=error[0], error=error[1]) for error in stats['recenterrors']],
-                invalid=int(self._invalidCount(domainId, repoId)),
-                recentinvalids=list(islice(self.invalidRecords(domainId, repoId), 10)),
-                lastHarvestAttempt=stats.get('lastHarvestAttempt')
+                lastHarvestDate=status['lastHarvestDate'],
+                harvested=status['harvested'],
+                uploaded=status['uploaded'],
+                deleted=status['deleted'],
+                total=status['total'],
+                totalerrors=status['totalerrors'],
+                recenterrors=status['recenterrors'],
+                invalid=status['invalid'],
+                recentinvalids=status['recentinvalids'],
+                lastHarvestAttempt=status['lastHarvestAttempt']
             )
 
-    def _invalidCount(self, domainId, repositoryId):
-        invalidFile = join(self._statePath, domainId, escapeFilename("%s_invalid.ids" % repositoryId))
-        if not isfile(invalidFile):
-            return 0
-
-        with open(invalidFile) as fp:
-            return len(fp.readlines())
-
-    def _parseEventsFile(self, domainId, repositoryId):
-        parseState = {'errors': []}
-        eventsfile = join(self._logPath, domainId, "%s.events" % repositoryId)
-        if isfile(eventsfile):
-            with open(eventsfile) as fp:
-                for i, line in enumerate(reversed(fp.readlines())):
-                    stateLine = line.strip().split('\t')
-                    if len(stateLine) != 4:
-                        continue
-                    date, event, id, comments = stateLine
-                    date = date[1:-1]
-                    if not 'lastHarvestAttempt' in parseState:
-                        parseState['lastHarvestAttempt'] = _reformatDate(date)
-                    if event == 'SUCCES':
-                        _succes(parseState, date, comments)
-                        break
-                    elif event == 'ERROR':
-                        _error(parseState, date, comments)
-                        if len(parseState["errors"]) > 100:
-                            break
-
-        recenterrors = parseState["errors"][-10:]
-        recenterrors.reverse()
-        stats = {}
-        for k,v in filter(lambda k_v: k_v[0] != 'errors', list(parseState.items())):
-            stats[k] = v
-        stats["totalerrors"] = len(parseState["errors"])
-        stats["recenterrors"] = recenterrors
-        return stats
-
-def _succes(parseState, date, comments):
-    parseState["lastHarvestDate"] = _reformatDate(date)
-    match = NUMBERS_RE.match(comments)
-    if match:
-        parseState["harvested"], parseState["uploaded"], parseState["deleted"], parseState["total"] = match.groups()
-
-def _error(parseState, date, comments):
-    parseState["errors"].insert(0, (_reformatDate(date), comments))
-
-def _reformatDate(aDate):
-    return aDate[0:len('YYYY-MM-DD')] + 'T' + aDate[len('YYYY-MM-DD '):len('YYYY-MM-DD HH:MM:SS')] + 'Z'
+    def _rebuildStatus(self, domainId, repositoryId):
+        status = statusFromEvents(join(self._logPath, domainId, "%s.events" % repositoryId))
+        invalidIds = list(self.invalidRecords(domainId, repositoryId))
+        status.update(invalid=len(invalidIds), recentinvalids=invalidIds[:RECENT])
+        if isdir(join(self._statePath, domainId)):
+            saveStatus(statusFilename(join(self._statePath, domainId), repositoryId), status)
+        return status
 
 def mergeDicts(dict1, dict2):
     newDict = dict1.copy()
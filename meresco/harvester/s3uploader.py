@@ -6,6 +6,8 @@ from .virtualuploader import VirtualUploader, UploaderException, \
     InvalidComponentException, InvalidDataException
 
 
+S3_DELETE_MAX_KEYS = 1000
+
 class S3Uploader(VirtualUploader):
     def __init__(self, target, eventlogger, collection="ignored"):
         super().__init__(eventlogger)
@@ -46,6 +48,22 @@ class S3Uploader(VirtualUploader):
             else:
                 raise UploaderException(anUpload.id, e)
 
+    def deleteMany(self, uploads):
+        for start in range(0, len(uploads), S3_DELETE_MAX_KEYS):
+            part = uploads[start:start + S3_DELETE_MAX_KEYS]
+            try:
+                response = self.s3.delete_objects(Bucket=self.bucket_name,
+                                                  Delete={'Objects': [{'Key': anUpload.id} for anUpload in part], 'Quiet': True})
+            except ClientError as e:
+                error_code = e.response['Error']['Code']
+                if error_code == 'NoSuchBucket':
+                    raise InvalidComponentException(part[0].id, 'Bucket does not exist.')
+                else:
+                    raise UploaderException(part[0].id, e)
+            for error in response.get('Errors', []):
+                if error.get('Code') != 'NoSuchKey':
+                    raise UploaderException(error.get('Key'), error.get('Message'))
+
     def info(self):
         try:
             response = self.s3.head_bucket(Bucket=self.bucket_name)
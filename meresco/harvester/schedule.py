@@ -0,0 +1,143 @@
+## begin license ##
+#
+# "Meresco Harvester" consists of two subsystems, namely an OAI-harvester and
+# a web-control panel.
+# "Meresco Harvester" is originally called "Sahara" and was developed for
+# SURFnet by:
+# Seek You Too B.V. (CQ2) http://www.cq2.nl
+#
+# Copyright (C) 2026 Seecr (Seek You Too B.V.) https://seecr.nl
+#
+# This file is part of "Meresco Harvester"
+#
+# "Meresco Harvester" is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# "Meresco Harvester" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "Meresco Harvester"; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+## end license ##
+
+
+from calendar import timegm
+from heapq import heappush, heappop
+from itertools import count
+from time import time, localtime, strptime
+
+from .state import readResumptionValues, resumptionFilename, lastSuccessfulHarvestTime
+
+RECHECK_INTERVAL = 60
+
+
+def nextHarvestTime(repository, stateDir, now):
+    """Epoch seconds at which the repository has work, following the rules
+        of Action.create and HarvesterLog.hasWork; None if it has no work
+        until its configuration changes. A repository that is due while its
+        shop is closed is due again at the next minute."""
+    if repository.action in ['clear', 'refresh']:
+        due = now
+    elif not repository.use:
+        return None
+    else:
+        values = readResumptionValues(resumptionFilename(stateDir, repository.id))
+        token, from_, lastSuccessfulHarvest = values or (None, None, None)
+        lastTime = lastSuccessfulHarvestTime(lastSuccessfulHarvest, from_)
+        if token or lastTime is None:
+            due = now
+        elif repository.continuous is None:
+            due = _nextUtcDay(lastTime)
+        else:
+            due = lastTime.epoch + int(repository.continuous) + 1
+    if due <= now and repository.shopClosed(localtime(now)[:5]):
+        return (int(now) // 60 + 1) * 60
+    return due
+
+def _nextUtcDay(zuluTime):
+    return timegm(strptime(zuluTime.zulu().split('T')[0], '%Y-%m-%d')) + 24 * 60 * 60
+
+
+class HarvestQueue(object):
+    """Repository ids ordered by the time they are due, as returned by
+        dueTime(repositoryId): epoch seconds, or None for never. The due
+        time is asked again when it has passed, so only repositories that
+        are due at that moment are popped, and by refresh, so a changed
+        configuration that makes a repository due earlier takes effect.
+        Repositories with the same due time are popped in the order they
+        were added; a repository added as due now, like one that continues
+        with a resumption token, thus queues behind the repositories that
+        are already due."""
+    def __init__(self, dueTime, recheckInterval=RECHECK_INTERVAL, _now=time):
+        self._dueTime = dueTime
+        self._recheckInterval = recheckInterval
+        self._now = _now
+        self._heap = []
+        self._entries = {}
+        self._counter = count()
+        self._refreshed = _now()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, repositoryId):
+        return repositoryId in self._entries
+
+    def ids(self):
+        return set(self._entries)
+
+    def add(self, repositoryId, due=None):
+        """Queues repositoryId at due, or at the time given by dueTime."""
+        self._push(repositoryId, self._dueTime(repositoryId) if due is None else due)
+
+    def discard(self, repositoryId):
+        self._entries.pop(repositoryId, None)
+
+    def refresh(self):
+        """Asks the due time of the queued repositories again, at most once
+            per recheckInterval, and requeues those that are due earlier. A
+            later due time is found when the repository is popped."""
+        now = self._now()
+        if now < self._refreshed + self._recheckInterval:
+            return
+        self._refreshed = now
+        for repositoryId, (queuedDue, _) in list(self._entries.items()):
+            due = self._dueTime(repositoryId)
+            if due is not None and due < queuedDue:
+                self._push(repositoryId, due)
+
+    def pop(self):
+        """The repository that is due first, if it is due now; None otherwise."""
+        now = self._now()
+        while self._heap and self._heap[0][0] <= now:
+            due, entry, repositoryId = heappop(self._heap)
+            if self._entries.get(repositoryId) != (due, entry):
+                continue
+            due = self._dueTime(repositoryId)
+            if due is not None and due <= now:
+                del self._entries[repositoryId]
+                return repositoryId
+            self._push(repositoryId, due)
+        return None
+
+    def secondsUntilDue(self):
+        """Seconds until the due time of the first repository has to be
+            asked again; None for an empty queue."""
+        while self._heap and self._entries.get(self._heap[0][2]) != self._heap[0][:2]:
+            heappop(self._heap)
+        if not self._heap:
+            return None
+        return max(0, self._heap[0][0] - self._now())
+
+    def _push(self, repositoryId, due):
+        if due is None:
+            due = self._now() + self._recheckInterval
+        entry = next(self._counter)
+        self._entries[repositoryId] = (due, entry)
+        heappush(self._heap, (due, entry, repositoryId))
@@ -39,10 +39,12 @@
 from xml.sax.saxutils import escape as xmlEscape
 from .virtualuploader import VirtualUploader, UploaderException, InvalidDataException, InvalidComponentException
 from http.client import SERVICE_UNAVAILABLE, OK as HTTP_OK
-from urllib.request import urlopen
+from urllib.request import Request
+from urllib.error import HTTPError
 from lxml.etree import parse
 from io import BytesIO
 from meresco.harvester.namespaces import xpath
+from meresco.harvester.connectionpool import ConnectionPool
 
 recordUpdate = """<?xml version="1.0" encoding="UTF-8"?>
 <ucp:updateRequest xmlns:srw="http://www.loc.gov/zing/srw/" xmlns:ucp="info:lc/xmlns/update-v1">
@@ -57,9 +59,22 @@ recordUpdate = """<?xml version="1.0" encoding="UTF-8"?>
 </ucp:updateRequest>"""
 
 class SruUpdateUploader(VirtualUploader):
+    """Sends every update or delete as it comes, over a kept-alive
+        connection of a ConnectionPool with up to concurrency connections,
+        one for every worker of a ConcurrentUploader."""
     def __init__(self, sruUpdateTarget, eventlogger, collection="ignored"):
         VirtualUploader.__init__(self, eventlogger)
         self._target = sruUpdateTarget
+        self._maxConnections = int(sruUpdateTarget.concurrency or 1)
+        self._connectionPool = None
+
+    def start(self):
+        self._connectionPool = ConnectionPool(maxConnections=self._maxConnections)
+
+    def stop(self):
+        if self._connectionPool is not None:
+            self._connectionPool.close()
+            self._connectionPool = None
 
     def send(self, anUpload):
         anId = anUpload.id
@@ -112,10 +127,17 @@ class SruUpdateUploader(VirtualUploader):
                 raise InvalidDataException(uploadId=uploadId, message=message)
 
     def _sendDataToRemote(self, data):
-        data = bytes(data, encoding='utf-8')
-        with urlopen(f'http://{self._target.baseurl}:{self._target.port}{self._target.path}', data=data) as u:
-            message = u.read()
-            return u.status, message
+        if self._connectionPool is None:
+            self._connectionPool = ConnectionPool(maxConnections=self._maxConnections)
+        request = Request(f'http://{self._target.baseurl}:{self._target.port}{self._target.path}',
+                data=bytes(data, encoding='utf-8'),
+                headers={'Content-Type': 'text/xml; charset=utf-8'})
+        try:
+            with self._connectionPool.urlopen(request) as u:
+                message = u.read()
+                return u.status, message
+        except HTTPError as e:
+            return e.code, e.read()
 
     def _parseMessage(self, message):
         version = xpath(message, "/srw:updateResponse/srw:version/text()")[0]
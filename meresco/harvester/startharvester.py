@@ -36,8 +36,10 @@
 ## end license ##
 
 from .eventlogger import CompositeLogger, StreamEventLogger
-from time import sleep
+from time import sleep, time
 from .timedprocess import TimedProcess
+from .workerpool import WorkerPool
+from .schedule import HarvestQueue, nextHarvestTime, RECHECK_INTERVAL
 from urllib.request import urlopen
 from os.path import join
 from select import select, error
@@ -48,16 +50,21 @@ from signal import SIGTERM
 from errno import EINTR, EAGAIN
 from meresco.components.json import JsonDict
 from meresco.harvester.internalserverproxy import InternalServerProxy
+from meresco.harvester.connectionpool import ConnectionPool
+from meresco.harvester.hostlimiter import HostLimiter
 
 from gustos.client import Client as GustosClient
 
 AGAIN_EXITCODE = 42
+HOSTS_DIR = '_hosts'
 
 class StartHarvester(object):
     def __init__(self):
         if len(argv[1:]) == 0:
             argv.append('-h')
         self.parser = OptionParser()
+        self._connectionPool = None
+        self._hostLimiter = None
         args = self.parse_args()
         self.__dict__.update(args.__dict__)
 
@@ -65,6 +72,14 @@ class StartHarvester(object):
             self.parser.error("Specify domain")
         if self._concurrency < 1:
             self.parser.error("Concurrency must be at least 1.")
+        if self.prefetch and self.streaming:
+            self.parser.error("Prefetching pages cannot be combined with streaming.")
+        if self.pagesPerProcess is None:
+            self.pagesPerProcess = 0 if self.prefetch else 1
+        if self.harvestTimeBudget is None:
+            self.harvestTimeBudget = self.processTimeout // 2
+        if self.harvestTimeBudget >= self.processTimeout:
+            self.parser.error("Harvest time budget must be less than the process timeout.")
 
         config = JsonDict.load(urlopen(self.serverUrl + '/info/config'))
         if self._logDir is None:
@@ -72,7 +87,7 @@ class StartHarvester(object):
         if self._stateDir is None:
             self._stateDir = config['statePath']
 
-        self.proxy = InternalServerProxy(self.serverUrl, self.setActionDone)
+        self.proxy = InternalServerProxy(self.serverUrl, self.setActionDone, useSnapshot=True, snapshotDir=self._stateDir)
         self.repository = self.repositoryId and self.proxy.getRepositoryObject(identifier=self.repositoryId, domainId=self.domainId)
 
 
@@ -122,6 +137,11 @@ class StartHarvester(object):
             default=1,
             help="Number of repositories to be concurrently harvested. Defaults to 1 (no concurrency).",
             metavar="NUMBER")
+        self.parser.add_option("--workers", "",
+            dest="workers",
+            action="store_true",
+            default=False,
+            help="Harvest in --concurrency long-lived worker processes instead of starting a new process for every repository run.")
         self.parser.add_option("--force-target", "",
             dest="forceTarget",
             help="Overrides the repository's target",
@@ -141,6 +161,76 @@ class StartHarvester(object):
             action="store_true",
             default=False,
             help="Prevent harvester from looping (if combined with --repository)")
+        self.parser.add_option("--streaming", "",
+            dest="streaming",
+            action="store_true",
+            default=False,
+            help="Parse ListRecords responses while they are read, keeping only one record in memory.")
+        self.parser.add_option("--prefetch", "",
+            dest="prefetch",
+            type="int",
+            default=0,
+            metavar="NUMBER",
+            help="Fetch up to NUMBER ListRecords pages ahead while records are uploaded. Defaults to 0 (one page per run, no prefetching).")
+        self.parser.add_option("--pages-per-process", "",
+            dest="pagesPerProcess",
+            type="int",
+            default=None,
+            metavar="NUMBER",
+            help="Harvest up to NUMBER ListRecords pages before the subprocess is restarted, 0 for no limit. Defaults to 1, or 0 when prefetching.")
+        self.parser.add_option("--harvest-time-budget", "",
+            dest="harvestTimeBudget",
+            type="int",
+            default=None,
+            metavar="SECONDS",
+            help="No new page is harvested by a subprocess after SECONDS. Must be less than the process timeout, defaults to half of it.")
+        self.parser.add_option("--log-buffer-size", "",
+            dest="logBufferSize",
+            type="int",
+            default=0,
+            metavar="SIZE",
+            help="Buffer up to SIZE characters of repository events before writing them. Defaults to 0 (write every line).")
+        self.parser.add_option("--log-flush-interval", "",
+            dest="logFlushInterval",
+            type="float",
+            default=1.0,
+            metavar="SECONDS",
+            help="Write buffered repository events within SECONDS of logging them. Defaults to 1.")
+        self.parser.add_option("--log-sync", "",
+            dest="logSync",
+            action="store_true",
+            default=False,
+            help="Sync the repository events to disk before the harvest state is saved.")
+        self.parser.add_option("--max-connections", "",
+            dest="maxConnections",
+            type="int",
+            default=0,
+            metavar="NUMBER",
+            help="Keep up to NUMBER idle connections per OAI-PMH host for reuse. Defaults to 0 (no connection reuse).")
+        self.parser.add_option("--connection-idle-timeout", "",
+            dest="connectionIdleTimeout",
+            type="int",
+            default=60,
+            metavar="SECONDS",
+            help="Idle connections older than SECONDS are not reused. Defaults to 60.")
+        self.parser.add_option("--host-concurrency", "",
+            dest="hostConcurrency",
+            type="int",
+            default=0,
+            metavar="NUMBER",
+            help="Send at most NUMBER concurrent requests to one OAI-PMH host, over all harvest processes. Defaults to 0 (no limit).")
+        self.parser.add_option("--host-rate", "",
+            dest="hostRate",
+            type="float",
+            default=0,
+            metavar="REQUESTS",
+            help="Send on average at most REQUESTS requests per second to one OAI-PMH host, over all harvest processes. Defaults to 0 (no limit).")
+        self.parser.add_option("--host-burst", "",
+            dest="hostBurst",
+            type="int",
+            default=1,
+            metavar="NUMBER",
+            help="Allow bursts of NUMBER requests to one OAI-PMH host within the --host-rate. Defaults to 1.")
         self.parser.add_option("--child", "",
             action="store_true",
             dest="child",
@@ -161,28 +251,31 @@ class StartHarvester(object):
     def start(self):
         if self.child:
             self._startRepository()
+        elif self.workers:
+            self._startWorkers()
         else:
             self._startChildProcesses()
 
     def _startChildProcesses(self):
         running = set()
-        if self.repository:
-            waiting = [self.repositoryId]
-        else:
-            waiting = self.proxy.getRepositoryIds(self.domainId)
+        queue = self._createQueue()
         processes = {}
         try:
-            while running or waiting:
-                while waiting and (len(running) < self._concurrency):
-                    repositoryId = waiting.pop(0)
+            while self._nextRound(queue, running):
+                while len(running) < self._concurrency:
+                    repositoryId = queue.pop()
+                    if repositoryId is None:
+                        break
                     self._createProcess(processes, repositoryId)
                     running.add(repositoryId)
+                if not running:
+                    continue
                 try:
-                    readers, _, _ = select(list(processes.keys()), [], [])
+                    readers, _, _ = select(list(processes.keys()), [], [], self._waitTimeout(queue, running))
                 except error as e:
                     (errno, description) = e.args
                     if errno == EINTR:
-                        pass
+                        readers = []
                     else:
                         raise
                 for reader in readers:
@@ -210,14 +303,14 @@ class StartHarvester(object):
                         del processes[poFileno]
                         del processes[peFileno]
                         if exitstatus == AGAIN_EXITCODE:
-                            waiting.insert(0, repositoryId)
+                            queue.add(repositoryId, due=time())
                         else:
                             if exitstatus != 0:
                                 stderr.write("Process (for repository %s) exited with exitstatus %s.\n" % (repositoryId, exitstatus))
                                 stderr.flush()
                             if not self.runOnce:
-                                waiting.append(repositoryId)
-                        self._updateWaiting(waiting, running)
+                                queue.add(repositoryId)
+                        self._updateQueue(queue, running)
 
         except:
             for t in set([t for t,process,repositoryId in list(processes.values())]):
@@ -237,22 +330,114 @@ class StartHarvester(object):
             args += [extraArg]
         return args
 
-    def _updateWaiting(self, waiting, running):
+    def _createQueue(self):
+        queue = HarvestQueue(self._dueTime)
+        for repositoryId in ([self.repositoryId] if self.repository else self.proxy.getRepositoryIds(self.domainId)):
+            queue.add(repositoryId)
+        return queue
+
+    def _dueTime(self, repositoryId):
+        try:
+            repository = self.proxy.getRepositoryObject(identifier=repositoryId, domainId=self.domainId)
+        except ValueError:
+            return None
+        try:
+            return nextHarvestTime(repository, join(self._stateDir, self.domainId), time())
+        except ValueError:
+            # state being written by a harvest; ask again soon
+            return time() + self.sleepTime
+
+    def _nextRound(self, queue, running):
+        if running:
+            return True
+        seconds = queue.secondsUntilDue()
+        if seconds is None:
+            return False
+        if seconds > 0:
+            if self.runOnce:
+                return False
+            sleep(min(seconds, RECHECK_INTERVAL))
+            self._updateQueue(queue, running)
+        return True
+
+    def _waitTimeout(self, queue, running):
+        if len(running) >= self._concurrency:
+            return None
+        return queue.secondsUntilDue()
+
+    def _updateQueue(self, queue, running):
         if self.runOnce or self.repository:
             return
         repositoryIds = self.proxy.getRepositoryIds(self.domainId)
-        for repoId in waiting[:]:
-            if not repoId in repositoryIds:
-                waiting.remove(repoId)
+        for repoId in queue.ids().difference(repositoryIds):
+            queue.discard(repoId)
         for repoId in repositoryIds:
-            if not repoId in waiting and not repoId in running:
-                waiting.append(repoId)
+            if not repoId in queue and not repoId in running:
+                queue.add(repoId)
+        queue.refresh()
+
+    def _startWorkers(self):
+        running = set()
+        queue = self._createQueue()
+        stdout.flush()
+        stderr.flush()
+        pool = WorkerPool(self._harvestInWorker, size=self._concurrency, timeout=self.processTimeout)
+        pool.start()
+        try:
+            while self._nextRound(queue, running):
+                while pool.idle():
+                    repositoryId = queue.pop()
+                    if repositoryId is None:
+                        break
+                    pool.submit(repositoryId)
+                    running.add(repositoryId)
+                if not running:
+                    continue
+                for repositoryId, again, error in pool.wait(timeout=self._waitTimeout(queue, running)):
+                    running.remove(repositoryId)
+                    if again:
+                        queue.add(repositoryId, due=time())
+                    else:
+                        if error:
+                            stderr.write("Worker (for repository %s) failed: %s\n" % (repositoryId, error))
+                            stderr.flush()
+                        if not self.runOnce:
+                            queue.add(repositoryId)
+                    self._updateQueue(queue, running)
+        finally:
+            pool.stop()
+
+    def _harvestInWorker(self, repositoryId):
+        repository = self.proxy.getRepositoryObject(identifier=repositoryId, domainId=self.domainId)
+        try:
+            return self._harvestRepository(repository)
+        finally:
+            stdout.flush()
+            stderr.flush()
 
     def _startRepository(self):
+        if self._harvestRepository(self.repository):
+            exit(AGAIN_EXITCODE)
+
+    def _harvestRepository(self, repository):
         if self.forceTarget:
-            self.repository.targetId = self.forceTarget
+            repository.targetId = self.forceTarget
         if self.forceMapping:
-            self.repository.mappingId = self.forceMapping
+            repository.mappingId = self.forceMapping
+        repository.streaming = self.streaming
+        repository.prefetchDepth = self.prefetch
+        repository.maxPages = self.pagesPerProcess
+        repository.maxHarvestTime = self.harvestTimeBudget
+        repository.logBufferSize = self.logBufferSize
+        repository.logFlushInterval = self.logFlushInterval
+        repository.logSync = self.logSync
+        if self.maxConnections > 0:
+            if self._connectionPool is None:
+                self._connectionPool = ConnectionPool(maxConnections=self.maxConnections, idleTimeout=self.connectionIdleTimeout)
+            repository.connectionPool = self._connectionPool
+        if self._hostLimiter is None:
+            self._hostLimiter = HostLimiter(join(self._stateDir, HOSTS_DIR), maxConcurrent=self.hostConcurrency, rate=self.hostRate, burst=self.hostBurst)
+        repository.hostLimiter = self._hostLimiter
 
         self._generalHarvestLog = CompositeLogger([
             (['*'], StreamEventLogger(stdout)),
@@ -265,11 +450,10 @@ class StartHarvester(object):
             gustosPort=self.gustosPort,
             threaded=False) if self.gustosId else None
 
-        messageIgnored, again = self.repository.do(
+        messageIgnored, again = repository.do(
             stateDir=join(self._stateDir, self.domainId),
             logDir=join(self._logDir, self.domainId),
             generalHarvestLog=self._generalHarvestLog,
             gustosClient=gustosClient)
         sleep(self.sleepTime)
-        if again:
-            exit(AGAIN_EXITCODE)
+        return again
@@ -42,19 +42,23 @@ class State(object):
     def __init__(self, stateDir, name):
         self._statsfilename = join(stateDir, '%s.stats' % name)
         self._forceFinalNewlineOnStatsFile()
-        self._resumptionFilename = join(stateDir, '%s.next' % name)
+        self._resumptionFilename = resumptionFilename(stateDir, name)
         self._runningFilename = join(stateDir, '%s.running' % name)
         self.from_ = None
         self.token = None
         self.lastSuccessfulHarvest = None
         self._readState()
         self._statsfile = open(self._statsfilename, 'a')
+        self._started = False
 
     def close(self):
         self._statsfile.close()
         self._forceFinalNewlineOnStatsFile()
 
     def markStarted(self):
+        if self._started:
+            self._write('\n')
+        self._started = True
         self._write('Started: %s, Harvested/Uploaded/Deleted/Total: ' % self.getTime())
 
     def markHarvested(self, countsSummary, token, responseDate):
@@ -74,19 +78,29 @@ class State(object):
         self._write( ', Error: ' + error)
         self._markRunningState("Error", str(exValue))
 
+    def markDeleteProgress(self, done, remaining, rate):
+        runningDict = self._runningState()
+        runningDict.setdefault('changedate', self.getTime())
+        runningDict.setdefault('status', 'Ok')
+        runningDict.setdefault('message', '')
+        runningDict['progress'] = {'phase': 'delete', 'done': done, 'remaining': remaining, 'rate': round(rate, 1)}
+        JsonDict(runningDict).dump(self._runningFilename)
+
+    def clearDeleteProgress(self):
+        runningDict = self._runningState()
+        if runningDict.pop('progress', None) is not None:
+            JsonDict(runningDict).dump(self._runningFilename)
+
     def _markRunningState(self, status, message=""):
-        runningDict = JsonDict.load(self._runningFilename) if isfile(self._runningFilename) else {}
-        if status != runningDict.get('status', None) or message != runningDict.get('message', None):
+        runningDict = self._runningState()
+        if status != runningDict.get('status', None) or message != runningDict.get('message', None) or 'progress' in runningDict:
             JsonDict({'changedate': self.getTime(),'status': status, 'message': message}).dump(self._runningFilename)
 
+    def _runningState(self):
+        return JsonDict.load(self._runningFilename) if isfile(self._runningFilename) else {}
+
     def getLastSuccessfulHarvestTime(self):
-        if self.lastSuccessfulHarvest:
-            return ZuluTime(self.lastSuccessfulHarvest)
-        if self.from_:
-            if 'T' not in self.from_:
-                return ZuluTime(self.from_ + "T00:00:00Z")
-            return ZuluTime(self.from_)
-        return None
+        return lastSuccessfulHarvestTime(self.lastSuccessfulHarvest, self.from_)
 
     def getTime(self):
         return self.getZTime().display('%Y-%m-%d %H:%M:%S')
@@ -97,11 +111,9 @@ class State(object):
         self._writeResumptionValues(None, self.from_)
 
     def _readState(self):
-        if isfile(self._resumptionFilename):
-            values = JsonDict.load(self._resumptionFilename)
-            self.token = values.get('resumptionToken', None) or None
-            self.from_ = values.get('from', '') or None
-            self.lastSuccessfulHarvest = values.get('lastSuccessfulHarvest', '') or None
+        values = readResumptionValues(self._resumptionFilename)
+        if values is not None:
+            self.token, self.from_, self.lastSuccessfulHarvest = values
             return
 
         # The mechanism below will only be carried out once in case the resumption file does not yet exist.
@@ -143,6 +155,10 @@ class State(object):
         else:
             lastSuccessfulHarvest = self.getZTime().zulu()
         JsonDict({'resumptionToken': newToken, 'from': newFrom, 'lastSuccessfulHarvest': lastSuccessfulHarvest}).dump(self._resumptionFilename)
+        # keep in sync with the file, so a next page within the same run continues from here
+        self.token = newToken or None
+        self.from_ = newFrom or None
+        self.lastSuccessfulHarvest = lastSuccessfulHarvest
 
     @staticmethod
     def _filterNonErrorLogLine(iterator):
@@ -158,6 +174,26 @@ class State(object):
         return ZuluTime()
 
 
+def resumptionFilename(stateDir, name):
+    return join(stateDir, '%s.next' % name)
+
+def readResumptionValues(filename):
+    """(token, from, lastSuccessfulHarvest) as stored in a .next file,
+        None if there is no such file."""
+    if not isfile(filename):
+        return None
+    values = JsonDict.load(filename)
+    return values.get('resumptionToken', None) or None, values.get('from', '') or None, values.get('lastSuccessfulHarvest', '') or None
+
+def lastSuccessfulHarvestTime(lastSuccessfulHarvest, from_):
+    if lastSuccessfulHarvest:
+        return ZuluTime(lastSuccessfulHarvest)
+    if from_:
+        if 'T' not in from_:
+            return ZuluTime(from_ + "T00:00:00Z")
+        return ZuluTime(from_)
+    return None
+
 def getStartDate(logline):
     matches = re.search('Started: (\d{4}-\d{2}-\d{2})', logline)
     return matches.group(1)
@@ -0,0 +1,163 @@
+## begin license ##
+#
+# "Meresco Harvester" consists of two subsystems, namely an OAI-harvester and
+# a web-control panel.
+# "Meresco Harvester" is originally called "Sahara" and was developed for
+# SURFnet by:
+# Seek You Too B.V. (CQ2) http://www.cq2.nl
+#
+# Copyright (C) 2026 Seecr (Seek You Too B.V.) https://seecr.nl
+#
+# This file is part of "Meresco Harvester"
+#
+# "Meresco Harvester" is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# "Meresco Harvester" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "Meresco Harvester"; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+## end license ##
+
+
+from os import rename
+from os.path import join, isfile
+from re import compile
+from itertools import islice
+
+from escaping import escapeFilename
+from meresco.components.json import JsonDict
+
+from .eventlogger import readEventLinesReversed
+
+
+NUMBERS_RE = compile(r'.*Harvested/Uploaded/Deleted/Total:\s*(\d+)/(\d+)/(\d+)/(\d+).*')
+MAX_ERRORS = 100
+RECENT = 10
+SAVE_EVENTS = ('STARTHARVEST', 'SUCCES', 'ERROR', 'ENDHARVEST')
+
+def statusFilename(stateDir, name):
+    return join(stateDir, escapeFilename("%s.status" % name))
+
+def loadStatus(filename):
+    if not isfile(filename):
+        return None
+    return JsonDict.load(filename)
+
+def saveStatus(filename, status):
+    with open(filename + '.tmp', 'w') as f:
+        JsonDict(status).dump(f)
+    rename(filename + '.tmp', filename)
+
+def emptyStatus():
+    return dict(
+            lastHarvestDate=None,
+            harvested=0,
+            uploaded=0,
+            deleted=0,
+            total=0,
+            totalerrors=0,
+            recenterrors=[],
+            invalid=0,
+            recentinvalids=[],
+            lastHarvestAttempt=None,
+        )
+
+def statusFromEvents(eventsfile):
+    stats = parseEventsFile(eventsfile)
+    status = emptyStatus()
+    status.update(
+            lastHarvestDate=stats.get('lastHarvestDate'),
+            harvested=int(stats.get('harvested', 0)),
+            uploaded=int(stats.get('uploaded', 0)),
+            deleted=int(stats.get('deleted', 0)),
+            total=int(stats.get('total', 0)),
+            totalerrors=int(stats.get('totalerrors', 0)),
+            recenterrors=[dict(date=error[0], error=error[1]) for error in stats['recenterrors']],
+            lastHarvestAttempt=stats.get('lastHarvestAttempt'),
+        )
+    return status
+
+def recentIds(ids):
+    return list(islice(reversed(ids), RECENT))
+
+def parseEventsFile(eventsfile):
+    parseState = {'errors': []}
+    if isfile(eventsfile):
+        for line in readEventLinesReversed(eventsfile):
+            stateLine = line.strip().split('\t')
+            if len(stateLine) != 4:
+                continue
+            date, event, id, comments = stateLine
+            date = date[1:-1]
+            if not 'lastHarvestAttempt' in parseState:
+                parseState['lastHarvestAttempt'] = reformatDate(date)
+            if event == 'SUCCES':
+                _succes(parseState, date, comments)
+                break
+            elif event == 'ERROR':
+                _error(parseState, date, comments)
+                if len(parseState["errors"]) > MAX_ERRORS:
+                    break
+
+    recenterrors = parseState["errors"][-RECENT:]
+    recenterrors.reverse()
+    stats = {}
+    for k,v in filter(lambda k_v: k_v[0] != 'errors', list(parseState.items())):
+        stats[k] = v
+    stats["totalerrors"] = len(parseState["errors"])
+    stats["recenterrors"] = recenterrors
+    return stats
+
+def _succes(parseState, date, comments):
+    parseState["lastHarvestDate"] = reformatDate(date)
+    match = NUMBERS_RE.match(comments)
+    if match:
+        parseState["harvested"], parseState["uploaded"], parseState["deleted"], parseState["total"] = match.groups()
+
+def _error(parseState, date, comments):
+    parseState["errors"].insert(0, (reformatDate(date), comments))
+
+def reformatDate(aDate):
+    return aDate[0:len('YYYY-MM-DD')] + 'T' + aDate[len('YYYY-MM-DD '):len('YYYY-MM-DD HH:MM:SS')] + 'Z'
+
+
+class StatusIndex(object):
+    """The status of a repository as shown by RepositoryStatus, updated for
+        every logged event and saved to a small file, so reading it does
+        not require parsing the events log. Without a saved status it is
+        rebuilt once from the events file."""
+    def __init__(self, filename, eventsfile, invalidIds):
+        self._filename = filename
+        self._invalidIds = invalidIds
+        self._status = loadStatus(filename)
+        if self._status is None:
+            self._status = statusFromEvents(eventsfile)
+            self.save()
+
+    def logLine(self, date, event, comments):
+        status = self._status
+        status['lastHarvestAttempt'] = reformatDate(date)
+        if event == 'SUCCES':
+            match = NUMBERS_RE.match(comments)
+            harvested, uploaded, deleted, total = map(int, match.groups()) if match else (0, 0, 0, 0)
+            status.update(lastHarvestDate=reformatDate(date), harvested=harvested, uploaded=uploaded, deleted=deleted, total=total, totalerrors=0, recenterrors=[])
+        elif event == 'ERROR':
+            status['totalerrors'] = min(status['totalerrors'] + 1, MAX_ERRORS + 1)
+            status['recenterrors'] = [dict(date=reformatDate(date), error=comments)] + status['recenterrors'][:RECENT - 1]
+        if event in SAVE_EVENTS:
+            self.save()
+
+    def save(self):
+        self._status.update(invalid=len(self._invalidIds), recentinvalids=recentIds(self._invalidIds))
+        saveStatus(self._filename, self._status)
+
+    def status(self):
+        return self._status
@@ -40,5 +40,6 @@ from .saharaobject import SaharaObject
 class Target(SaharaObject):
     def __init__(self, id):
         SaharaObject.__init__(self, ['baseurl', 'name', 'username', 'password', 'bucket', "accessKey", "secretKey",
-                                'port', 'path', 'targetType', 'privateKey', 'command', 'hostname', 'oaiEnvelope'], ['delegate'])
+                                'port', 'path', 'targetType', 'privateKey', 'command', 'hostname', 'oaiEnvelope', 'batchSize', 'concurrency', 'fsync',
+                                'shardLevels', 'shardWidth', 'manifest'], ['delegate'])
         self.id = id
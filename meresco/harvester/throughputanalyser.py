@@ -39,11 +39,13 @@
 #
 import re, sys, os
 from time import strptime
-from datetime import datetime
+from datetime import datetime, timedelta
+from simplejson import load as jsonLoad, dump as jsonDump
 NUMBERS_RE = re.compile(r'.*Harvested/Uploaded/Deleted/Total:\s*(\d+)/(\d+)/(\d+)/(\d+).*')
 
 from xml.sax.saxutils import escape as escapeXml
-from os.path import isfile
+from .eventlogger import readEventLines
+from os.path import isfile, isdir
 
 def parseToTime(dateString):
     dateList = list((strptime(dateString.split(".")[0],"%Y-%m-%d %H:%M:%S"))[:6])
@@ -91,34 +93,127 @@ class ThroughputAnalyser(object):
             report.add(*self._analyseRepository(name, dateSince))
         return report
 
+    def analysePerPeriod(self, repositoryNames, dateSince, granularity='day'):
+        """Reports per hour, day or week (ISO year and week, like 2006-W35),
+            sorted by period. Hours are only kept for the last ROLLUP_HOUR_DAYS days."""
+        reports = {}
+        for name in repositoryNames:
+            for period, (records, seconds, runs) in self._rollup(name).periods(granularity, dateSince):
+                reports.setdefault(period, ThroughputReport()).add(records, seconds)
+        return sorted(reports.items())
+
     def _analyseRepository(self, repositoryName, dateSince):
-        reportfile = os.path.join(self.eventpath, repositoryName + '.events')
-
-        records, seconds = 0, 0.0
-        if not isfile(reportfile):
-            return records, seconds
-        events = open(reportfile)
-        try:
-            split = lambda l:list(map(str.strip, l.split('\t')))
-            begintime = None
-            datefilter = lambda date_x_y_z: date_x_y_z[0][1:-1] >= dateSince
-            allevents = map(split, filter(str.strip, events))
-            for date, event, anIdentifier, comments in filter(datefilter, allevents):
-                if event == "STARTHARVEST":
-                    begintime = parseToTime(date[1:-1])
-                    harvested = uploaded = deleted = total = -1
-                elif event == 'ENDHARVEST':
-                    if begintime and harvested > -1:
-                        endtime = parseToTime(date[1:-1])
-                        if endtime > begintime:
-                            records += (int(uploaded) + int(deleted))
-                            seconds += diffTime(endtime, begintime)
-                            begintime = None
-                elif event == 'SUCCES':
-                    match = NUMBERS_RE.match(comments)
-                    if match:
-                        harvested, uploaded, deleted, total = map(int, match.groups())
-
-        finally:
-            events.close()
+        records, seconds, runs = self._rollup(repositoryName).total(dateSince)
         return records, seconds
+
+    def _rollup(self, repositoryName):
+        rollup = ThroughputRollup.load(rollupFilename(self.eventpath, repositoryName))
+        if rollup is None:
+            rollup = ThroughputRollup.fromEvents(os.path.join(self.eventpath, repositoryName + '.events'))
+            if isdir(self.eventpath):
+                rollup.save(rollupFilename(self.eventpath, repositoryName))
+        return rollup
+
+
+ROLLUP_HOUR_DAYS = 31
+ROLLUP_DAYS = 366
+
+def rollupFilename(eventpath, repositoryName):
+    return os.path.join(eventpath, repositoryName + '.throughput')
+
+class ThroughputRollup(object):
+    """Records uploaded and deleted, harvest seconds and number of runs of
+        a repository per day and per hour, added when a harvest ends
+        (STARTHARVEST .. ENDHARVEST) and counted at the hour it started."""
+    def __init__(self, hours=None, days=None, filename=None):
+        self._hours = hours or {}
+        self._days = days or {}
+        self._filename = filename
+        self._begin = None
+        self._records = None
+
+    @classmethod
+    def load(cls, filename):
+        if not isfile(filename):
+            return None
+        with open(filename) as fp:
+            data = jsonLoad(fp)
+        return cls(hours=data['hours'], days=data['days'], filename=filename)
+
+    @classmethod
+    def fromEvents(cls, eventsfile, filename=None):
+        rollup = cls(filename=filename)
+        if isfile(eventsfile):
+            for line in readEventLines(eventsfile):
+                fields = list(map(str.strip, line.split('\t')))
+                if len(fields) == 4:
+                    date, event, anIdentifier, comments = fields
+                    rollup._logLine(date[1:-1], event, comments)
+        return rollup
+
+    @classmethod
+    def open(cls, filename, eventsfile):
+        rollup = cls.load(filename)
+        if rollup is None:
+            rollup = cls.fromEvents(eventsfile, filename=filename)
+            rollup.save()
+        return rollup
+
+    def logLine(self, date, event, comments):
+        if self._logLine(date, event, comments):
+            self.save()
+
+    def save(self, filename=None):
+        filename = filename or self._filename
+        with open(filename + '.tmp', 'w') as fp:
+            jsonDump(dict(hours=self._hours, days=self._days), fp)
+        os.rename(filename + '.tmp', filename)
+
+    def total(self, dateSince):
+        records, seconds, runs = 0, 0.0, 0
+        for day, (dayRecords, daySeconds, dayRuns) in self._days.items():
+            if day >= dateSince:
+                records, seconds, runs = records + dayRecords, seconds + daySeconds, runs + dayRuns
+        return records, seconds, runs
+
+    def periods(self, granularity, dateSince):
+        if granularity == 'hour':
+            return [(hour, value) for hour, value in self._hours.items() if hour >= dateSince]
+        if granularity == 'week':
+            weeks = {}
+            for day, (records, seconds, runs) in self._days.items():
+                if day >= dateSince:
+                    week = weeks.setdefault(datetime.strptime(day, '%Y-%m-%d').strftime('%G-W%V'), [0, 0.0, 0])
+                    week[0], week[1], week[2] = week[0] + records, week[1] + seconds, week[2] + runs
+            return list(weeks.items())
+        return [(day, value) for day, value in self._days.items() if day >= dateSince]
+
+    def _logLine(self, date, event, comments):
+        if event == 'STARTHARVEST':
+            self._begin, self._records = date, None
+        elif event == 'SUCCES' and self._begin:
+            match = NUMBERS_RE.match(comments)
+            if match:
+                harvested, uploaded, deleted, total = map(int, match.groups())
+                self._records = (self._records or 0) + uploaded + deleted
+        elif event == 'ENDHARVEST' and self._begin:
+            begin, records = self._begin, self._records
+            self._begin, self._records = None, None
+            if records is not None:
+                begintime, endtime = parseToTime(begin), parseToTime(date)
+                if endtime > begintime:
+                    self._add(begin, records, diffTime(endtime, begintime))
+                    self._prune(begintime)
+                    return True
+        return False
+
+    def _add(self, date, records, seconds):
+        for buckets, key in [(self._hours, date[:len('YYYY-MM-DD HH')]), (self._days, date[:len('YYYY-MM-DD')])]:
+            bucket = buckets.setdefault(key, [0, 0.0, 0])
+            bucket[0], bucket[1], bucket[2] = bucket[0] + records, bucket[1] + seconds, bucket[2] + 1
+
+    def _prune(self, now):
+        for buckets, days in [(self._hours, ROLLUP_HOUR_DAYS), (self._days, ROLLUP_DAYS)]:
+            oldest = (now - timedelta(days=days)).strftime('%Y-%m-%d')
+            for key in [key for key in buckets if key < oldest]:
+                del buckets[key]
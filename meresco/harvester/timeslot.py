@@ -58,7 +58,8 @@ class Timeslot(object):
 	def valid(self):
 		return self._begin < self._end
 
-	def areWeWithinTimeslot(self, dateTuple = time.localtime()[:5]):
+	def areWeWithinTimeslot(self, dateTuple = None):
+		dateTuple = time.localtime()[:5] if dateTuple is None else dateTuple
 		date = datetime.datetime(*dateTuple)
 		date = date.isocalendar()[1:] + (date.hour, date.minute)
 		return self._begin <= date <= self._end
@@ -77,6 +77,17 @@ class VirtualUploader(object):
         """Delete the record with anUpload.id"""
         raise NotImplementedError(self.delete.__doc__)
 
+    def deleteMany(self, uploads):
+        """Delete the records with the ids of uploads. Overwrite where the
+        target can delete many records at once."""
+        for anUpload in uploads:
+            self.delete(anUpload)
+
+    def flushUploads(self):
+        """Overwrite to send pending uploads and deletes. Returns the
+        InvalidDataExceptions for records that were rejected."""
+        return []
+
     def info(self):
         """Return information on yourself."""
         raise NotImplementedError(self.info.__doc__)
@@ -108,5 +119,10 @@ class UploaderFactory(object):
 
     def createUploader(self, target, logger, collection):
         uploaderClass = self.mapping[target.targetType]
+        concurrency = int(target.concurrency or 1)
+        if concurrency > 1 and target.targetType != 'composite':
+            from .concurrentuploader import ConcurrentUploader, QueuedLogger
+            uploaderLogger = QueuedLogger()
+            return ConcurrentUploader(uploaderClass(target, uploaderLogger, collection), logger, concurrency, uploaderLogger=uploaderLogger)
         return uploaderClass(target, logger, collection)
 
@@ -0,0 +1,148 @@
+## begin license ##
+#
+# "Meresco Harvester" consists of two subsystems, namely an OAI-harvester and
+# a web-control panel.
+# "Meresco Harvester" is originally called "Sahara" and was developed for
+# SURFnet by:
+# Seek You Too B.V. (CQ2) http://www.cq2.nl
+#
+# Copyright (C) 2026 Seecr (Seek You Too B.V.) https://seecr.nl
+#
+# This file is part of "Meresco Harvester"
+#
+# "Meresco Harvester" is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# "Meresco Harvester" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "Meresco Harvester"; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+## end license ##
+
+
+from multiprocessing import get_context
+from multiprocessing.connection import wait as waitForConnections
+from time import time
+
+
+class WorkerPool(object):
+    """Runs job(argument) in size long-lived worker processes, so imports
+        and caches of a worker are reused by the next job. A worker that
+        dies, or whose job takes longer than timeout seconds, is replaced
+        by a new one; the job then finishes with an error."""
+    def __init__(self, job, size, timeout, _now=time):
+        self._job = job
+        self._size = size
+        self._timeout = timeout
+        self._now = _now
+        self._context = get_context('fork')
+        self._workers = []
+
+    def start(self):
+        self._workers = [self._startWorker() for i in range(self._size)]
+
+    def idle(self):
+        return len([worker for worker in self._workers if worker.argument is None])
+
+    def submit(self, argument):
+        worker = [worker for worker in self._workers if worker.argument is None][0]
+        if not worker.process.is_alive():
+            self._replace(worker)
+        worker.connection.send(argument)
+        worker.argument, worker.started = argument, self._now()
+
+    def wait(self, timeout=None):
+        """Waits until at least one job finishes or times out, or for at
+            most timeout seconds; returns (argument, result, error) for
+            every finished job."""
+        busy = [worker for worker in self._workers if worker.argument is not None]
+        if not busy:
+            return []
+        jobTimeout = max(0, min(worker.started + self._timeout for worker in busy) - self._now())
+        timeout = jobTimeout if timeout is None else min(timeout, jobTimeout)
+        ready = waitForConnections([worker.connection for worker in busy] + [worker.process.sentinel for worker in busy], timeout)
+        finished = []
+        for worker in busy:
+            if worker.connection in ready or worker.process.sentinel in ready:
+                try:
+                    result, error = worker.connection.recv()
+                except EOFError:
+                    result, error = None, 'Worker %s for %s died with exitcode %s.' % (worker.process.pid, worker.argument, self._exitcode(worker))
+                    self._replace(worker)
+                finished.append((worker.argument, result, error))
+            elif self._now() - worker.started >= self._timeout:
+                finished.append((worker.argument, None, 'Worker %s for %s timed out after %s seconds and is replaced.' % (worker.process.pid, worker.argument, self._timeout)))
+                self._replace(worker)
+            else:
+                continue
+            worker.argument, worker.started = None, None
+        return finished
+
+    def stop(self):
+        for worker in self._workers:
+            if worker.argument is None:
+                try:
+                    worker.connection.send(None)
+                except OSError:
+                    pass
+            else:
+                self._terminate(worker)
+        for worker in self._workers:
+            worker.process.join(5)
+            if worker.process.is_alive():
+                self._terminate(worker)
+        self._workers = []
+
+    def _startWorker(self):
+        connection, workerConnection = self._context.Pipe()
+        process = self._context.Process(target=_work, args=(self._job, workerConnection), daemon=True)
+        process.start()
+        workerConnection.close()
+        return _Worker(process, connection)
+
+    def _replace(self, worker):
+        self._terminate(worker)
+        replacement = self._startWorker()
+        worker.process, worker.connection = replacement.process, replacement.connection
+
+    def _terminate(self, worker):
+        worker.process.terminate()
+        worker.process.join(5)
+        if worker.process.is_alive():
+            worker.process.kill()
+            worker.process.join()
+        worker.connection.close()
+
+    def _exitcode(self, worker):
+        worker.process.join(1)
+        return worker.process.exitcode
+
+
+class _Worker(object):
+    def __init__(self, process, connection):
+        self.process = process
+        self.connection = connection
+        self.argument = None
+        self.started = None
+
+
+def _work(job, connection):
+    while True:
+        try:
+            argument = connection.recv()
+        except EOFError:
+            return
+        if argument is None:
+            return
+        try:
+            result, error = job(argument), None
+        except Exception as e:
+            result, error = None, '%s: %s' % (e.__class__.__name__, e)
+        connection.send((result, error))
@@ -45,6 +45,8 @@ cleanup(__file__)                                       #DO_NOT_DISTRIBUTE
 
 import unittest
 
+from concurrentuploadertest import ConcurrentUploaderTest
+from connectionpooltest import ConnectionPoolTest
 from datastoretest import DataStoreTest
 from deleteidstest import DeleteIdsTest
 from eventloggertest import EventLoggerTest
@@ -56,6 +58,7 @@ from harvesterdataretrievetest import HarvesterDataRetrieveTest
 from harvesterdatatest import HarvesterDataTest, HarvesterDataOldStyleTest
 from harvesterlogtest import HarvesterLogTest
 from harvestertest import HarvesterTest
+from hostlimitertest import HostLimiterTest
 from idstest import IdsTest
 from internalserverproxytest import InternalServerProxyTest
 from mappingtest import MappingTest
@@ -63,13 +66,17 @@ from oairequesttest import OaiRequestTest
 from onlineharvesttest import OnlineHarvestTest
 from repositorystatustest import RepositoryStatusTest
 from repositorytest import RepositoryTest
+from s3uploadertest import S3UploaderTest
+from scheduletest import ScheduleTest
 from smoothactiontest import SmoothActionTest
 from sruupdateuploadertest import SruUpdateUploaderTest
 from statetest import StateTest
+from statusindextest import StatusIndexTest
 from throughputanalysertest import ThroughputAnalyserTest
 from timedprocesstest import TimedProcessTest
 from timeslottest import TimeslotTest
 from useractionstest import UserActionsTest
+from workerpooltest import WorkerPoolTest
 from filterfieldstest import FilterFieldsTest
 
 if __name__ == '__main__':
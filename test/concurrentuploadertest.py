@@ -0,0 +1,210 @@
+## begin license ##
+#
+# "Meresco Harvester" consists of two subsystems, namely an OAI-harvester and
+# a web-control panel.
+# "Meresco Harvester" is originally called "Sahara" and was developed for
+# SURFnet by:
+# Seek You Too B.V. (CQ2) http://www.cq2.nl
+#
+# Copyright (C) 2026 Seecr (Seek You Too B.V.) https://seecr.nl
+#
+# This file is part of "Meresco Harvester"
+#
+# "Meresco Harvester" is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# "Meresco Harvester" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "Meresco Harvester"; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+## end license ##
+
+
+from seecr.test import SeecrTestCase, CallTrace
+
+from threading import Event, Lock, current_thread
+
+from mockoairequest import MockOaiRequest
+
+from meresco.harvester.concurrentuploader import ConcurrentUploader, QueuedLogger
+from meresco.harvester.mapping import Upload
+from meresco.harvester.namespaces import xpathFirst
+from meresco.harvester.virtualuploader import InvalidDataException, UploaderException
+
+
+class _Upload(object):
+    def __init__(self, id):
+        self.id = id
+
+
+class ConcurrentUploaderTest(SeecrTestCase):
+    def setUp(self):
+        SeecrTestCase.setUp(self)
+        self.done = []
+        self.lock = Lock()
+        self.exceptions = {}
+        self.rejectedByUploader = []
+        test = self
+        class Uploader(object):
+            def start(self):
+                test.done.append('start')
+            def stop(self):
+                test.done.append('stop')
+            def send(self, upload):
+                test.upload('send', upload)
+            def delete(self, upload):
+                test.upload('delete', upload)
+            def deleteMany(self, uploads):
+                with test.lock:
+                    test.done.append(('deleteMany', [upload.id for upload in uploads]))
+            def flushUploads(self):
+                return test.rejectedByUploader
+            def info(self):
+                return 'Uploader info'
+        self.eventlogger = CallTrace('eventlogger')
+        self.uploader = ConcurrentUploader(Uploader(), self.eventlogger, concurrency=3, queueSize=2)
+
+    def upload(self, action, upload):
+        exception = self.exceptions.get(upload.id)
+        if exception:
+            raise exception
+        with self.lock:
+            self.done.append((action, upload.id))
+
+    def testSynchronousWhenNotStarted(self):
+        self.uploader.send(_Upload('id:1'))
+        self.assertEqual([('send', 'id:1')], self.done)
+
+    def testOrderPerIdentifier(self):
+        self.uploader.start()
+        for i in range(20):
+            self.uploader.send(_Upload('id:%d' % i))
+            self.uploader.delete(_Upload('id:%d' % i))
+        self.assertEqual([], self.uploader.flushUploads())
+        self.uploader.stop()
+
+        self.assertEqual('start', self.done[0])
+        self.assertEqual('stop', self.done[-1])
+        uploads = self.done[1:-1]
+        self.assertEqual(40, len(uploads))
+        for i in range(20):
+            self.assertTrue(uploads.index(('send', 'id:%d' % i)) < uploads.index(('delete', 'id:%d' % i)))
+
+    def testUploadsRunConcurrently(self):
+        inFlight = Event()
+        release = Event()
+        ids = ['id:%d' % i for i in range(10)]
+        firstId = ids[0]
+        def upload(action, upload):
+            if upload.id == firstId:
+                inFlight.set()
+                release.wait(5)
+            with self.lock:
+                self.done.append((action, upload.id))
+        self.upload = upload
+        self.uploader.start()
+        self.uploader.send(_Upload(firstId))
+        self.assertTrue(inFlight.wait(5))
+        otherId = [anId for anId in ids if self.uploader._queueFor(anId) is not self.uploader._queueFor(firstId)][0]
+        self.uploader.send(_Upload(otherId))
+        self.uploader._queueFor(otherId).join()
+        self.assertEqual([('send', otherId)], self.done[1:])
+        release.set()
+        self.uploader.flushUploads()
+        self.assertEqual([('send', otherId), ('send', firstId)], self.done[1:])
+        self.uploader.stop()
+
+    def testDeleteManyIsSplitOverWorkers(self):
+        self.uploader.start()
+        ids = ['id:%d' % i for i in range(20)]
+        for anId in ids:
+            self.uploader.send(_Upload(anId))
+        self.uploader.deleteMany([_Upload(anId) for anId in ids])
+        self.uploader.flushUploads()
+        self.uploader.stop()
+        parts = [part for action, part in self.done[1:-1] if action == 'deleteMany']
+        self.assertEqual(3, len(parts))
+        self.assertEqual(sorted(ids), sorted(anId for part in parts for anId in part))
+        for part in parts:
+            self.assertEqual(1, len(set(self.uploader._queueIndex(anId) for anId in part)))
+            for anId in part:
+                self.assertTrue(self.done.index(('send', anId)) < self.done.index(('deleteMany', part)))
+
+    def testFlushReturnsRejected(self):
+        self.exceptions['id:2'] = InvalidDataException(uploadId='id:2', message='invalid')
+        self.rejectedByUploader = [InvalidDataException(uploadId='id:9', message='invalid')]
+        self.uploader.start()
+        for i in range(5):
+            self.uploader.send(_Upload('id:%d' % i))
+        rejected = self.uploader.flushUploads()
+        self.assertEqual(['id:2', 'id:9'], [e.uploadId for e in rejected])
+        self.assertEqual(4, len(self.done) - 1)
+        self.uploader.stop()
+
+    def testErrorRaisedOnFlush(self):
+        self.exceptions['id:2'] = UploaderException(uploadId='id:2', message='failed')
+        self.uploader.start()
+        for i in range(5):
+            self.uploader.send(_Upload('id:%d' % i))
+        try:
+            self.uploader.flushUploads()
+            self.fail()
+        except UploaderException as e:
+            self.assertEqual('id:2', e.uploadId)
+        self.uploader.stop()
+        self.assertEqual('stop', self.done[-1])
+
+    def testStopLogsRejected(self):
+        self.exceptions['id:1'] = InvalidDataException(uploadId='id:1', message='invalid')
+        self.uploader.start()
+        self.uploader.send(_Upload('id:1'))
+        self.uploader.stop()
+        self.assertEqual(['logWarning'], [m.name for m in self.eventlogger.calledMethods])
+        self.assertEqual(['start', 'stop'], self.done)
+
+    def testUploaderLogWrittenFromHarvesterThread(self):
+        loggedFrom = []
+        class EventLogger(object):
+            def logLine(self, event, comments, id=''):
+                loggedFrom.append((event, id, current_thread()))
+        uploaderLogger = QueuedLogger()
+        def upload(action, upload):
+            uploaderLogger.logLine('DELETE', 'Delete document', id=upload.id)
+        self.upload = upload
+        self.uploader = ConcurrentUploader(self.uploader._uploader, EventLogger(), concurrency=3, uploaderLogger=uploaderLogger)
+        self.uploader.start()
+        for i in range(5):
+            self.uploader.delete(_Upload('id:%d' % i))
+        self.uploader.flushUploads()
+        self.assertEqual(['id:%d' % i for i in range(5)], sorted(id for event, id, thread in loggedFrom))
+        self.assertEqual(set([current_thread()]), set(thread for event, id, thread in loggedFrom))
+        self.uploader.stop()
+
+    def testStreamedRecordsAreCopiedForWorkers(self):
+        release = Event()
+        def upload(action, upload):
+            release.wait(5)
+            with self.lock:
+                self.done.append((action, xpathFirst(upload.record, 'oai:header/oai:identifier/text()')))
+        self.upload = upload
+        repository = CallTrace('repository')
+        repository.id = 'repo'
+        response = MockOaiRequest('mocktud', streaming=True).listRecords(metadataPrefix='oai_dc')
+        self.uploader.start()
+        for record in response.records:
+            response.selectRecord(record)
+            self.uploader.send(Upload(repository=repository, oaiResponse=response))
+        release.set()
+        self.uploader.flushUploads()
+        self.uploader.stop()
+        self.assertEqual([('send', 'oai:tudelft.nl:007087'), ('send', 'oai:tudelft.nl:007192'), ('send', 'oai:tudelft.nl:007193')], sorted(self.done[1:-1]))
+
+    def testInfo(self):
+        self.assertEqual('Uploader info (concurrency: 3)', self.uploader.info())
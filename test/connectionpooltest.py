@@ -0,0 +1,134 @@
+## begin license ##
+#
+# "Meresco Harvester" consists of two subsystems, namely an OAI-harvester and
+# a web-control panel.
+# "Meresco Harvester" is originally called "Sahara" and was developed for
+# SURFnet by:
+# Seek You Too B.V. (CQ2) http://www.cq2.nl
+#
+# Copyright (C) 2026 Seecr (Seek You Too B.V.) https://seecr.nl
+#
+# This file is part of "Meresco Harvester"
+#
+# "Meresco Harvester" is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# "Meresco Harvester" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "Meresco Harvester"; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+## end license ##
+
+
+from seecr.test import SeecrTestCase
+
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from threading import Thread
+from urllib.error import HTTPError
+from urllib.request import Request
+
+from meresco.harvester.connectionpool import ConnectionPool
+
+
+class ConnectionPoolTest(SeecrTestCase):
+    def setUp(self):
+        SeecrTestCase.setUp(self)
+        self.requests = []
+        requests = self.requests
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            def do_GET(self):
+                requests.append((self.path, self.client_address[1]))
+                if self.path in ['/redirect', '/loop']:
+                    self.send_response(302)
+                    self.send_header('Location', '/page' if self.path == '/redirect' else '/loop')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                status = 404 if self.path == '/missing' else 200
+                body = ('body of %s' % self.path).encode()
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            def do_POST(self):
+                data = self.rfile.read(int(self.headers['Content-Length']))
+                requests.append((self.path, self.client_address[1]))
+                body = b'posted ' + data
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            def log_message(self, *args):
+                pass
+        self.server = HTTPServer(('localhost', 0), Handler)
+        self.port = self.server.server_address[1]
+        self.thread = Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.now = 1000.0
+        self.pool = ConnectionPool(maxConnections=1, idleTimeout=60, _now=lambda: self.now)
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        SeecrTestCase.tearDown(self)
+
+    def get(self, path):
+        with self.pool.urlopen(Request('http://localhost:%s%s' % (self.port, path)), timeout=5) as response:
+            return response.read()
+
+    def testReuseConnection(self):
+        self.assertEqual(b'body of /page?a=1', self.get('/page?a=1'))
+        self.assertEqual(b'body of /page?a=2', self.get('/page?a=2'))
+        self.assertEqual(['/page?a=1', '/page?a=2'], [path for path, clientPort in self.requests])
+        self.assertEqual(1, len(set(clientPort for path, clientPort in self.requests)))
+        self.assertEqual((1, 1), self.pool.counts('localhost:%s' % self.port))
+
+    def testIdleTimeout(self):
+        self.get('/page')
+        self.now += 61
+        self.get('/page')
+        self.assertEqual(2, len(set(clientPort for path, clientPort in self.requests)))
+        self.assertEqual((2, 0), self.pool.counts('localhost:%s' % self.port))
+
+    def testPartiallyReadResponseIsNotReused(self):
+        with self.pool.urlopen(Request('http://localhost:%s/page' % self.port), timeout=5) as response:
+            response.read(2)
+        self.get('/page')
+        self.assertEqual((2, 0), self.pool.counts('localhost:%s' % self.port))
+
+    def testFollowRedirect(self):
+        self.assertEqual(b'body of /page', self.get('/redirect'))
+        self.assertEqual(['/redirect', '/page'], [path for path, clientPort in self.requests])
+        self.assertEqual((1, 1), self.pool.counts('localhost:%s' % self.port))
+
+    def testTooManyRedirects(self):
+        try:
+            self.get('/loop')
+            self.fail()
+        except HTTPError as e:
+            self.assertEqual(302, e.code)
+            self.assertTrue('Too many redirects' in e.reason, e.reason)
+        self.assertEqual(['/loop'] * 6, [path for path, clientPort in self.requests])
+
+    def testPostReusesConnection(self):
+        for data in [b'one', b'two']:
+            with self.pool.urlopen(Request('http://localhost:%s/update' % self.port, data=data), timeout=5) as response:
+                self.assertEqual(b'posted ' + data, response.read())
+        self.assertEqual((1, 1), self.pool.counts('localhost:%s' % self.port))
+
+    def testHttpError(self):
+        try:
+            self.get('/missing')
+            self.fail()
+        except HTTPError as e:
+            self.assertEqual(404, e.code)
@@ -27,9 +27,11 @@
 #
 ## end license ##
 
+from os.path import join
+
 from seecr.test import SeecrTestCase
 
-from meresco.harvester.datastore import DataStore, OldDataStore
+from meresco.harvester.datastore import DataStore, OldDataStore, CHECK_INTERVAL
 
 class DataStoreTest(SeecrTestCase):
     def setUp(self):
@@ -38,7 +40,8 @@ class DataStoreTest(SeecrTestCase):
         def idfn():
             self.n += 1
             return 'mock:{}'.format(self.n)
-        self.store = DataStore(self.tempdir, id_fn=idfn)
+        self.now = 0.0
+        self.store = DataStore(self.tempdir, id_fn=idfn, _time=lambda: self.now)
 
     def testData(self):
         self.store.addData('mijnidentifier', 'datatype', {'mijn':'data'})
@@ -58,5 +61,47 @@ class DataStoreTest(SeecrTestCase):
         self.store.addData('nr:3', 'other', {'mijn':'data'})
         self.assertEqual(['nr:1', 'nr:2'], self.store.listForDatatype('datatype'))
 
+    def testCachedDataNoticesExternalEdits(self):
+        self.store.addData('nr:1', 'datatype', {'mijn':'data'})
+        cached = self.store.getCachedData('nr:1', 'datatype')
+        self.assertTrue(cached is self.store.getCachedData('nr:1', 'datatype'))
+        self.assertFalse(cached is self.store.getData('nr:1', 'datatype'))
+        with open(join(self.tempdir, 'nr:1.datatype'), 'w') as f:
+            f.write('{"mijn": "other data", "@id": "external"}')
+        self.assertEqual('data', self.store.getCachedData('nr:1', 'datatype')['mijn'])
+        self.now += CHECK_INTERVAL
+        self.assertEqual('other data', self.store.getCachedData('nr:1', 'datatype')['mijn'])
+        self.assertEqual('other data', self.store.getData('nr:1', 'datatype')['mijn'])
+
+        self.store.deleteData('nr:1', 'datatype')
+        self.assertRaises(ValueError, lambda: self.store.getCachedData('nr:1', 'datatype'))
+        self.assertEqual([], self.store.listForDatatype('datatype'))
+
+    def testDataIsCopiedFromCache(self):
+        self.store.addData('nr:1', 'datatype', {'mijn': {'nested': ['data']}})
+        d = self.store.getData('nr:1', 'datatype')
+        d['mijn']['nested'].append('changed')
+        self.assertEqual({'nested': ['data']}, self.store.getData('nr:1', 'datatype')['mijn'])
+
+    def testHistoryIsNotCached(self):
+        self.store.addData('nr:1', 'datatype', {'mijn': 'data'})
+        self.store.addData('nr:1', 'datatype', self.store.getData('nr:1', 'datatype'))
+        self.assertEqual({'mijn': 'data', '@id': 'mock:1'}, self.store.getData('nr:1', 'datatype', 'mock:1'))
+        with open(join(self.tempdir, '_', 'nr:1.datatype.mock:1'), 'w') as f:
+            f.write('{"mijn": "other data", "@id": "mock:1"}')
+        self.assertEqual('other data', self.store.getData('nr:1', 'datatype', 'mock:1')['mijn'])
+        self.assertEqual('mock:2', self.store.getData('nr:1', 'datatype', 'mock:2')['@id'])
+        self.assertRaises(ValueError, lambda: self.store.getData('nr:1', 'datatype', 'mock:3'))
+
+    def testOldDataStoreCache(self):
+        store = OldDataStore(join(self.tempdir, 'old'))
+        store.addData('nr:1', 'datatype', {'mijn':'data'})
+        self.assertEqual({'mijn': 'data'}, store.getCachedData('nr:1', 'datatype'))
+        store.addData('nr:1', 'datatype', {'mijn':'more data'})
+        self.assertEqual({'mijn': 'more data'}, store.getData('nr:1', 'datatype'))
+        self.assertEqual(['nr:1'], store.listForDatatype('datatype'))
+        store.addData('nr:2', 'datatype', {})
+        self.assertEqual(['nr:1', 'nr:2'], store.listForDatatype('datatype'))
+
     def testGuid(self):
         self.assertRaises(NotImplementedError, lambda: self.store.getGuid('someid'))
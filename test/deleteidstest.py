@@ -33,8 +33,10 @@
 
 from seecr.test import SeecrTestCase, CallTrace
 from meresco.components import Bucket
-from meresco.harvester.deleteids import DeleteIds
-from meresco.harvester.ids import Ids, readIds
+from meresco.harvester.deleteids import DeleteIds, DeleteProgress
+from meresco.harvester.ids import Ids, readIds, writeIds
+from meresco.harvester.virtualuploader import InvalidDataException
+from os import listdir
 from os.path import join
 
 class DeleteIdsTest(SeecrTestCase):
@@ -45,25 +47,29 @@ class DeleteIdsTest(SeecrTestCase):
             for i in range(10):
                 ids.add('id:{}'.format(i))
 
-            deleteIds = DeleteIds(Bucket(id='test'), self.tempdir)
+            deleteIds = DeleteIds(Bucket(id='test'), self.tempdir, batchSize=3)
 
-            def delete(anUpload):
-                if anUpload.id == 'id:7':
+            deleted = []
+            def deleteMany(uploads):
+                if 'id:7' in [anUpload.id for anUpload in uploads]:
                     raise ValueError('fout')
+                deleted.extend(anUpload.id for anUpload in uploads)
             observer = CallTrace(methods=dict(
                 getIds=lambda **kwargs: ids.getIds(),
-                delete=delete,
-                deleteIdentifier=ids.remove,
+                deleteMany=deleteMany,
+                flushUploads=lambda: [],
+                deleteIdentifiers=ids.removeMany,
                 flushIds=lambda **kwargs: ids.reopen()))
             deleteIds.addObserver(observer)
             self.assertRaises(ValueError, lambda: deleteIds.delete())
-            self.assertEqual(['id:7', 'id:8','id:9'], readIds(join(self.tempdir, 'test.ids')))
-            self.assertEqual(8, len([m for m in observer.calledMethodNames() if m == 'delete']))
+            self.assertEqual(['id:6', 'id:7', 'id:8', 'id:9'], readIds(join(self.tempdir, 'test.ids')))
+            self.assertEqual(['id:0', 'id:1', 'id:2', 'id:3', 'id:4', 'id:5'], deleted)
+            logError = [m for m in observer.calledMethods if m.name == 'logError'][0]
+            self.assertEqual('id:6', logError.kwargs['id'])
         finally:
             ids.close()
 
     def testDeleteWithBatches(self):
-        observer = CallTrace()
         ids = Ids(self.tempdir, "test")
         try:
             for i in range(10):
@@ -71,22 +77,108 @@ class DeleteIdsTest(SeecrTestCase):
             deleteIds = DeleteIds(Bucket(id='test'), self.tempdir, batchSize=3)
 
             batches = []
-            def reopen():
-                with open(join(self.tempdir, "test.ids")) as fp:
-                    batches.append(len(fp.readlines()))
-                ids.reopen()
+            def deleteIdentifiers(batch):
+                ids.removeMany(batch)
+                batches.append(len(readIds(join(self.tempdir, "test.ids"))))
 
             observer = CallTrace(methods=dict(
                 getIds=lambda **kwargs: ids.getIds(),
-                deleteIdentifier=ids.remove,
-                flushIds=lambda **kwargs: reopen()))
+                flushUploads=lambda: [],
+                deleteIdentifiers=deleteIdentifiers,
+                flushIds=lambda **kwargs: ids.reopen()))
             deleteIds.addObserver(observer)
 
             deleteIds.delete()
-            self.assertEqual(4, len([m for m in observer.calledMethodNames() if m == 'flushIds']))
-            self.assertEqual(10, len([m for m in observer.calledMethodNames() if m == 'delete']))
-            self.assertEqual(10, len([m for m in observer.calledMethodNames() if m == 'deleteIdentifier']))
+            self.assertEqual(1, len([m for m in observer.calledMethodNames() if m == 'flushIds']))
+            self.assertEqual([3, 3, 3, 1], [len(m.args[0]) for m in observer.calledMethods if m.name == 'deleteMany'])
+            self.assertEqual(10, len([m for m in observer.calledMethodNames() if m == 'notifyHarvestedRecord']))
             self.assertEqual([], readIds(join(self.tempdir, 'test.ids')))
             self.assertEqual([7, 4, 1, 0], batches)
+            self.assertEqual(['test.ids'], listdir(self.tempdir))
         finally:
             ids.close()
+
+    def testRejectedDeleteKeepsId(self):
+        ids = Ids(self.tempdir, "test")
+        try:
+            for i in range(5):
+                ids.add('id:{}'.format(i))
+            deleteIds = DeleteIds(Bucket(id='test'), self.tempdir, batchSize=3)
+            observer = CallTrace(methods=dict(
+                getIds=lambda **kwargs: ids.getIds(),
+                flushUploads=lambda: [InvalidDataException(uploadId='id:1', message='rejected')],
+                deleteIdentifiers=ids.removeMany,
+                flushIds=lambda **kwargs: ids.reopen()))
+            deleteIds.addObserver(observer)
+
+            deleteIds.delete()
+            self.assertEqual(['id:1'], readIds(join(self.tempdir, 'test.ids')))
+            self.assertEqual([['id:0', 'id:2'], ['id:3', 'id:4']], [m.args[0] for m in observer.calledMethods if m.name == 'deleteIdentifiers'])
+            logWarning = [m for m in observer.calledMethods if m.name == 'logWarning'][0]
+            self.assertEqual('id:1', logWarning.kwargs['id'])
+        finally:
+            ids.close()
+
+    def testInterruptedDeleteResumesAtOffset(self):
+        filename = join(self.tempdir, 'test.ids.delete')
+        writeIds(filename, ['id:{}'.format(i) for i in range(10)])
+        deleteIds = DeleteIds(Bucket(id='test'), self.tempdir, batchSize=3)
+        deleted = []
+        failOn = ['id:7']
+        def deleteMany(uploads):
+            if set(failOn).intersection(anUpload.id for anUpload in uploads):
+                raise ValueError('fout')
+            deleted.extend(anUpload.id for anUpload in uploads)
+        observer = CallTrace(methods=dict(
+            getIds=lambda **kwargs: readIds(filename),
+            deleteMany=deleteMany,
+            flushUploads=lambda: []))
+        deleteIds.addObserver(observer)
+        self.assertRaises(ValueError, lambda: deleteIds.deleteFile(filename))
+        self.assertEqual(['id:0', 'id:1', 'id:2', 'id:3', 'id:4', 'id:5'], deleted)
+        self.assertEqual([], [m for m in observer.calledMethods if m.name == 'deleteIdentifiers'])
+
+        del failOn[:]
+        deleteIds.deleteFile(filename)
+        self.assertEqual(['id:{}'.format(i) for i in range(10)], deleted)
+        self.assertEqual(['test.ids.delete'], listdir(self.tempdir))
+
+    def testTimeBudget(self):
+        filename = join(self.tempdir, 'test.ids.delete')
+        writeIds(filename, ['id:{}'.format(i) for i in range(10)])
+        now = [100.0]
+        def deleteMany(uploads):
+            now[0] += 1.0
+        observer = CallTrace(methods=dict(
+            getIds=lambda **kwargs: readIds(filename),
+            deleteMany=deleteMany,
+            flushUploads=lambda: []))
+        deleteIds = DeleteIds(Bucket(id='test'), self.tempdir, batchSize=3, _now=lambda: now[0])
+        deleteIds.addObserver(observer)
+
+        self.assertEqual(False, deleteIds.deleteFile(filename, timeBudget=2))
+        self.assertEqual([{'done': 3, 'remaining': 7, 'rate': 3.0}, {'done': 6, 'remaining': 4, 'rate': 3.0}],
+            [m.kwargs for m in observer.calledMethods if m.name == 'markDeleteProgress'])
+        self.assertEqual([], [m for m in observer.calledMethods if m.name == 'clearDeleteProgress'])
+
+        del observer.calledMethods[:]
+        self.assertEqual(True, deleteIds.deleteFile(filename, timeBudget=2))
+        self.assertEqual([['id:6', 'id:7', 'id:8'], ['id:9']], [[u.id for u in m.args[0]] for m in observer.calledMethods if m.name == 'deleteMany'])
+        self.assertEqual(1, len([m for m in observer.calledMethods if m.name == 'clearDeleteProgress']))
+
+    def testChangedIdsStartOver(self):
+        filename = join(self.tempdir, 'test.ids.delete')
+        writeIds(filename, ['id:1', 'id:2'])
+        progress = DeleteProgress(filename)
+        progress.start(['id:0', 'id:1', 'id:2'])
+        progress.checkpoint(2)
+        self.assertEqual(2, DeleteProgress(filename).start(['id:0', 'id:1', 'id:2']))
+        deleted = []
+        observer = CallTrace(methods=dict(
+            getIds=lambda **kwargs: readIds(filename),
+            deleteMany=lambda uploads: deleted.extend(anUpload.id for anUpload in uploads),
+            flushUploads=lambda: []))
+        deleteIds = DeleteIds(Bucket(id='test'), self.tempdir)
+        deleteIds.addObserver(observer)
+        deleteIds.deleteFile(filename)
+        self.assertEqual(['id:1', 'id:2'], deleted)
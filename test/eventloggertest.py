@@ -36,9 +36,10 @@
 ## end license ##
 
 import re
-from os.path import join
-from meresco.harvester.eventlogger import StreamEventLogger, EventLogger, LOGLINE_RE, CompositeLogger
+from os.path import join, isfile
+from meresco.harvester.eventlogger import StreamEventLogger, EventLogger, LOGLINE_RE, CompositeLogger, readEventLines, readEventLinesReversed, eventsFilenames
 from io import StringIO
+from time import sleep
 
 from seecr.test import SeecrTestCase
 
@@ -53,9 +54,9 @@ class EventLoggerTest(SeecrTestCase):
         self.logfile = open(self._eventLogFile, 'r+')
 
     def tearDown(self):
-        super(EventLoggerTest, self).tearDown()
         self.logfile.close()
         self.logger.close()
+        super(EventLoggerTest, self).tearDown()
 
     def readLogLine(self):
         line = self.logfile.readline().strip()
@@ -158,13 +159,102 @@ class EventLoggerTest(SeecrTestCase):
         self.logger.logLine('SUCCES','Some logline 2')
         self.logger.logLine('SUCCES','Some logline 3')
         self.logger.logLine('SUCCES','Some logline 4')
-        with open(self._eventLogFile,'r+') as logfile:
-            self.assertEqual('SUCCES\t[]\tSome logline 3', logfile.readline().strip()[DATELENGTH:])
+        self.assertEqual('SUCCES\t[]\tSome logline 3', next(readEventLines(self._eventLogFile)).strip()[DATELENGTH:])
 
         self.logger.logLine('SUCCES','Some logline 5')
-        with open(self._eventLogFile,'r+') as logfile:
-            self.assertEqual('SUCCES\t[]\tSome logline 3', logfile.readline().strip()[DATELENGTH:])
+        self.assertEqual('SUCCES\t[]\tSome logline 3', next(readEventLines(self._eventLogFile)).strip()[DATELENGTH:])
 
         self.logger.logLine('SUCCES','Some logline 6')
-        with open(self._eventLogFile,'r+') as logfile:
-            self.assertEqual('SUCCES\t[]\tSome logline 5', logfile.readline().strip()[DATELENGTH:])
+        self.assertEqual('SUCCES\t[]\tSome logline 5', next(readEventLines(self._eventLogFile)).strip()[DATELENGTH:])
+        self.assertEqual([self._eventLogFile + '.3', self._eventLogFile], eventsFilenames(self._eventLogFile))
+        self.assertFalse(isfile(self._eventLogFile + '.1'))
+
+    def testLineCountFromIndex(self):
+        self.logger.close()
+        self.logger = EventLogger(self._eventLogFile, maxLogLines=10)
+        for i in range(3):
+            self.logger.logLine('SUCCES', 'line %s' % i)
+        self.logger.close()
+        self.assertTrue(isfile(self._eventLogFile + '.index'))
+
+        with open(self._eventLogFile, 'a') as f:
+            f.write('[2021-01-01 00:00:00.000]\tINFO\t[]\twritten without index update\n')
+        self.logger = EventLogger(self._eventLogFile, maxLogLines=10)
+        self.assertEqual(4, self.logger._numberOfLogLines)
+        self.logger.logLine('SUCCES', 'line 4')
+        self.assertEqual([self._eventLogFile + '.1', self._eventLogFile], eventsFilenames(self._eventLogFile))
+        self.assertEqual(5, len(list(readEventLines(self._eventLogFile))))
+
+    def testLogfileWithoutIndexIsCounted(self):
+        self.logger.close()
+        with open(self._eventLogFile, 'w') as f:
+            for i in range(6):
+                f.write('[2021-01-01 00:00:00.000]\tINFO\t[]\tline %s\n' % i)
+        self.logger = EventLogger(self._eventLogFile, maxLogLines=10)
+        self.assertEqual(6, self.logger._numberOfLogLines)
+        self.logger.logLine('SUCCES', 'line 6')
+        self.assertEqual([self._eventLogFile + '.1', self._eventLogFile], eventsFilenames(self._eventLogFile))
+        self.assertEqual(7, len(list(readEventLines(self._eventLogFile))))
+
+    def testBufferedLogger(self):
+        self.logger.close()
+        now = [1000.0]
+        self.logger = EventLogger(self._eventLogFile, bufferSize=1000, flushInterval=5, _now=lambda: now[0])
+        self.logger.logLine('UPLOAD.SEND', 'START', id='id:1')
+        self.logger.logLine('UPLOAD.SEND', 'END', id='id:1')
+        self.assertEqual('', self.logfile.read())
+
+        self.logger.logSuccess('done', id='repo')
+        self.assertEqual([
+                'UPLOAD.SEND\t[id:1]\tSTART',
+                'UPLOAD.SEND\t[id:1]\tEND',
+                'SUCCES\t[repo]\tdone',
+            ], [line.strip()[DATELENGTH:] for line in self.logfile.readlines()])
+
+        self.logger.logLine('DELETE', 'Delete document', id='id:2')
+        self.assertEqual('', self.logfile.read())
+        now[0] += 5
+        self.logger.logLine('DELETE', 'Delete document', id='id:3')
+        self.assertEqual(2, len(self.logfile.readlines()))
+
+    def testBufferedLoggerFlushesOnSize(self):
+        self.logger.close()
+        self.logger = EventLogger(self._eventLogFile, bufferSize=100)
+        self.logger.logLine('INFO', 'a' * 50)
+        self.assertEqual('', self.logfile.read())
+        self.logger.logLine('INFO', 'b' * 50)
+        self.assertEqual(2, len(self.logfile.readlines()))
+
+    def testBufferedLoggerFlushesWithoutNewLines(self):
+        self.logger.close()
+        self.logger = EventLogger(self._eventLogFile, bufferSize=1000, flushInterval=0.01)
+        self.logger.logLine('INFO', 'waiting')
+        for i in range(100):
+            lines = self.logfile.readlines()
+            if lines:
+                break
+            sleep(0.01)
+        self.assertEqual(['INFO\t[]\twaiting'], [line.strip()[DATELENGTH:] for line in lines])
+
+    def testBufferedLoggerFlushesOnClose(self):
+        self.logger.close()
+        self.logger = EventLogger(self._eventLogFile, bufferSize=1000)
+        self.logger.logLine('INFO', 'info')
+        self.logger.logLine('ENDHARVEST', '')
+        self.logger.logLine('INFO', 'after')
+        self.assertEqual(2, len(self.logfile.readlines()))
+        self.logger.close()
+        self.assertEqual('INFO\t[]\tafter', self.logfile.readline().strip()[DATELENGTH:])
+
+    def testReadEventLinesReversed(self):
+        self.logger.close()
+        with open(self._eventLogFile + '.1', 'w') as f:
+            f.write('line 1\nline 2 \u00e9\u00e9n\n')
+        with open(self._eventLogFile, 'w') as f:
+            f.write('line 3\n\nline 4 \u00e9\u00e9n')
+        with open(self._eventLogFile + '.index', 'w') as f:
+            f.write('{"segments": [[1, 2]], "lines": 2, "size": 0}')
+        expected = ['line 4 \u00e9\u00e9n', 'line 3', 'line 2 \u00e9\u00e9n', 'line 1']
+        for blockSize in [1, 2, 3, 7, 1024]:
+            self.assertEqual(expected, list(readEventLinesReversed(self._eventLogFile, blockSize=blockSize)))
+        self.assertEqual([], list(readEventLinesReversed(join(self.tempdir, 'doesnotexist'))))
@@ -36,11 +36,12 @@
 #
 ## end license ##
 
-from meresco.harvester.filesystemuploader import FileSystemUploader
+from meresco.harvester.filesystemuploader import FileSystemUploader, shardDirectories, readManifest, migrateRepositoryDirectory
 from meresco.harvester.virtualuploader import UploaderException
 from seecr.test import CallTrace, SeecrTestCase
 import os, shutil
 from tempfile import mkdtemp
+from hashlib import sha1
 from meresco.harvester.mapping import Upload
 
 from os.path import isfile, join
@@ -56,6 +57,11 @@ class FileSystemUploaderTest(SeecrTestCase):
         self.target = CallTrace("Target")
         self.target.path = self.tempdir
         self.target.oaiEnvelope = False
+        self.target.batchSize = None
+        self.target.fsync = None
+        self.target.shardLevels = None
+        self.target.shardWidth = None
+        self.target.manifest = None
         logger = CallTrace("Logger")
         collection = None
         self.uploader = FileSystemUploader(self.target, logger, collection)
@@ -108,6 +114,25 @@ class FileSystemUploaderTest(SeecrTestCase):
         with open(DELETED_RECORDS) as fp:
             self.assertEqual(['id\n', 'second:id\n'], fp.readlines())
 
+    def testDeleteMany(self):
+        repository = CallTrace('Repository')
+        repository.repositoryGroupId = 'groupId'
+        repository.id = 'repositoryId'
+        uploads = []
+        for anId in ['id:1', 'id:2', 'id:3']:
+            upload = Upload(repository=repository)
+            upload.id = anId
+            uploads.append(upload)
+        os.makedirs(join(self.tempdir, 'groupId', 'repositoryId'))
+        for upload in uploads[:2]:
+            open(self.uploader._filenameFor(upload), 'w').close()
+
+        self.uploader.deleteMany(uploads)
+
+        self.assertEqual([], os.listdir(join(self.tempdir, 'groupId', 'repositoryId')))
+        with open(join(self.tempdir, 'deleted_records')) as fp:
+            self.assertEqual(['id:1\n', 'id:2\n', 'id:3\n'], fp.readlines())
+
     def testDeleteWithOaiEnvelope(self):
         RECORD_FILENAME = join(self.tempdir, 'id.record')
         self.uploader._filenameFor = lambda *args: RECORD_FILENAME
@@ -214,6 +239,160 @@ class FileSystemUploaderTest(SeecrTestCase):
         self.testSend()
         self.testSend()
 
+    def testExistingDirectoriesAreRemembered(self):
+        upload = createUpload()
+        upload.repository.repositoryGroupId = 'group'
+        self.uploader.send(upload)
+        directory = join(self.tempdir, 'group', 'repoId')
+        self.assertTrue(isfile(join(directory, 'id.record')))
+        self.assertTrue(directory in self.uploader._directories)
+        made = []
+        originalMakedirs = os.makedirs
+        os.makedirs = lambda *args, **kwargs: made.append(args)
+        try:
+            upload.id = 'id2'
+            self.uploader.send(upload)
+        finally:
+            os.makedirs = originalMakedirs
+        self.assertEqual([], made)
+        self.assertTrue(isfile(join(directory, 'id2.record')))
+
+    def testWriteInBatches(self):
+        self.target.batchSize = '3'
+        self.uploader = FileSystemUploader(self.target, CallTrace("Logger"), None)
+        upload = createUpload()
+        upload.repository.repositoryGroupId = 'group'
+        directory = join(self.tempdir, 'group', 'repoId')
+        for anId in ['id1', 'id2']:
+            upload.id = anId
+            self.uploader.send(upload)
+        self.assertFalse(isfile(join(directory, 'id1.record')))
+        self.assertEqual([], self.uploader.flushUploads())
+        self.assertEqual(['id1.record', 'id2.record'], sorted(os.listdir(directory)))
+        for anId in ['id3', 'id4', 'id5']:
+            upload.id = anId
+            self.uploader.send(upload)
+        self.assertEqual(['id1.record', 'id2.record', 'id3.record', 'id4.record', 'id5.record'], sorted(os.listdir(directory)))
+
+    def testDeleteWritesPendingUploadsFirst(self):
+        self.target.batchSize = '10'
+        self.uploader = FileSystemUploader(self.target, CallTrace("Logger"), None)
+        upload = createUpload()
+        upload.repository.repositoryGroupId = 'group'
+        self.uploader.send(upload)
+        self.uploader.delete(upload)
+        self.uploader.flushUploads()
+        self.assertEqual([], os.listdir(join(self.tempdir, 'group', 'repoId')))
+
+    def testFsyncWhenUploadsAreFlushed(self):
+        synced = []
+        self.target.fsync = True
+        self.uploader = FileSystemUploader(self.target, CallTrace("Logger"), None, _fsync=synced.append)
+        upload = createUpload()
+        upload.repository.repositoryGroupId = 'group'
+        for anId in ['id1', 'id2']:
+            upload.id = anId
+            self.uploader.send(upload)
+        self.assertEqual([], synced)
+        self.uploader.flushUploads()
+        self.assertEqual(3, len(synced))
+        self.uploader.flushUploads()
+        self.assertEqual(3, len(synced))
+
+    def testShardDirectories(self):
+        self.assertEqual([], shardDirectories('id.record', 0))
+        self.assertEqual(['5f', '50'], shardDirectories('id.record', 2))
+        self.assertEqual(['5', 'f', '5'], shardDirectories('id.record', 3, width=1))
+
+    def testShardedFilename(self):
+        self.target.shardLevels = '2'
+        self.target.shardWidth = '1'
+        self.uploader = FileSystemUploader(self.target, CallTrace("Logger"), None)
+        upload = createUpload()
+        upload.repository.repositoryGroupId = 'group'
+        self.assertEqual(join(self.tempdir, 'group', 'repoId', '5', 'f', 'id.record'), self.uploader._filenameFor(upload))
+        self.uploader.send(upload)
+        self.assertTrue(isfile(join(self.tempdir, 'group', 'repoId', '5', 'f', 'id.record')))
+
+    def testShardedDeleteKeepsDeletedIdsPerRepository(self):
+        self.target.shardLevels = '1'
+        self.uploader = FileSystemUploader(self.target, CallTrace("Logger"), None)
+        upload = createUpload()
+        upload.repository.repositoryGroupId = 'group'
+        self.uploader.send(upload)
+        self.uploader.delete(upload)
+        self.assertFalse(isfile(join(self.tempdir, 'group', 'repoId', '5f', 'id.record')))
+        self.assertFalse(isfile(join(self.tempdir, 'deleted_records')))
+        with open(join(self.tempdir, 'group', 'repoId', 'deleted_records')) as fp:
+            self.assertEqual('id\n', fp.read())
+
+    def testManifest(self):
+        self.target.shardLevels = '1'
+        self.target.manifest = True
+        self.uploader = FileSystemUploader(self.target, CallTrace("Logger"), None)
+        upload = createUpload()
+        upload.repository.repositoryGroupId = 'group'
+        for anId in ['id1', 'id2']:
+            upload.id = anId
+            self.uploader.send(upload)
+        self.uploader.delete(upload)
+        repositoryDirectory = join(self.tempdir, 'group', 'repoId')
+        with open(join(repositoryDirectory, 'records.manifest')) as fp:
+            lines = fp.read().split('\n')
+        self.assertEqual(4, len(lines))
+        self.assertEqual('-\t' + '74/id2.record'.replace('/', '%2F'), lines[2])
+        relativeName = join(shardDirectories('id1.record', 1)[0], 'id1.record')
+        with open(join(repositoryDirectory, relativeName), 'rb') as fp:
+            checksum = sha1(fp.read()).hexdigest()
+        self.assertEqual({relativeName: checksum}, readManifest(join(repositoryDirectory, 'records.manifest')))
+
+    def testMigrateRepositoryDirectory(self):
+        upload = createUpload()
+        upload.repository.repositoryGroupId = 'group'
+        for anId in ['id1', 'id2', 'id3']:
+            upload.id = anId
+            self.uploader.send(upload)
+        repositoryDirectory = join(self.tempdir, 'group', 'repoId')
+        with open(join(repositoryDirectory, 'other'), 'w') as fp:
+            fp.write('not a record')
+
+        self.assertEqual(3, migrateRepositoryDirectory(repositoryDirectory, 2, width=1, manifest=True))
+        expected = [join(*(shardDirectories(name, 2, width=1) + [name])) for name in ['id1.record', 'id2.record', 'id3.record']]
+        for relativeName in expected:
+            self.assertTrue(isfile(join(repositoryDirectory, relativeName)), relativeName)
+        self.assertEqual(set(expected), set(readManifest(join(repositoryDirectory, 'records.manifest'))))
+        self.assertTrue(isfile(join(repositoryDirectory, 'other')))
+        self.assertEqual(0, migrateRepositoryDirectory(repositoryDirectory, 2, width=1))
+
+        self.assertEqual(3, migrateRepositoryDirectory(repositoryDirectory, 0))
+        self.assertEqual(['id1.record', 'id2.record', 'id3.record', 'other', 'records.manifest'], sorted(os.listdir(repositoryDirectory)))
+        self.assertEqual({'id1.record', 'id2.record', 'id3.record'}, set(readManifest(join(repositoryDirectory, 'records.manifest'))))
+
+    def testMigrateWithoutManifestLeavesNoManifest(self):
+        upload = createUpload()
+        upload.repository.repositoryGroupId = 'group'
+        self.uploader.send(upload)
+        repositoryDirectory = join(self.tempdir, 'group', 'repoId')
+        self.assertEqual(1, migrateRepositoryDirectory(repositoryDirectory, 1))
+        self.assertFalse(isfile(join(repositoryDirectory, 'records.manifest')))
+
+    def testManifestIsCompacted(self):
+        self.target.manifest = True
+        self.uploader = FileSystemUploader(self.target, CallTrace("Logger"), None, compactAfter=3)
+        upload = createUpload()
+        upload.repository.repositoryGroupId = 'group'
+        manifestFilename = join(self.tempdir, 'group', 'repoId', 'records.manifest')
+        def manifestLines():
+            with open(manifestFilename) as fp:
+                return fp.read().split('\n')[:-1]
+        self.uploader.send(upload)
+        self.uploader.send(upload)
+        self.assertEqual(2, len(manifestLines()))
+        self.uploader.delete(upload)
+        self.assertEqual([], manifestLines())
+        self.uploader.send(upload)
+        self.assertEqual(['%s\tid.record' % readManifest(manifestFilename)['id.record']], manifestLines())
+
 def createUpload(about=None):
     repository = CallTrace('repository')
     repository.id = 'repoId'
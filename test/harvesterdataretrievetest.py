@@ -99,3 +99,20 @@ class HarvesterDataRetrieveTest(SeecrTestCase):
         self.assertEqual({'request': {'verb': 'AddObserver', 'argument': 'value'}, 'error': {'message': 'Value of the verb argument is not a legal verb, the verb argument is missing, or the verb argument is repeated.', 'code': 'badVerb'}}, JsonDict.loads(body))
         self.assertEqual([], mockHarvesterData.calledMethodNames())
 
+    def testGetDomainSnapshotWithETag(self):
+        dataRetrieve, mockHarvesterData = setupDataRetrieve(getDomainSnapshot={'domain': {'identifier': 'adomain'}}, getDataVersion='v1')
+        header, body = doRequest(dataRetrieve, verb=['GetDomainSnapshot'], domainId=['adomain'])
+        self.assertTrue(header.startswith('HTTP/1.0 200 OK'), header)
+        etag = [line.split(': ', 1)[1] for line in header.split(CRLF) if line.startswith('ETag: ')][0]
+        self.assertEqual({'domain': {'identifier': 'adomain'}}, JsonDict.loads(body)['response']['GetDomainSnapshot'])
+
+        result = asString(dataRetrieve.handleRequest(path='/get', arguments=dict(verb=['GetDomainSnapshot'], domainId=['adomain']), Headers={'If-None-Match': etag}))
+        self.assertEqual('HTTP/1.0 304 Not Modified' + CRLF + 'ETag: ' + etag + CRLF * 2, result)
+        self.assertEqual(['getDataVersion', 'getDomainSnapshot', 'getDataVersion'], mockHarvesterData.calledMethodNames())
+
+        mockHarvesterData.returnValues['getDataVersion'] = 'v2'
+        result = asString(dataRetrieve.handleRequest(path='/get', arguments=dict(verb=['GetDomainSnapshot'], domainId=['adomain']), Headers={'If-None-Match': etag}))
+        self.assertTrue(result.startswith('HTTP/1.0 200 OK'))
+
+        result = asString(dataRetrieve.handleRequest(path='/get', arguments=dict(verb=['GetDomainSnapshot'], domainId=['adomain']), Headers={'If-None-Match': '"other"'}))
+        self.assertTrue(result.startswith('HTTP/1.0 200 OK'))
@@ -30,11 +30,12 @@
 #
 ## end license ##
 
+from os import remove
 from os.path import join, isfile
 from seecr.test import SeecrTestCase
 
 from meresco.harvester.harvesterdata import HarvesterData
-from meresco.harvester.datastore import OldDataStore, DataStore
+from meresco.harvester.datastore import OldDataStore, DataStore, CHECK_INTERVAL
 
 DATA = {
     'adomain.domain': """{
@@ -81,6 +82,7 @@ class _HarvesterDataTest(SeecrTestCase):
             with open(join(self.tempdir, fname), "w") as fp:
                 fp.write(data)
         self.n = 0
+        self.now = 0.0
         def mock_id():
             self.n+=1
             return 'mock-id: %s' % self.n
@@ -96,6 +98,41 @@ class _HarvesterDataTest(SeecrTestCase):
     def testGetRepositoryGroupId(self):
         self.assertEqual("Group1", self.hd.getRepositoryGroupId(domainId="adomain", repositoryId="repository1"))
 
+    def testGetRepositoryGroupIdNoticesChangedGroups(self):
+        self.assertEqual("Group1", self.hd.getRepositoryGroupId(domainId="adomain", repositoryId="repository2"))
+        self.assertEqual("NoGroup", self.hd.getRepositoryGroupId(domainId="adomain", repositoryId="remi"))
+        self.hd.deleteRepository(identifier="repository2", domainId="adomain", repositoryGroupId="Group1")
+        with open(join(self.tempdir, 'adomain.Group2.repositoryGroup'), 'w') as fp:
+            fp.write('{"identifier": "Group2", "repositoryIds": ["repository2_1", "repository2_2", "repository2"]}')
+        self.now += CHECK_INTERVAL
+        self.assertEqual("Group2", self.hd.getRepositoryGroupId(domainId="adomain", repositoryId="repository2"))
+
+    def testReturnedDataIsNotShared(self):
+        self.hd.getRepositoryGroup("Group1", domainId="adomain")['repositoryIds'].append('changed')
+        self.hd.getRepositoryGroupIds(domainId="adomain").append('changed')
+        self.assertEqual(["repository1", "repository2"], self.hd.getRepositoryIds(domainId="adomain", repositoryGroupId="Group1"))
+        self.assertEqual(["Group1", "Group2"], self.hd.getRepositoryGroupIds(domainId="adomain"))
+
+    def testGetDomainSnapshot(self):
+        snapshot = self.hd.getDomainSnapshot(domainId="adomain")
+        self.assertEqual("adomain", snapshot['domain']['identifier'])
+        self.assertEqual(['Group1', 'Group2'], sorted(snapshot['repositoryGroups'].keys()))
+        self.assertEqual(['repository1', 'repository2', 'repository2_1', 'repository2_2'], sorted(snapshot['repositories'].keys()))
+        self.assertEqual('Group2', snapshot['repositories']['repository2_1']['repositoryGroupId'])
+        self.assertEqual({}, snapshot['targets'])
+        self.assertEqual({}, snapshot['mappings'])
+
+    def testGetDomainSnapshotSkipsUnreadableRepositories(self):
+        remove(join(self.tempdir, 'adomain.repository1.repository'))
+        snapshot = self.hd.getDomainSnapshot(domainId="adomain")
+        self.assertEqual(['repository2', 'repository2_1', 'repository2_2'], sorted(snapshot['repositories'].keys()))
+
+    def testDataVersion(self):
+        version = self.hd.getDataVersion()
+        self.assertEqual(version, self.hd.getDataVersion())
+        self.hd.addRepository(identifier="repository3", domainId="adomain", repositoryGroupId="Group1")
+        self.assertNotEqual(version, self.hd.getDataVersion())
+
     def testGetRepositoryGroup(self):
         expected = {
             'identifier': 'Group1',
@@ -526,7 +563,7 @@ class _HarvesterDataTest(SeecrTestCase):
 class HarvesterDataTest(_HarvesterDataTest):
     with_id = True
     def createHarvesterData(self, id_fn):
-        return HarvesterData(self.tempdir, id_fn=id_fn, datastore=DataStore(self.tempdir, id_fn=id_fn))
+        return HarvesterData(self.tempdir, id_fn=id_fn, datastore=DataStore(self.tempdir, id_fn=id_fn, _time=lambda: self.now))
 
     def testGetWithGuid(self):
         self.assertTrue(self.hd.getDomain('adomain', 'mock-id: 1'))
@@ -542,4 +579,4 @@ class HarvesterDataTest(_HarvesterDataTest):
 class HarvesterDataOldStyleTest(_HarvesterDataTest):
     with_id = False
     def createHarvesterData(self, id_fn):
-        return HarvesterData(self.tempdir, id_fn=id_fn, datastore=OldDataStore(self.tempdir, id_fn=id_fn))
+        return HarvesterData(self.tempdir, id_fn=id_fn, datastore=OldDataStore(self.tempdir, id_fn=id_fn, _time=lambda: self.now))
@@ -42,6 +42,7 @@ from os.path import isfile, join
 
 from meresco.harvester.harvesterlog import HarvesterLog
 from meresco.harvester.eventlogger import LOGLINE_RE
+from meresco.harvester.statusindex import loadStatus
 from seecr.zulutime import ZuluTime
 from seecr.test import SeecrTestCase
 
@@ -62,6 +63,18 @@ class HarvesterLogTest(SeecrTestCase):
         self.logDir = join(self.tempdir, 'log')
         makedirs(self.logDir)
 
+    def testStatusIndex(self):
+        with harvesterLog(stateDir=self.stateDir, logDir=self.logDir, name='someuni') as logger:
+            logger.startRepository()
+            logger.notifyHarvestedRecord('someuni:id:1')
+            logger.uploadIdentifier('someuni:id:1')
+            logger.logInvalidData('someuni:id:2', 'invalid')
+            logger.endRepository(None, '2012-01-01T09:00:00Z')
+        status = loadStatus(join(self.stateDir, 'someuni.status'))
+        self.assertEqual((1, 1, 0, 1), (status['harvested'], status['uploaded'], status['deleted'], status['total']))
+        self.assertEqual(1, status['invalid'])
+        self.assertEqual(['someuni:id:2'], status['recentinvalids'])
+
     def testSameDate(self):
         with harvesterLog(stateDir=self.stateDir, logDir=self.logDir, name='someuni') as logger:
             date=logger._state.getTime()[:10]
@@ -190,6 +203,16 @@ class HarvesterLogTest(SeecrTestCase):
             logger.uploadIdentifier('id:2')
             self.assertEqual(3,logger.totalIds())
 
+    def testRejectIdentifier(self):
+        with harvesterLog(stateDir=self.stateDir, logDir=self.logDir, name= 'name') as logger:
+            logger.startRepository()
+            logger.uploadIdentifier('id:1')
+            logger.uploadIdentifier('id:2')
+            logger.rejectIdentifier('id:2')
+            logger.rejectIdentifier('id:3')
+            self.assertEqual(['id:1'], logger.getIds())
+            self.assertEqual('0/1/0/1', logger.countsSummary())
+
     def testLogIgnoredIdentifierWarning(self):
         with harvesterLog(stateDir=self.stateDir, logDir=self.logDir, name='name') as logger:
             logger.startRepository()
@@ -221,6 +244,44 @@ class HarvesterLogTest(SeecrTestCase):
             self.assertEqual(0, logger.totalInvalidIds())
             self.assertFalse(isfile(expectedFile))
 
+    def testRemoveInvalidDataMessageFromEarlierRun(self):
+        with harvesterLog(stateDir=self.stateDir, logDir=self.logDir, name='name') as logger:
+            logger.notifyHarvestedRecord('repoid:oai:1')
+            logger.logInvalidData('repoid:oai:1', "Error")
+        expectedFile = self.logDir + '/invalid/repoid/oai:1'
+        self.assertTrue(isfile(expectedFile))
+        with harvesterLog(stateDir=self.stateDir, logDir=self.logDir, name='name') as logger:
+            self.assertEqual(1, logger.totalInvalidIds())
+            logger.notifyHarvestedRecord('repoid:oai:1')
+            self.assertEqual(0, logger.totalInvalidIds())
+            self.assertFalse(isfile(expectedFile))
+
+    def testNotifyHarvestedRecordWithoutInvalidDataSkipsFilesystem(self):
+        with harvesterLog(stateDir=self.stateDir, logDir=self.logDir, name='name') as logger:
+            logger.notifyHarvestedRecord('repoid:oai:1')
+            makedirs(self.logDir + '/invalid/repoid')
+            with open(self.logDir + '/invalid/repoid/oai:2', 'w') as fp:
+                fp.write('written by someone else')
+            logger.notifyHarvestedRecord('repoid:oai:2')
+            self.assertTrue(isfile(self.logDir + '/invalid/repoid/oai:2'))
+
+    def testEventsFlushedBeforeCheckpoint(self):
+        with harvesterLog(stateDir=self.stateDir, logDir=self.logDir, name='name', logBufferSize=10000) as logger:
+            logger.startRepository()
+            logger.notifyHarvestedRecord('repoid:oai:1')
+            logger.logIgnoredIdentifierWarning('repoid:oai:1')
+            with open(self.logDir + '/name.events') as fp:
+                self.assertEqual('', fp.read())
+            markHarvested = logger._state.markHarvested
+            def checkEventsAndMarkHarvested(*args):
+                with open(self.logDir + '/name.events') as fp:
+                    self.assertTrue('IGNORED' in fp.read())
+                markHarvested(*args)
+            logger._state.markHarvested = checkEventsAndMarkHarvested
+            logger.endRepository('token', '2020-01-01T00:00:00Z')
+            with open(self.logDir + '/name.events') as fp:
+                self.assertTrue('SUCCES' in fp.read())
+
     def testInvalidIDs(self):
         with harvesterLog(stateDir=self.stateDir, logDir=self.logDir, name='name') as logger:
             logger.startRepository()
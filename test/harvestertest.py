@@ -48,6 +48,7 @@ from lxml.etree import parse
 from seecr.test import CallTrace
 
 from meresco.components.json import JsonDict
+from meresco.harvester.concurrentuploader import ConcurrentUploader
 from meresco.harvester.harvester import Harvester
 from meresco.harvester.harvesterlog import HarvesterLog
 from meresco.harvester.oairequest import OaiRequest
@@ -86,6 +87,7 @@ class HarvesterTest(unittest.TestCase):
     def setUp(self):
         self.sendCalled=0
         self.sendException = None
+        self.rejectedUploads = []
         self.upload = None
         self.sendParts=[]
         self.sendId=[]
@@ -130,6 +132,106 @@ class HarvesterTest(unittest.TestCase):
         with open(os.path.join(self.stateDir, 'tud.stats')) as f:
             self.assertEqual('ResumptionToken: TestToken', f.read()[-27:-1])
 
+    def testDoUploadStreaming(self):
+        harvester = self.createHarvesterWithMockUploader('tud', mockRequest=MockOaiRequest('mocktud', streaming=True))
+        harvester.harvest()
+
+        self.assertEqual(['tud:oai:tudelft.nl:007087', 'tud:oai:tudelft.nl:007192', 'tud:oai:tudelft.nl:007193'], self.sendId)
+        record = parse(StringIO(self.sendParts[2]['record']))
+        subjects = record.xpath('/oai:record/oai:metadata/oai_dc:dc/dc:subject/text()', namespaces=namespaces)
+        self.assertEqual(['quantitative electron microscopy', 'statistical experimental design', 'parameter estimation'], subjects)
+        with open(os.path.join(self.stateDir, 'tud.stats')) as f:
+            self.assertEqual('ResumptionToken: TestToken', f.read()[-27:-1])
+
+    def testDoUploadStreamingMultiplePages(self):
+        transferInfoAfterSends = []
+        mockRequest = MockOaiRequest('mocktud', streaming=True)
+        transferInfo = mockRequest.transferInfo
+        def transferInfoLogged():
+            transferInfoAfterSends.append(self.sendCalled)
+            return transferInfo()
+        mockRequest.transferInfo = transferInfoLogged
+        harvester = self.createHarvesterWithMockUploader('tud', mockRequest=mockRequest, maxPages=0)
+        self.assertEqual(('Harvested.', False), harvester.harvest())
+
+        self.assertEqual(['tud:oai:tudelft.nl:007087', 'tud:oai:tudelft.nl:007192', 'tud:oai:tudelft.nl:007193',
+            'tud:oai:tudelft.nl:107087', 'tud:oai:tudelft.nl:107192', 'tud:oai:tudelft.nl:107193'], self.sendId)
+        self.assertEqual([3, 6], transferInfoAfterSends)
+        with open(os.path.join(self.stateDir, 'tud.stats')) as f:
+            lines = f.read().strip().split('\n')
+        self.assertEqual(2, len(lines))
+        self.assertTrue(lines[0].endswith('ResumptionToken: TestToken'), lines[0])
+        self.assertTrue(lines[1].endswith('ResumptionToken:'), lines[1])
+
+    def testDoUploadPrefetching(self):
+        harvester = self.createHarvesterWithMockUploader('tud', prefetchDepth=1, maxPages=0)
+        harvester.harvest()
+
+        self.assertEqual(['tud:oai:tudelft.nl:007087', 'tud:oai:tudelft.nl:007192', 'tud:oai:tudelft.nl:007193',
+            'tud:oai:tudelft.nl:107087', 'tud:oai:tudelft.nl:107192', 'tud:oai:tudelft.nl:107193'], self.sendId)
+        with open(os.path.join(self.stateDir, 'tud.stats')) as f:
+            lines = f.read().strip().split('\n')
+        self.assertEqual(2, len(lines))
+        self.assertTrue('Harvested/Uploaded/Deleted/Total: 3/3/0/3' in lines[0], lines[0])
+        self.assertTrue(lines[0].endswith('ResumptionToken: TestToken'), lines[0])
+        self.assertTrue('Harvested/Uploaded/Deleted/Total: 3/3/0/6' in lines[1], lines[1])
+        self.assertTrue(lines[1].endswith('ResumptionToken:'), lines[1])
+        state = JsonDict.load(os.path.join(self.stateDir, 'tud.next'))
+        self.assertEqual('', state['resumptionToken'].strip())
+
+    def testDoUploadMultiplePages(self):
+        harvester = self.createHarvesterWithMockUploader('tud', maxPages=0)
+        self.assertEqual(('Harvested.', False), harvester.harvest())
+
+        self.assertEqual(6, self.sendCalled)
+        with open(os.path.join(self.stateDir, 'tud.stats')) as f:
+            lines = f.read().strip().split('\n')
+        self.assertEqual(2, len(lines))
+        self.assertTrue(lines[0].endswith('ResumptionToken: TestToken'), lines[0])
+
+    def testMultiplePagesBoundedByPageCount(self):
+        harvester = self.createHarvesterWithMockUploader('tud', maxPages=1)
+        self.assertEqual(('Harvested.', True), harvester.harvest())
+
+        self.assertEqual(3, self.sendCalled)
+        self.assertEqual('TestToken', JsonDict.load(os.path.join(self.stateDir, 'tud.next'))['resumptionToken'])
+
+    def testMultiplePagesBoundedByTime(self):
+        harvester = self.createHarvesterWithMockUploader('tud', maxPages=0, maxTime=0)
+        self.assertEqual(('Harvested.', True), harvester.harvest())
+
+        self.assertEqual(3, self.sendCalled)
+        self.assertEqual('TestToken', JsonDict.load(os.path.join(self.stateDir, 'tud.next'))['resumptionToken'])
+
+    def testPrefetchingBoundedByPageCount(self):
+        listRecordsTokens = []
+        mockRequest = MockOaiRequest('mocktud')
+        listRecords = mockRequest.listRecords
+        def listRecordsLogged(**kwargs):
+            listRecordsTokens.append(kwargs.get('resumptionToken'))
+            return listRecords(**kwargs)
+        mockRequest.listRecords = listRecordsLogged
+        harvester = self.createHarvesterWithMockUploader('tud', mockRequest=mockRequest, prefetchDepth=2, maxPages=1)
+        self.assertEqual(('Harvested.', True), harvester.harvest())
+
+        self.assertEqual(3, self.sendCalled)
+        self.assertEqual([None], listRecordsTokens)
+
+    def testPrefetchingKeepsLastCheckpointOnError(self):
+        harvester = self.createHarvesterWithMockUploader('tud', prefetchDepth=2, maxPages=0)
+        sendCalled = []
+        def send(upload):
+            sendCalled.append(upload.id)
+            if upload.id == 'tud:oai:tudelft.nl:107192':
+                raise Exception('upload failed')
+        self.send = send
+        self.assertRaises(Exception, harvester.harvest)
+
+        state = JsonDict.load(os.path.join(self.stateDir, 'tud.next'))
+        self.assertEqual('TestToken', state['resumptionToken'])
+        self.assertEqual(['tud:oai:tudelft.nl:007087', 'tud:oai:tudelft.nl:007192', 'tud:oai:tudelft.nl:007193',
+            'tud:oai:tudelft.nl:107087', 'tud:oai:tudelft.nl:107192'], sendCalled)
+
     def testLogIDsForRemoval(self):
         harvester = self.createHarvesterWithMockUploader('tud')
         harvester.harvest()
@@ -138,12 +240,12 @@ class HarvesterTest(unittest.TestCase):
             self.assertEqual('tud:oai:tudelft.nl:007192',idsfile.readline().strip())
             self.assertEqual('tud:oai:tudelft.nl:007193',idsfile.readline().strip())
 
-    def createHarvesterWithMockUploader(self, name, set=None, mockRequest=None):
+    def createHarvesterWithMockUploader(self, name, set=None, mockRequest=None, **kwargs):
         self.logger = HarvesterLog(stateDir=self.stateDir, logDir=self.logDir, name=name)
         repository = self.MockRepository(name, set)
         uploader = repository.createUploader(self.logger.eventLogger())
         self.mapper = repository.mapping()
-        harvester = Harvester(repository)
+        harvester = Harvester(repository, **kwargs)
         harvester.addObserver(mockRequest or MockOaiRequest('mocktud'))
         harvester.addObserver(self.logger)
         harvester.addObserver(uploader)
@@ -385,6 +487,43 @@ class HarvesterTest(unittest.TestCase):
         harvester.upload(oaiResponse())
         self.assertEqual(['createUpload', "notifyHarvestedRecord", "send", 'logInvalidData', "totalInvalidIds", 'logIgnoredIdentifierWarning'], [m.name for m in observer.calledMethods])
 
+    def testRejectedUploadsFlushedAtPageBoundary(self):
+        harvester = self.createHarvesterWithMockUploader('tud')
+        harvester._repository.maxIgnore = lambda: 100
+        self.rejectedUploads = [InvalidDataException('tud:oai:tudelft.nl:007192', 'invalid')]
+        harvester.harvest()
+
+        self.assertEqual(['tud:oai:tudelft.nl:007192'], list(self.logger.getIds(invalid=True)))
+        self.assertEqual(['tud:oai:tudelft.nl:007087', 'tud:oai:tudelft.nl:007193'], list(self.logger.getIds()))
+        with open(os.path.join(self.stateDir, 'tud.stats')) as f:
+            stats = f.read()
+        self.assertTrue('Harvested/Uploaded/Deleted/Total: 3/2/0/2' in stats, stats)
+        self.assertEqual('ResumptionToken: TestToken', stats[-27:-1])
+
+    def testRejectedConcurrentUploads(self):
+        self.createUploader = lambda logger: ConcurrentUploader(self, logger, concurrency=2)
+        self.info = self.uploaderInfo
+        harvester = self.createHarvesterWithMockUploader('tud')
+        harvester._repository.maxIgnore = lambda: 100
+        def send(upload):
+            if upload.id == 'tud:oai:tudelft.nl:007192':
+                raise InvalidDataException(upload.id, 'invalid')
+        self.send = send
+        harvester.harvest()
+
+        self.assertEqual(['tud:oai:tudelft.nl:007192'], list(self.logger.getIds(invalid=True)))
+        self.assertEqual(['tud:oai:tudelft.nl:007087', 'tud:oai:tudelft.nl:007193'], list(self.logger.getIds()))
+        with open(os.path.join(self.stateDir, 'tud.stats')) as f:
+            self.assertTrue('Harvested/Uploaded/Deleted/Total: 3/2/0/2' in f.read())
+
+    def testTooManyRejectedUploads(self):
+        harvester = self.createHarvesterWithMockUploader('tud')
+        harvester._repository.maxIgnore = lambda: 0
+        self.rejectedUploads = [InvalidDataException('tud:oai:tudelft.nl:007192', 'invalid')]
+        self.assertRaises(TooMuchInvalidDataException, harvester.harvest)
+
+        self.assertFalse(os.path.isfile(os.path.join(self.stateDir, 'tud.next')))
+
     #self shunt:
     def send(self, upload):
         self.sendCalled+=1
@@ -400,6 +539,18 @@ class HarvesterTest(unittest.TestCase):
     def uploaderInfo(self):
         return 'The uploader is connected to /dev/null'
 
+    def flushUploads(self):
+        return self.rejectedUploads
+
+    def hostWaitInfo(self):
+        return None
+
+    def connectionInfo(self):
+        return None
+
+    def transferInfo(self):
+        return None
+
     def start(self):
         self.startCalled += 1
 
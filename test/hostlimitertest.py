@@ -0,0 +1,97 @@
+## begin license ##
+#
+# "Meresco Harvester" consists of two subsystems, namely an OAI-harvester and
+# a web-control panel.
+# "Meresco Harvester" is originally called "Sahara" and was developed for
+# SURFnet by:
+# Seek You Too B.V. (CQ2) http://www.cq2.nl
+#
+# Copyright (C) 2026 Seecr (Seek You Too B.V.) https://seecr.nl
+#
+# This file is part of "Meresco Harvester"
+#
+# "Meresco Harvester" is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# "Meresco Harvester" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "Meresco Harvester"; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+## end license ##
+
+
+from seecr.test import SeecrTestCase
+from os.path import join
+
+from meresco.harvester.hostlimiter import HostLimiter
+
+
+class HostLimiterTest(SeecrTestCase):
+    def setUp(self):
+        super(HostLimiterTest, self).setUp()
+        self.now = 1000.0
+        self.slept = []
+        def sleep(seconds):
+            self.slept.append(seconds)
+            self.now += seconds
+        self.directory = join(self.tempdir, 'hosts')
+        self.createLimiter = lambda **kwargs: HostLimiter(self.directory, _time=lambda: self.now, _sleep=sleep, **kwargs)
+
+    def testNoLimits(self):
+        limiter = self.createLimiter()
+        for i in range(5):
+            slot = limiter.acquire('example.org')
+            self.assertEqual(0, slot.waited)
+        self.assertEqual([], self.slept)
+
+    def testTokenBucket(self):
+        limiter = self.createLimiter(rate=2, burst=2)
+        for i in range(4):
+            limiter.acquire('example.org').release()
+        self.assertEqual([0.5, 0.5], self.slept)
+        limiter.acquire('other.org')
+        self.assertEqual([0.5, 0.5], self.slept)
+
+    def testBucketIsSharedBetweenLimiters(self):
+        self.createLimiter(rate=1).acquire('example.org')
+        slot = self.createLimiter(rate=1).acquire('example.org')
+        self.assertEqual(1.0, slot.waited)
+
+    def testConcurrencyCap(self):
+        limiter = self.createLimiter(maxConcurrent=2)
+        slot1 = limiter.acquire('example.org')
+        slot2 = self.createLimiter(maxConcurrent=2).acquire('example.org')
+        slot2.release()
+        slot3 = limiter.acquire('example.org')
+        self.assertEqual([], self.slept)
+        def releaseWhileWaiting(seconds):
+            self.slept.append(seconds)
+            slot1.release()
+        limiter._sleep = releaseWhileWaiting
+        limiter.acquire('example.org')
+        self.assertEqual([0.1], self.slept)
+
+    def testSlotReleasedByWithOrGarbageCollection(self):
+        limiter = self.createLimiter(maxConcurrent=1)
+        with limiter.acquire('example.org'):
+            pass
+        limiter.acquire('example.org')
+        limiter.acquire('example.org')
+        self.assertEqual([], self.slept)
+
+    def testRetryAfter(self):
+        limiter = self.createLimiter()
+        limiter.retryAfter('example.org', 30)
+        self.createLimiter().retryAfter('example.org', 10)
+        slot = self.createLimiter().acquire('example.org')
+        self.assertEqual(30, slot.waited)
+        self.assertEqual([30], self.slept)
+        limiter.acquire('example.org')
+        self.assertEqual([30], self.slept)
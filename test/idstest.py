@@ -36,7 +36,7 @@
 ## end license ##
 
 from seecr.test import SeecrTestCase
-from meresco.harvester.ids import Ids, readIds, writeIds
+from meresco.harvester.ids import Ids, readIds, writeIds, sortedIds, idsDifference, COMPACT_MINIMUM
 from os.path import join
 
 from contextlib import contextmanager
@@ -88,6 +88,36 @@ class IdsTest(SeecrTestCase):
         with open(self.tempdir + '/three.ids') as fp:
             self.assertEqual(3, len(fp.readlines()))
 
+    def testRemoveMany(self):
+        self.writeTestIds('three', ['id:1', 'id:2', 'id:3'])
+        with _Ids(self.tempdir, 'three') as ids:
+            ids.removeMany(['id:1', 'id:3', 'id:4'])
+            self.assertEqual(['id:2'], list(ids))
+            self.assertEqual(['id:2'], readIds(self.tempdir + '/three.ids'))
+        with open(self.tempdir + '/three.ids') as fp:
+            self.assertEqual(1, len(fp.readlines()))
+
+    def testSortedIds(self):
+        with _Ids(self.tempdir, 'log') as ids:
+            for id in ['id:5', 'id:3', 'id/1\nnewline', 'id:4', 'id:2']:
+                ids.add(id)
+            ids.remove('id:4')
+            ids.remove('id:3')
+            ids.add('id:3')
+            ids.remove('id:2')
+        writeIds(join(self.tempdir, 'other.ids'), ['id:2', 'id:9', 'id:5'])
+        filenames = [join(self.tempdir, name) for name in ['log.ids', 'other.ids', 'missing.ids']]
+        expected = sorted(set(readIds(filenames[0]) + readIds(filenames[1])))
+        self.assertEqual(['id/1\nnewline', 'id:2', 'id:3', 'id:5', 'id:9'], expected)
+        for chunkSize in [1, 2, 3, 100]:
+            self.assertEqual(expected, list(sortedIds(filenames, chunkSize=chunkSize, tempDir=self.tempdir)))
+
+    def testIdsDifference(self):
+        self.assertEqual(['a', 'c', 'e'], list(idsDifference(['a', 'b', 'c', 'd', 'e'], ['b', 'bb', 'd'])))
+        self.assertEqual(['a', 'b'], list(idsDifference(['a', 'b'], [])))
+        self.assertEqual([], list(idsDifference([], ['a'])))
+        self.assertEqual(['z'], list(idsDifference(['a', 'z'], ['a', 'b'])))
+
     def testAddStrangeIds(self):
         with _Ids(self.tempdir, 'idstest') as ids:
             ids.add('id:1')
@@ -140,6 +170,54 @@ class IdsTest(SeecrTestCase):
         finally:
             ids.close()
 
+    def testRemoveAppendsTombstone(self):
+        self.writeTestIds('three', ['id:1', 'id:2', 'id:3'])
+        ids = Ids(self.tempdir, 'three')
+        ids.remove('id:2')
+        with open(join(self.tempdir, 'three.ids')) as fp:
+            self.assertEqual('id:1\nid:2\nid:3\n%-id:2\n', fp.read())
+        self.assertEqual(['id:1', 'id:3'], readIds(join(self.tempdir, 'three.ids')))
+        ids.close()
+        with open(join(self.tempdir, 'three.ids')) as fp:
+            self.assertEqual('id:1\nid:3\n', fp.read())
+
+    def testReplayLogWithoutClose(self):
+        ids = Ids(self.tempdir, 'idstest')
+        ids.add('id:1')
+        ids.add('id:2')
+        ids.remove('id:1')
+        ids.add('id:1')
+        ids.remove('%-id:2')
+
+        with _Ids(self.tempdir, 'idstest') as reopened:
+            self.assertEqual(['id:2', 'id:1'], reopened.getIds())
+        ids.close()
+
+    def testRemoveIdLookingLikeTombstone(self):
+        with _Ids(self.tempdir, 'idstest') as ids:
+            ids.add('%-id:1')
+            ids.add('id:1')
+            ids.remove('%-id:1')
+            self.assertEqual(['id:1'], readIds(join(self.tempdir, 'idstest.ids')))
+
+    def testCompaction(self):
+        with _Ids(self.tempdir, 'idstest') as ids:
+            for i in range(COMPACT_MINIMUM + 10):
+                ids.add('id:%d' % i)
+            for i in range(COMPACT_MINIMUM + 5):
+                ids.remove('id:%d' % i)
+                with open(join(self.tempdir, 'idstest.ids')) as fp:
+                    lineCount = len(fp.readlines())
+                self.assertTrue(lineCount <= 2 * COMPACT_MINIMUM + 10, lineCount)
+            self.assertEqual(['id:%d' % i for i in range(COMPACT_MINIMUM + 5, COMPACT_MINIMUM + 10)], ids.getIds())
+
+    def testClearCompactsImmediately(self):
+        self.writeTestIds('three', ['id:1', 'id:2', 'id:3'])
+        with _Ids(self.tempdir, 'three') as ids:
+            ids.clear()
+            ids.add('id:4')
+            self.assertEqual(['id:4'], readIds(join(self.tempdir, 'three.ids')))
+
 
     def writeTestIds(self, name, ids):
         with open("{}/{}.ids".format(self.tempdir, name), 'w') as w:
@@ -34,6 +34,7 @@ from seecr.test import SeecrTestCase
 from meresco.components.json import JsonDict
 from meresco.harvester.internalserverproxy import InternalServerProxy
 from io import StringIO
+from urllib.error import HTTPError
 
 class InternalServerProxyTest(SeecrTestCase):
 
@@ -84,3 +85,60 @@ class InternalServerProxyTest(SeecrTestCase):
         self.response = {}
         self.proxy.repositoryActionDone(domainId='adomain', repositoryId='repo1')
         self.assertEqual(('http://localhost/action/repositoryDone', 'domainId=adomain&identifier=repo1'), self.requests[0])
+
+    def testDomainSnapshot(self):
+        now = [1000.0]
+        proxy = InternalServerProxy("http://localhost", useSnapshot=True, snapshotDir=self.tempdir, _time=lambda: now[0])
+        snapshot = {
+                'domain': {'identifier': 'adomain', 'repositoryGroupIds': ['group1']},
+                'repositoryGroups': {'group1': {'identifier': 'group1', 'repositoryIds': ['repo1']}},
+                'repositories': {'repo1': {'identifier': 'repo1', 'targetId': 'target1', 'mappingId': 'mapping1', 'use': True}},
+                'targets': {'target1': {'identifier': 'target1', 'name': 'Target'}},
+                'mappings': {'mapping1': {'identifier': 'mapping1', 'name': 'Mapping'}},
+            }
+        requests = []
+        def _urlopen(request):
+            requests.append((request.get_full_url(), request.get_header('If-none-match')))
+            if request.get_header('If-none-match') == '"v1"':
+                raise HTTPError(request.get_full_url(), 304, 'Not Modified', {}, None)
+            response = StringIO(JsonDict(response={'GetDomainSnapshot': snapshot}).dumps())
+            response.headers = {'ETag': '"v1"'}
+            return response
+        proxy._urlopen = _urlopen
+
+        repository = proxy.getRepositoryObject(identifier='repo1', domainId='adomain')
+        self.assertEqual('Target', repository.target().name)
+        self.assertEqual('Mapping', repository.mapping().name)
+        self.assertEqual(['repo1'], proxy.getRepositoryIds('adomain'))
+        self.assertEqual([('http://localhost/get?verb=GetDomainSnapshot&domainId=adomain', None)], requests)
+
+        now[0] += 10
+        self.assertEqual(['repo1'], proxy.getRepositoryIds('adomain'))
+        self.assertEqual(('http://localhost/get?verb=GetDomainSnapshot&domainId=adomain', '"v1"'), requests[-1])
+
+        otherProcess = InternalServerProxy("http://localhost", useSnapshot=True, snapshotDir=self.tempdir)
+        otherProcess._urlopen = _urlopen
+        self.assertEqual('repo1', otherProcess.getRepository(identifier='repo1', domainId='adomain')['identifier'])
+        self.assertEqual(3, len(requests))
+        self.assertEqual('"v1"', requests[-1][1])
+
+    def testFallbackWhenSnapshotFails(self):
+        proxy = InternalServerProxy("http://localhost", useSnapshot=True)
+        requests = []
+        def _urlopen(request):
+            url = request if isinstance(request, str) else request.get_full_url()
+            requests.append(url)
+            if 'GetDomainSnapshot' in url:
+                return StringIO(JsonDict(error={'code': 'unknown', 'message': 'repository file missing'}).dumps())
+            return StringIO(JsonDict(response={'GetRepository': {'identifier': 'repo1'}}).dumps())
+        proxy._urlopen = _urlopen
+        self.assertEqual('repo1', proxy.getRepository(identifier='repo1', domainId='adomain')['identifier'])
+        self.assertEqual([
+                'http://localhost/get?verb=GetDomainSnapshot&domainId=adomain',
+                'http://localhost/get?verb=GetRepository&identifier=repo1&domainId=adomain',
+            ], requests)
+
+    def testWithoutSnapshotTargetsAreRequested(self):
+        self.response = {'response': {'GetTarget': {'identifier': 'target1'}}}
+        self.proxy.getTarget(identifier='target1')
+        self.assertEqual('http://localhost/get?verb=GetTarget&identifier=target1', self.requests[0])
@@ -152,4 +152,48 @@ skipRecord("Don't like it here.")
         self.assertEqual('value', upload.parts['name'])
         self.assertEqual('1', upload.parts['number'])
 
+    def testCompileOnce(self):
+        datamap = Mapping('mappingId')
+        datamap.code = """upload.parts['record']="<somexml/>" """
+        compiled = datamap.compiled()
+        datamap.createUpload(TestRepository(), oaiResponse())
+        datamap.createUpload(TestRepository(), oaiResponse())
+        self.assertTrue(compiled is datamap.compiled())
+        self.assertEqual(2, compiled.executeCount)
+
+    def testNothingLeaksIntoTheNextRecord(self):
+        datamap = Mapping('mappingId')
+        datamap.code = """
+upload.parts['record'] = '<seen>%s</seen>' % ('leftover' in globals())
+leftover = True
+"""
+        for i in range(2):
+            upload = datamap.createUpload(TestRepository(), oaiResponse())
+            self.assertEqual('<seen>False</seen>', upload.parts['record'])
+
+    def testBuiltinsAreReadOnly(self):
+        datamap = Mapping('mappingId')
+        datamap.code = """
+__builtins__['leftover'] = True
+"""
+        self.assertRaises(TypeError, lambda: datamap.createUpload(TestRepository(), oaiResponse()))
+        self.assertFalse('leftover' in datamap.compiled().builtins)
+
+    def testRecompileAfterSetCode(self):
+        datamap = Mapping('mappingId')
+        datamap.code = """upload.parts['record']="<somexml/>" """
+        compiled = datamap.compiled()
+        datamap.setCode("""upload.parts['record']="<otherxml/>" """)
+        upload = datamap.createUpload(TestRepository(), oaiResponse())
+        self.assertEqual('<otherxml/>', upload.parts['record'])
+        self.assertFalse(compiled is datamap.compiled())
 
+    def testMappingInfo(self):
+        datamap = Mapping('mappingId')
+        datamap.name = 'My Mapping'
+        datamap.code = """upload.parts['record']="<somexml/>" """
+        self.assertEqual("Mappingname 'My Mapping'", datamap.mappingInfo())
+        datamap.createUpload(TestRepository(), oaiResponse())
+        info = datamap.mappingInfo()
+        self.assertTrue(info.startswith("Mappingname 'My Mapping', Compile/Execute time: "), info)
+        self.assertTrue(info.endswith("s for 1 records"), info)
@@ -35,17 +35,14 @@ from os.path import join
 from urllib.parse import urlencode
 
 from meresco.harvester.oairequest import OaiRequest
-from lxml.etree import parse
 
 class MockOaiRequest(OaiRequest):
-    def __init__(self, url):
-        OaiRequest.__init__(self,url)
+    def __init__(self, url, **kwargs):
+        OaiRequest.__init__(self, url, **kwargs)
         self._createMapping()
 
-    def _request(self, argslist, **kwargs):
-        filename = self.findFile(argslist)
-        with open(filename) as fp:
-            return parse(fp)
+    def _openRequest(self, argslist):
+        return open(self.findFile(argslist), 'rb')
 
     def findFile(self, argslist):
         argslist.sort()
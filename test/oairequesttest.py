@@ -41,10 +41,14 @@ from lxml.etree import parse, XML
 
 from meresco.harvester import VERSION
 from meresco.harvester.namespaces import xpathFirst, namespaces
-from meresco.harvester.oairequest import OaiRequest, OAIError, OaiResponse
+from meresco.harvester.oairequest import OaiRequest, OAIError, OaiResponse, ResponseBody, OaiRequestException
+from meresco.harvester.hostlimiter import HostSlot
 
 from mockoairequest import MockOaiRequest
-from io import StringIO
+from io import StringIO, BytesIO
+from urllib.error import HTTPError
+from gzip import compress as gzipCompress
+from zlib import compress as zlibCompress, compressobj, DEFLATED, MAX_WBITS
 
 class OaiRequestTest(SeecrTestCase):
     def setUp(self):
@@ -64,15 +68,16 @@ class OaiRequestTest(SeecrTestCase):
         self.assertEqual("Meresco Harvester {}".format(VERSION), args['args'][0].headers['User-agent'])
 
     def testHeaders(self):
-        self.assertEqual({"User-Agent": "Meresco Harvester {}".format(VERSION)},
+        self.assertEqual({"User-Agent": "Meresco Harvester {}".format(VERSION), "Accept-Encoding": "gzip, deflate"},
                 OaiRequest('http://example.com')._headers())
-        self.assertEqual({"User-Agent": "User Agent 3.0"},
+        self.assertEqual({"User-Agent": "User Agent 3.0", "Accept-Encoding": "gzip, deflate"},
                 OaiRequest('http://example.com', userAgent="User Agent 3.0")._headers())
-        self.assertEqual({"User-Agent": "Meresco Harvester {}".format(VERSION)},
+        self.assertEqual({"User-Agent": "Meresco Harvester {}".format(VERSION), "Accept-Encoding": "gzip, deflate"},
                 OaiRequest('http://example.com', userAgent='')._headers())
-        self.assertEqual({"User-Agent": "Meresco Harvester {}".format(VERSION)},
+        self.assertEqual({"User-Agent": "Meresco Harvester {}".format(VERSION), "Accept-Encoding": "gzip, deflate"},
                 OaiRequest('http://example.com', userAgent=' ')._headers())
         self.assertEqual({"User-Agent": "Meresco Harvester {}".format(VERSION),
+                "Accept-Encoding": "gzip, deflate",
                 "Authorization": "Bearer GivenKey"},
                 OaiRequest('http://example.com', authorizationKey='GivenKey')._headers())
 
@@ -95,6 +100,131 @@ class OaiRequestTest(SeecrTestCase):
 
 
 
+    def testRememberTLS12Context(self):
+        from ssl import SSLError, PROTOCOL_TLSv1_2
+        calls = []
+        def failingDefaultUrlOpen(*fArgs, **fKwargs):
+            calls.append(fKwargs)
+            if fKwargs['context'] is None:
+                raise SSLError("Some error")
+            return StringIO(oaiResponseXML())
+        request = OaiRequest("http://harvest.me", _urlopen=failingDefaultUrlOpen)
+        request.identify()
+        request.identify()
+        self.assertEqual(3, len(calls))
+        self.assertEqual(None, calls[0]['context'])
+        self.assertEqual(PROTOCOL_TLSv1_2, calls[1]['context'].protocol)
+        self.assertTrue(calls[1]['context'] is calls[2]['context'])
+
+    def testConnectionInfo(self):
+        self.assertEqual(None, OaiRequest("http://harvest.me").connectionInfo())
+        pool = CallTrace('pool', returnValues={'counts': (1, 4)})
+        request = OaiRequest("http://harvest.me/oai", connectionPool=pool)
+        self.assertEqual('Connections new/reused: 1/4', request.connectionInfo())
+        self.assertEqual([('harvest.me',)], [m.args for m in pool.calledMethods if m.name == 'counts'])
+
+    def testRetryAfterServiceUnavailable(self):
+        responses = [_serviceUnavailable('3'), _serviceUnavailable('2'), _CompressedResponse(oaiResponseXML().encode(), None)]
+        def urlopen(*args, **kwargs):
+            response = responses.pop(0)
+            if isinstance(response, HTTPError):
+                raise response
+            return response
+        slept = []
+        request = OaiRequest("http://harvest.me/oai", _urlopen=urlopen, _sleep=slept.append)
+        self.assertEqual(None, request.hostWaitInfo())
+        request.listRecords(metadataPrefix='oai_dc')
+        self.assertEqual([3, 2], slept)
+        self.assertEqual('Waited for host harvest.me: 5.000 seconds', request.hostWaitInfo())
+
+    def testNoRetryWithoutOrWithLongRetryAfter(self):
+        for error in [_serviceUnavailable(None), _serviceUnavailable('3600'), HTTPError('http://harvest.me', 500, 'Error', {'Retry-After': '1'}, None)]:
+            slept = []
+            def urlopen(*args, **kwargs):
+                raise error
+            request = OaiRequest("http://harvest.me", _urlopen=urlopen, _sleep=slept.append)
+            self.assertRaises(OaiRequestException, lambda: request.identify())
+            self.assertEqual([], slept)
+
+    def testRetryAfterIsShared(self):
+        responses = [_serviceUnavailable('3'), _CompressedResponse(oaiResponseXML().encode(), None)]
+        def urlopen(*args, **kwargs):
+            response = responses.pop(0)
+            if isinstance(response, HTTPError):
+                raise response
+            return response
+        limiter = CallTrace('limiter', returnValues={'acquire': HostSlot(None)})
+        request = OaiRequest("http://harvest.me/oai", hostLimiter=limiter, _urlopen=urlopen)
+        request.identify()
+        self.assertEqual(['acquire', 'retryAfter', 'acquire'], [m.name for m in limiter.calledMethods])
+        self.assertEqual(('harvest.me', 3), limiter.calledMethods[1].args)
+
+    def testSlotIsReleasedWhenBodyIsClosed(self):
+        released = []
+        class Slot(HostSlot):
+            def release(self):
+                released.append(True)
+        limiter = CallTrace('limiter', returnValues={'acquire': Slot(None)})
+        xml = oaiResponseXML().encode()
+        request = OaiRequest("http://harvest.me", streaming=True, hostLimiter=limiter, _urlopen=lambda *args, **kwargs: _CompressedResponse(xml, None))
+        response = request.listRecords(metadataPrefix='oai_dc')
+        self.assertEqual([], released)
+        list(response.records)
+        self.assertEqual([True], released)
+
+    def testSlotIsReleasedWhenStreamingResponseFails(self):
+        released = []
+        class Slot(HostSlot):
+            def release(self):
+                released.append(True)
+        slot = Slot(None)
+        limiter = CallTrace('limiter', returnValues={'acquire': slot})
+        request = OaiRequest("http://harvest.me", streaming=True, hostLimiter=limiter, _urlopen=lambda *args, **kwargs: _CompressedResponse(b'<html><body>Service down</p></html>', None))
+        self.assertRaises(OaiRequestException, lambda: request.listRecords(metadataPrefix='oai_dc'))
+        self.assertEqual([True], released)
+
+    def testStreamingResponseWithoutOaiElements(self):
+        request = OaiRequest("http://harvest.me", streaming=True, _urlopen=lambda *args, **kwargs: _CompressedResponse(b'<html><body>Service down</body></html>', None))
+        try:
+            request.listRecords(metadataPrefix='oai_dc')
+            self.fail()
+        except OaiRequestException as e:
+            self.assertEqual('http://harvest.me?verb=ListRecords&metadataPrefix=oai_dc', e.url)
+            self.assertTrue('No OAI-PMH response' in str(e), str(e))
+
+    def testCompressedResponse(self):
+        xml = oaiResponseXML(identifier='oai:ident:compressed').encode()
+        rawDeflate = compressobj(9, DEFLATED, -MAX_WBITS)
+        for contentEncoding, body in [
+                ('gzip', gzipCompress(xml)),
+                ('deflate', zlibCompress(xml)),
+                ('deflate', rawDeflate.compress(xml) + rawDeflate.flush()),
+                (None, xml),
+            ]:
+            request = OaiRequest("http://harvest.me", _urlopen=lambda *args, **kwargs: _CompressedResponse(body, contentEncoding))
+            response = request.listRecords(metadataPrefix='oai_dc')
+            self.assertEqual('oai:ident:compressed', xpathFirst(response.record, 'oai:header/oai:identifier/text()'))
+            self.assertEqual('Bytes received/uncompressed: %d/%d' % (len(body), len(xml)), request.transferInfo())
+
+    def testCompressedResponseStreaming(self):
+        xml = oaiResponseXML(identifier='oai:ident:compressed').encode()
+        request = OaiRequest("http://harvest.me", streaming=True, _urlopen=lambda *args, **kwargs: _CompressedResponse(gzipCompress(xml), 'gzip'))
+        response = request.listRecords(metadataPrefix='oai_dc')
+        self.assertEqual(['oai:ident:compressed'], [xpathFirst(record, 'oai:header/oai:identifier/text()') for record in response.records])
+
+    def testResponseBodyReadsInChunks(self):
+        data = b'x' * 100000
+        body = ResponseBody(BytesIO(gzipCompress(data)), contentEncoding='gzip')
+        chunks = []
+        while True:
+            chunk = body.read(1000)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        self.assertTrue(all(len(chunk) <= 1000 for chunk in chunks))
+        self.assertEqual(data, b''.join(chunks))
+        self.assertEqual(100000, body.bytesDecoded)
+
     def testMockOaiRequest(self):
         response = self.request.request({'verb': 'ListRecords', 'metadataPrefix': 'oai_dc'})
         self.assertEqual('2004-12-29T13:19:27Z', xpathFirst(response.response, '/oai:OAI-PMH/oai:responseDate/text()'))
@@ -158,6 +288,35 @@ class OaiRequestTest(SeecrTestCase):
         oaiRequest = OaiRequest("http://x.y.z/oai?apikey=xyz123")
         self.assertEqual("http://x.y.z/oai?apikey=xyz123&verb=ListRecords&metadataPrefix=oai_dc", oaiRequest._buildRequestUrl([('verb', 'ListRecords'), ('metadataPrefix', 'oai_dc')]))
 
+    def testStreamingListRecords(self):
+        request = MockOaiRequest('mocktud', streaming=True)
+        response = request.listRecords(metadataPrefix='oai_dc')
+        self.assertEqual("2004-12-29T13:19:27Z", response.responseDate)
+        identifiers = []
+        for record in response.records:
+            self.assertEqual(None, record.getprevious())
+            identifiers.append(xpathFirst(record, 'oai:header/oai:identifier/text()'))
+        self.assertEqual(['oai:tudelft.nl:007087', 'oai:tudelft.nl:007192', 'oai:tudelft.nl:007193'], identifiers)
+        self.assertEqual("TestToken", response.resumptionToken)
+
+    def testStreamingListRecordsError(self):
+        request = MockOaiRequest('mocktud', streaming=True)
+        try:
+            request.listRecords(resumptionToken='BadResumptionToken')
+            self.fail()
+        except OAIError as e:
+            self.assertEqual('badResumptionToken', e.errorCode())
+
+        response = request.listRecords(resumptionToken='EmptyListToken')
+        self.assertEqual([], list(response.records))
+        self.assertEqual("", response.resumptionToken)
+        self.assertEqual("2005-01-12T14:34:49Z", response.responseDate)
+
+    def testStreamingOnlyForListRecords(self):
+        request = MockOaiRequest('mocktud', streaming=True)
+        response = request.getRecord(identifier='oai:rep:12345', metadataPrefix='oai_dc')
+        self.assertEqual('oai:rep:12345', xpathFirst(response.record, 'oai:header/oai:identifier/text()'))
+
     def testShouldUseOwnClockTimeAsResponseDateIfNonePresent(self):
         originalZuluMethod = OaiResponse._zulu
         OaiResponse._zulu = staticmethod(lambda: '2020-12-12T12:12:12Z')
@@ -167,6 +326,14 @@ class OaiRequestTest(SeecrTestCase):
         finally:
             OaiResponse._zulu = originalZuluMethod
 
+def _serviceUnavailable(retryAfter):
+    return HTTPError('http://harvest.me', 503, 'Service Unavailable', {} if retryAfter is None else {'Retry-After': retryAfter}, None)
+
+class _CompressedResponse(BytesIO):
+    def __init__(self, body, contentEncoding):
+        BytesIO.__init__(self, body)
+        self.headers = {} if contentEncoding is None else {'Content-Encoding': contentEncoding}
+
 def oaiResponse(**kwargs):
     return OaiResponse(XML(oaiResponseXML(**kwargs)))
 
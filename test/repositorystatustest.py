@@ -31,7 +31,7 @@
 #
 ## end license ##
 
-from os.path import join
+from os.path import join, isfile
 
 from lxml.etree import tostring
 from simplejson import dump as jsonDump
@@ -41,6 +41,7 @@ from seecr.test.utils import mkdir
 
 from escaping import escapeFilename
 from meresco.harvester.repositorystatus import RepositoryStatus
+from meresco.harvester.statusindex import parseEventsFile
 
 def _writeFile(*args, data=None):
     with open(join(*args), 'w') as f:
@@ -123,6 +124,20 @@ class RepositoryStatusTest(SeecrTestCase):
                         "lastHarvestAttempt": None
                     }], self.status.getStatus(domainId=self.domainId, repositoryId="anotherRepoId"))
 
+    def testGetStatusFromStatusIndex(self):
+        with open(join(self.stateDir, self.domainId, 'repoId1.status'), 'w') as f:
+            jsonDump(dict(lastHarvestDate='2006-03-11T12:13:14Z', harvested=200, uploaded=199, deleted=1, total=1542, totalerrors=0, recenterrors=[], invalid=1, recentinvalids=['invalidId1'], lastHarvestAttempt='2006-03-11T12:13:14Z'), f)
+        status = self.status.getStatus(domainId=self.domainId, repositoryId="repoId1")[0]
+        self.assertEqual(1542, status['total'])
+        self.assertEqual(['invalidId1'], status['recentinvalids'])
+
+    def testStatusIndexIsRebuiltOnce(self):
+        _writeFile(self.logDir, self.domainId, 'repoId1.events', data='\t'.join(['[2006-03-11 12:13:14]', 'SUCCES', 'repoId1', 'Harvested/Uploaded/Deleted/Total: 200/199/1/1542, ResumptionToken: abcdef']))
+        self.assertEqual(1542, self.status.getStatus(domainId=self.domainId, repositoryId="repoId1")[0]['total'])
+        self.assertTrue(isfile(join(self.stateDir, self.domainId, 'repoId1.status')))
+        _writeFile(self.logDir, self.domainId, 'repoId1.events', data='')
+        self.assertEqual(1542, self.status.getStatus(domainId=self.domainId, repositoryId="repoId1")[0]['total'])
+
     def testGetStatusForDomainIdAndRepositoryGroupId(self):
         self.assertEqual([{
                         "repositoryId": "repoId1",
@@ -239,7 +254,7 @@ class RepositoryStatusTest(SeecrTestCase):
     def testSucces(self):
         logLine = '\t'.join(['[2006-03-13 12:13:14]', 'SUCCES', 'repoId1', 'Harvested/Uploaded/Deleted/Total: 200/199/1/1542, ResumptionToken: None'])
         _writeFile(self.logDir, self.domainId, 'repoId1.events', data=logLine)
-        state = self.status._parseEventsFile(domainId=self.domainId, repositoryId='repoId1')
+        state = parseEventsFile(join(self.logDir, self.domainId, 'repoId1.events'))
         self.assertEqual('2006-03-13T12:13:14Z', state["lastHarvestDate"])
         self.assertEqual('200', state["harvested"])
         self.assertEqual('199', state["uploaded"])
@@ -251,7 +266,7 @@ class RepositoryStatusTest(SeecrTestCase):
     def testOnlyErrors(self):
         logLine = '\t'.join(['[2006-03-11 12:13:14]', 'ERROR', 'repoId1', 'Sorry, but the VM has crashed.'])
         _writeFile(self.logDir, self.domainId, 'repoId1.events', data=logLine)
-        state = self.status._parseEventsFile(domainId=self.domainId, repositoryId='repoId1')
+        state = parseEventsFile(join(self.logDir, self.domainId, 'repoId1.events'))
         self.assertTrue("lastHarvestDate" not in state, list(state.keys()))
         self.assertTrue("harvested" not in state, list(state.keys()))
         self.assertTrue("uploaded" not in state, list(state.keys()))
@@ -265,7 +280,7 @@ class RepositoryStatusTest(SeecrTestCase):
         logLine1 = '\t'.join(['[2006-03-11 12:13:14]', 'ERROR', 'repoId1', 'Sorry, but the VM has crashed.'])
         logLine2 = '\t'.join(['[2006-03-11 12:14:14]', 'ERROR', 'repoId1', 'java.lang.NullPointerException.'])
         _writeFile(self.logDir, self.domainId, 'repoId1.events', data=logLine1 + "\n" + logLine2)
-        state = self.status._parseEventsFile(domainId=self.domainId, repositoryId='repoId1')
+        state = parseEventsFile(join(self.logDir, self.domainId, 'repoId1.events'))
         self.assertEqual(2, state["totalerrors"])
         self.assertEqual("2006-03-11T12:14:14Z", state["lastHarvestAttempt"])
         self.assertEqual([('2006-03-11T12:14:14Z', 'java.lang.NullPointerException.'), ('2006-03-11T12:13:14Z','Sorry, but the VM has crashed.')], state["recenterrors"])
@@ -274,7 +289,7 @@ class RepositoryStatusTest(SeecrTestCase):
         logLine1 = '\t'.join(['[2006-03-11 12:13:14]', 'SUCCES', 'repoId1', 'Harvested/Uploaded/Deleted/Total: 200/199/1/1542, ResumptionToken: abcdef'])
         logLine2 = '\t'.join(['[2006-03-11 12:14:14]', 'ERROR', 'repoId1', 'java.lang.NullPointerException.'])
         _writeFile(self.logDir, self.domainId, 'repoId1.events', data=logLine1 + "\n" + logLine2)
-        state = self.status._parseEventsFile(domainId=self.domainId, repositoryId='repoId1')
+        state = parseEventsFile(join(self.logDir, self.domainId, 'repoId1.events'))
         self.assertEqual("2006-03-11T12:13:14Z", state["lastHarvestDate"])
         self.assertEqual("200", state["harvested"])
         self.assertEqual("199", state["uploaded"])
@@ -284,11 +299,24 @@ class RepositoryStatusTest(SeecrTestCase):
         self.assertEqual("2006-03-11T12:14:14Z", state["lastHarvestAttempt"])
         self.assertEqual([('2006-03-11T12:14:14Z', 'java.lang.NullPointerException.')], state["recenterrors"])
 
+    def testSuccesInOlderSegment(self):
+        logLine1 = '\t'.join(['[2006-03-11 12:13:14]', 'SUCCES', 'repoId1', 'Harvested/Uploaded/Deleted/Total: 200/199/1/1542, ResumptionToken: abcdef'])
+        logLine2 = '\t'.join(['[2006-03-11 12:14:14]', 'ERROR', 'repoId1', 'java.lang.NullPointerException.'])
+        _writeFile(self.logDir, self.domainId, 'repoId1.events.4', data=logLine1 + "\n")
+        _writeFile(self.logDir, self.domainId, 'repoId1.events', data=logLine2 + "\n")
+        with open(join(self.logDir, self.domainId, 'repoId1.events.index'), 'w') as f:
+            jsonDump(dict(segments=[[4, 1]], lines=1, size=0), f)
+        state = parseEventsFile(join(self.logDir, self.domainId, 'repoId1.events'))
+        self.assertEqual("2006-03-11T12:13:14Z", state["lastHarvestDate"])
+        self.assertEqual("1542", state["total"])
+        self.assertEqual(1, state["totalerrors"])
+        self.assertEqual("2006-03-11T12:14:14Z", state["lastHarvestAttempt"])
+
     def testErrorBeforeSucces(self):
         logLine1 = '\t'.join(['[2006-03-11 12:13:14]', 'ERROR', 'repoId1', 'java.lang.NullPointerException.'])
         logLine2 = '\t'.join(['[2006-03-11 12:14:14]', 'SUCCES', 'repoId1', 'Harvested/Uploaded/Deleted/Total: 200/199/1/1542, ResumptionToken: abcdef'])
         _writeFile(self.logDir, self.domainId, 'repoId1.events', data=logLine1 + "\n" + logLine2)
-        state = self.status._parseEventsFile(domainId=self.domainId, repositoryId='repoId1')
+        state = parseEventsFile(join(self.logDir, self.domainId, 'repoId1.events'))
         self.assertEqual("2006-03-11T12:14:14Z", state["lastHarvestDate"])
         self.assertEqual("200", state["harvested"])
         self.assertEqual("199", state["uploaded"])
@@ -303,7 +331,7 @@ class RepositoryStatusTest(SeecrTestCase):
             for i in range(20):
                 logLine = '\t'.join(['[2006-03-11 12:%.2d:14]' % i, 'ERROR', 'repoId1', 'Error %d, Crash' % i])
                 f.write(logLine + "\n")
-        state = self.status._parseEventsFile(domainId=self.domainId, repositoryId='repoId1')
+        state = parseEventsFile(join(self.logDir, self.domainId, 'repoId1.events'))
         self.assertEqual(20, state["totalerrors"])
         self.assertEqual(10, len(state["recenterrors"]))
         self.assertEqual([('2006-03-11T12:19:14Z', 'Error 19, Crash'), ('2006-03-11T12:18:14Z', 'Error 18, Crash'), ('2006-03-11T12:17:14Z', 'Error 17, Crash'), ('2006-03-11T12:16:14Z', 'Error 16, Crash'), ('2006-03-11T12:15:14Z', 'Error 15, Crash'), ('2006-03-11T12:14:14Z', 'Error 14, Crash'), ('2006-03-11T12:13:14Z', 'Error 13, Crash'), ('2006-03-11T12:12:14Z', 'Error 12, Crash'), ('2006-03-11T12:11:14Z', 'Error 11, Crash'), ('2006-03-11T12:10:14Z', 'Error 10, Crash')], state["recenterrors"])
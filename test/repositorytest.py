@@ -207,12 +207,17 @@ class RepositoryTest(SeecrTestCase):
         self.repo.userAgent = "This is the User agent"
         self.repo.authorizationKey = "Let Me In"
         self.repo.oairequest()
-        self.assertEqual(((None,), {'userAgent': 'This is the User agent', 'authorizationKey': 'Let Me In'}), self.oaiRequestArgsKwargs)
+        self.assertEqual(((None,), {'userAgent': 'This is the User agent', 'authorizationKey': 'Let Me In', 'streaming': False, 'connectionPool': None, 'hostLimiter': None}), self.oaiRequestArgsKwargs)
 
     def testNoneUserAgentIfEmpty(self):
         self.repo.userAgent = ''
         self.repo.oairequest()
-        self.assertEqual(((None,), {'userAgent': None, 'authorizationKey': None}), self.oaiRequestArgsKwargs)
+        self.assertEqual(((None,), {'userAgent': None, 'authorizationKey': None, 'streaming': False, 'connectionPool': None, 'hostLimiter': None}), self.oaiRequestArgsKwargs)
+
+    def testPassOnStreaming(self):
+        self.repo.streaming = True
+        self.repo.oairequest()
+        self.assertEqual(True, self.oaiRequestArgsKwargs[1]['streaming'])
 
 class MockAction(Action):
     def __init__(self, message = '', done = True, hasResumptionToken=False):
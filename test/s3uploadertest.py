@@ -0,0 +1,81 @@
+## begin license ##
+#
+# "Meresco Harvester" consists of two subsystems, namely an OAI-harvester and
+# a web-control panel.
+# "Meresco Harvester" is originally called "Sahara" and was developed for
+# SURFnet by:
+# Seek You Too B.V. (CQ2) http://www.cq2.nl
+#
+# Copyright (C) 2026 Seecr (Seek You Too B.V.) https://seecr.nl
+#
+# This file is part of "Meresco Harvester"
+#
+# "Meresco Harvester" is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# "Meresco Harvester" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "Meresco Harvester"; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+## end license ##
+
+
+from seecr.test import SeecrTestCase, CallTrace
+
+from botocore.exceptions import ClientError
+
+from meresco.harvester.s3uploader import S3Uploader
+from meresco.harvester.virtualuploader import UploaderException, InvalidComponentException
+
+
+class _Upload(object):
+    def __init__(self, id):
+        self.id = id
+
+
+class S3UploaderTest(SeecrTestCase):
+    def setUp(self):
+        SeecrTestCase.setUp(self)
+        target = CallTrace('target')
+        target.baseurl = 'http://localhost:9000'
+        target.accessKey = 'access'
+        target.secretKey = 'secret'
+        target.path = 'records'
+        target.bucket = 'bucket'
+        self.uploader = S3Uploader(target, CallTrace('eventlogger'))
+        self.s3 = CallTrace('s3', returnValues={'delete_objects': {}})
+        self.uploader.s3 = self.s3
+
+    def testDeleteManyInChunks(self):
+        self.uploader.deleteMany([_Upload('id:%d' % i) for i in range(2500)])
+        self.assertEqual(['delete_objects'] * 3, self.s3.calledMethodNames())
+        deletes = [m.kwargs['Delete'] for m in self.s3.calledMethods]
+        self.assertEqual([1000, 1000, 500], [len(delete['Objects']) for delete in deletes])
+        self.assertEqual({'Key': 'id:1000'}, deletes[1]['Objects'][0])
+        self.assertEqual(True, deletes[0]['Quiet'])
+        self.assertEqual('bucket', self.s3.calledMethods[0].kwargs['Bucket'])
+
+    def testDeleteManyIgnoresMissingKeys(self):
+        self.s3.returnValues['delete_objects'] = {'Errors': [{'Key': 'id:1', 'Code': 'NoSuchKey', 'Message': 'The specified key does not exist.'}]}
+        self.uploader.deleteMany([_Upload('id:1'), _Upload('id:2')])
+        self.assertEqual(['delete_objects'], self.s3.calledMethodNames())
+
+    def testDeleteManyRaisesOtherErrors(self):
+        self.s3.returnValues['delete_objects'] = {'Errors': [{'Key': 'id:2', 'Code': 'AccessDenied', 'Message': 'Access Denied'}]}
+        try:
+            self.uploader.deleteMany([_Upload('id:1'), _Upload('id:2')])
+            self.fail()
+        except UploaderException as e:
+            self.assertEqual('id:2', e.uploadId)
+            self.assertEqual('Access Denied', e.originalMessage)
+
+    def testDeleteManyWithoutBucket(self):
+        self.s3.exceptions['delete_objects'] = ClientError({'Error': {'Code': 'NoSuchBucket', 'Message': 'The specified bucket does not exist'}}, 'DeleteObjects')
+        self.assertRaises(InvalidComponentException, lambda: self.uploader.deleteMany([_Upload('id:1')]))
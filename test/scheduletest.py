@@ -0,0 +1,142 @@
+## begin license ##
+#
+# "Meresco Harvester" consists of two subsystems, namely an OAI-harvester and
+# a web-control panel.
+# "Meresco Harvester" is originally called "Sahara" and was developed for
+# SURFnet by:
+# Seek You Too B.V. (CQ2) http://www.cq2.nl
+#
+# Copyright (C) 2026 Seecr (Seek You Too B.V.) https://seecr.nl
+#
+# This file is part of "Meresco Harvester"
+#
+# "Meresco Harvester" is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# "Meresco Harvester" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "Meresco Harvester"; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+## end license ##
+
+
+from seecr.test import SeecrTestCase
+from json import dump
+from os.path import join
+
+from meresco.harvester.repository import Repository
+from meresco.harvester.schedule import nextHarvestTime, HarvestQueue
+
+NOW = 1600000000 # 2020-09-13T12:26:40Z
+DAY = 24 * 60 * 60
+
+
+class ScheduleTest(SeecrTestCase):
+    def setUp(self):
+        super(ScheduleTest, self).setUp()
+        self.repository = Repository('domain', 'rep')
+        self.repository.use = True
+
+    def writeState(self, resumptionToken='', from_='', lastSuccessfulHarvest=None):
+        with open(join(self.tempdir, 'rep.next'), 'w') as f:
+            dump({'resumptionToken': resumptionToken, 'from': from_, 'lastSuccessfulHarvest': lastSuccessfulHarvest}, f)
+
+    def testNeverHarvestedIsDue(self):
+        self.assertEqual(NOW, nextHarvestTime(self.repository, self.tempdir, NOW))
+
+    def testNotInUseIsNeverDue(self):
+        self.repository.use = False
+        self.assertEqual(None, nextHarvestTime(self.repository, self.tempdir, NOW))
+        self.repository.action = 'clear'
+        self.assertEqual(NOW, nextHarvestTime(self.repository, self.tempdir, NOW))
+
+    def testResumptionTokenIsDue(self):
+        self.writeState(resumptionToken='token', from_='2020-09-13', lastSuccessfulHarvest='2020-09-13T12:00:00Z')
+        self.assertEqual(NOW, nextHarvestTime(self.repository, self.tempdir, NOW))
+
+    def testDailyHarvestIsDueNextUtcDay(self):
+        self.writeState(from_='2020-09-13T12:00:00Z', lastSuccessfulHarvest='2020-09-13T12:00:00Z')
+        self.assertEqual(1600041600, nextHarvestTime(self.repository, self.tempdir, NOW))
+        self.writeState(from_='2020-09-12')
+        self.assertEqual(1599955200, nextHarvestTime(self.repository, self.tempdir, NOW))
+
+    def testContinuousHarvest(self):
+        self.repository.continuous = 600
+        self.writeState(lastSuccessfulHarvest='2020-09-13T12:20:00Z')
+        self.assertEqual(1599999600 + 600 + 1, nextHarvestTime(self.repository, self.tempdir, NOW))
+
+    def testShopClosedIsDueNextMinute(self):
+        self.repository.shopclosed = ['*:*:0:0-*:*:23:59']
+        self.assertEqual(1600000020, nextHarvestTime(self.repository, self.tempdir, NOW))
+        self.writeState(lastSuccessfulHarvest='2020-09-13T12:20:00Z')
+        self.assertEqual(1600041600, nextHarvestTime(self.repository, self.tempdir, NOW))
+
+    def testQueueOnlyPopsDueRepositories(self):
+        now = [NOW]
+        dueTimes = {'a': NOW + 10, 'b': NOW, 'c': None}
+        queue = HarvestQueue(dueTimes.get, _now=lambda: now[0])
+        for repositoryId in ['a', 'b', 'c']:
+            queue.add(repositoryId)
+        self.assertEqual(3, len(queue))
+        self.assertEqual('b', queue.pop())
+        self.assertEqual(None, queue.pop())
+        self.assertEqual(10, queue.secondsUntilDue())
+        now[0] = NOW + 10
+        self.assertEqual('a', queue.pop())
+        self.assertEqual(None, queue.pop())
+        self.assertEqual(set(['c']), queue.ids())
+        self.assertEqual(50, queue.secondsUntilDue())
+
+    def testDueTimeIsAskedAgain(self):
+        dueTimes = {'a': NOW}
+        queue = HarvestQueue(dueTimes.get, _now=lambda: NOW)
+        queue.add('a')
+        dueTimes['a'] = NOW + 5
+        self.assertEqual(None, queue.pop())
+        self.assertEqual(5, queue.secondsUntilDue())
+        self.assertTrue('a' in queue)
+
+    def testRefreshFindsEarlierDueTime(self):
+        now = [NOW]
+        dueTimes = {'a': NOW + 24 * 60 * 60, 'b': NOW + 30}
+        queue = HarvestQueue(dueTimes.get, _now=lambda: now[0])
+        queue.add('a')
+        queue.add('b')
+        dueTimes['a'] = NOW + 10
+        dueTimes['b'] = NOW + 24 * 60 * 60
+        queue.refresh()
+        self.assertEqual(30, queue.secondsUntilDue())
+        now[0] = NOW + 60
+        queue.refresh()
+        self.assertEqual('a', queue.pop())
+        self.assertEqual(None, queue.pop())
+        self.assertEqual(set(['b']), queue.ids())
+
+    def testRepositoryDueAgainQueuesBehindOthers(self):
+        queue = HarvestQueue(lambda repositoryId: NOW, _now=lambda: NOW)
+        for repositoryId in ['large', 'small1', 'small2']:
+            queue.add(repositoryId)
+        popped = []
+        for i in range(6):
+            repositoryId = queue.pop()
+            popped.append(repositoryId)
+            if repositoryId == 'large':
+                queue.add('large', due=NOW)
+        self.assertEqual(['large', 'small1', 'small2', 'large', 'large', 'large'], popped)
+
+    def testDiscard(self):
+        queue = HarvestQueue(lambda repositoryId: NOW, _now=lambda: NOW)
+        queue.add('a')
+        queue.add('b')
+        queue.discard('a')
+        self.assertFalse('a' in queue)
+        self.assertEqual('b', queue.pop())
+        self.assertEqual(None, queue.pop())
+        self.assertEqual(None, queue.secondsUntilDue())
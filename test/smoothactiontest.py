@@ -39,7 +39,7 @@ from actiontestcase import ActionTestCase
 import os
 from os.path import join
 from meresco.harvester.repository import Repository
-from meresco.harvester.action import SmoothAction, DONE
+from meresco.harvester.action import SmoothAction, DONE, DELETING
 from meresco.harvester.harvester import HARVESTED, NOTHING_TO_DO
 from meresco.harvester.ids import readIds
 from meresco.harvester.eventlogger import NilEventLogger
@@ -133,6 +133,29 @@ class SmoothActionTest(ActionTestCase):
         self.assertEqual('Smooth reharvest: ' + DONE, message)
         self.assertTrue(done)
 
+    def testSmooth_DeletePhaseIsResumed(self):
+        writefile(self.old_idfilename, 'rep:id:1\nrep:id:2\nrep:id:3\n')
+        writefile(self.idfilename, 'rep:id:2\n')
+        self.smoothaction._harvest = lambda:(NOTHING_TO_DO, False)
+        deleted = []
+        self.smoothaction._delete = lambda filename: deleted.append(readIds(filename)) or False
+        done, message, hasResumptionToken = self.smoothaction.do()
+
+        self.assertEqual((False, 'Smooth reharvest: ' + DELETING, True), (done, message, hasResumptionToken))
+        self.assertEqual([['rep:id:1', 'rep:id:3']], deleted)
+        self.assertTrue(os.path.isfile(self.old_idfilename))
+
+        def harvest():
+            raise AssertionError('Deleting is resumed before harvesting')
+        self.smoothaction._harvest = harvest
+        self.smoothaction._delete = lambda filename: deleted.append(readIds(filename)) or True
+        done, message, hasResumptionToken = self.smoothaction.do()
+
+        self.assertEqual((True, 'Smooth reharvest: ' + DONE, False), (done, message, hasResumptionToken))
+        self.assertEqual(2, len(deleted))
+        self.assertFalse(os.path.isfile(self.old_idfilename))
+        self.assertFalse(os.path.isfile(self.idfilename + '.delete'))
+
     def mockdelete(self, filename):
         self.mockdelete_filename = filename
         self.mockdelete_ids = readIds(filename)
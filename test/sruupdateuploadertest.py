@@ -51,6 +51,7 @@ class SruUpdateUploaderTest(SeecrTestCase):
     def setUp(self):
         SeecrTestCase.setUp(self)
         self.target = CallTrace('SruUpdateTarget', verbose=True)
+        self.target.concurrency = None
         self.uploader = SruUpdateUploader(self.target, CallTrace('eventlogger'))
         self.sentData = []
         def sendData(anId, data):
@@ -83,6 +84,14 @@ class SruUpdateUploaderTest(SeecrTestCase):
         self.assertEqual('some:id', xpathFirst(updateRequest, 'ucp:recordIdentifier/text()'))
         self.assertEqual('info:srw/action/1/delete', xpathFirst(updateRequest, 'ucp:action/text()'))
 
+    def testSendEndLoggedAfterSending(self):
+        eventLogger = CallTrace('eventlogger')
+        uploader = SruUpdateUploader(self.target, eventLogger)
+        uploader._sendData = lambda anId, data: eventLogger.sendData(anId)
+        uploader.send(self.upload)
+        self.assertEqual(['logLine', 'sendData', 'logLine'], [m.name for m in eventLogger.calledMethods])
+        self.assertEqual(('UPLOAD.SEND', 'END'), eventLogger.calledMethods[-1].args)
+
     def testException(self):
         possibleSRUError=b"""<?xml version="1.0" encoding="UTF-8"?>
 <srw:updateResponse xmlns:srw="http://www.loc.gov/zing/srw/" xmlns:ucp="info:lc/xmlns/update-v1">
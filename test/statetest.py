@@ -162,6 +162,20 @@ Started: 2005-01-07 16:18:56, Harvested/Uploaded/Deleted/Total: 0/0/0/0, Done: D
             self.assertEqual(None, s.from_)
             self.assertEqual(None, s.token)
 
+    def testMarkHarvestedTwiceWithinOneRun(self):
+        with _State(self.tempdir, 'repo') as state:
+            state.getZTime = lambda: ZuluTime('2012-08-13T12:15:00Z')
+            state.markStarted()
+            state.markHarvested("3/3/0/3", "resumptionToken", "2012-08-13T12:14:00")
+            self.assertEqual('2012-08-13T12:14:00', state.from_)
+            self.assertEqual('resumptionToken', state.token)
+            state.markStarted()
+            state.markHarvested("3/3/0/6", None, "2012-08-13T12:16:00Z")
+            self.assertEqual('2012-08-13T12:14:00', state.from_)
+            self.assertEqual(None, state.token)
+
+        self.assertEqual({"from": "2012-08-13T12:14:00", "resumptionToken": "", 'lastSuccessfulHarvest':'2012-08-13T12:15:00Z'}, JsonDict.load(join(self.tempdir, 'repo.next')))
+
     def testMarkHarvested(self):
         with _State(self.tempdir, 'repo') as state:
             state.getZTime = lambda: ZuluTime('2012-08-13T12:15:00Z')
@@ -222,6 +236,21 @@ Started: 2012-08-13 12:17:00, Harvested/Uploaded/Deleted/Total: 0/0/0/0, Done: D
         self.assertEqual({"from": "", "resumptionToken": "", 'lastSuccessfulHarvest':None}, JsonDict.load(join(self.tempdir, 'repo.next')))
         self.assertEqual({"changedate": "2012-08-13 12:15:00", "status": "Ok", "message": ""}, JsonDict.load(join(self.tempdir, 'repo.running')))
 
+    def testMarkDeleteProgress(self):
+        with _State(self.tempdir, 'repo') as state:
+            state.getZTime = lambda: ZuluTime('2012-08-13T12:15:00Z')
+            state.markDeleteProgress(done=2000, remaining=8000, rate=123.456)
+            self.assertEqual({"changedate": "2012-08-13 12:15:00", "status": "Ok", "message": "",
+                    "progress": {"phase": "delete", "done": 2000, "remaining": 8000, "rate": 123.5}},
+                JsonDict.load(join(self.tempdir, 'repo.running')))
+            state.clearDeleteProgress()
+            self.assertEqual({"changedate": "2012-08-13 12:15:00", "status": "Ok", "message": ""}, JsonDict.load(join(self.tempdir, 'repo.running')))
+
+            state.markDeleteProgress(done=3000, remaining=7000, rate=10)
+            state.getZTime = lambda: ZuluTime('2012-08-13T12:17:00Z')
+            state.markDeleted()
+            self.assertEqual({"changedate": "2012-08-13 12:17:00", "status": "Ok", "message": ""}, JsonDict.load(join(self.tempdir, 'repo.running')))
+
     def testSetToLastCleanState(self):
         with _State(self.tempdir, 'repo') as state:
             state.getZTime = lambda: ZuluTime('2012-08-13T12:15:00Z')
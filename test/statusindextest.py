@@ -0,0 +1,99 @@
+## begin license ##
+#
+# "Meresco Harvester" consists of two subsystems, namely an OAI-harvester and
+# a web-control panel.
+# "Meresco Harvester" is originally called "Sahara" and was developed for
+# SURFnet by:
+# Seek You Too B.V. (CQ2) http://www.cq2.nl
+#
+# Copyright (C) 2026 Seecr (Seek You Too B.V.) https://seecr.nl
+#
+# This file is part of "Meresco Harvester"
+#
+# "Meresco Harvester" is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# "Meresco Harvester" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "Meresco Harvester"; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+## end license ##
+
+
+from os.path import join, isfile
+
+from seecr.test import SeecrTestCase
+
+from meresco.harvester.statusindex import StatusIndex, loadStatus, statusFilename
+from meresco.harvester.eventlogger import EventLogger
+
+
+class StatusIndexTest(SeecrTestCase):
+    def setUp(self):
+        super(StatusIndexTest, self).setUp()
+        self.filename = statusFilename(self.tempdir, 'repo')
+        self.eventsfile = join(self.tempdir, 'repo.events')
+        self.invalidIds = ['id:1', 'id:2']
+
+    def testRebuildFromEventsFileOnce(self):
+        with open(self.eventsfile, 'w') as f:
+            f.write('[2006-03-11 12:13:14.000]\tSUCCES\t[repo]\tHarvested/Uploaded/Deleted/Total: 200/199/1/1542, ResumptionToken: abc\n')
+            f.write('[2006-03-11 12:14:14.000]\tERROR\t[repo]\tOops\n')
+        index = StatusIndex(self.filename, self.eventsfile, invalidIds=self.invalidIds)
+        self.assertEqual({
+                'lastHarvestDate': '2006-03-11T12:13:14Z',
+                'harvested': 200,
+                'uploaded': 199,
+                'deleted': 1,
+                'total': 1542,
+                'totalerrors': 1,
+                'recenterrors': [{'date': '2006-03-11T12:14:14Z', 'error': 'Oops'}],
+                'invalid': 2,
+                'recentinvalids': ['id:2', 'id:1'],
+                'lastHarvestAttempt': '2006-03-11T12:14:14Z',
+            }, index.status())
+        self.assertEqual(index.status(), loadStatus(self.filename))
+
+        with open(self.eventsfile, 'w') as f:
+            f.write('')
+        self.assertEqual(1542, StatusIndex(self.filename, self.eventsfile, invalidIds=[]).status()['total'])
+
+    def testUpdatedByEventLogger(self):
+        index = StatusIndex(self.filename, self.eventsfile, invalidIds=self.invalidIds)
+        logger = EventLogger(self.eventsfile, listeners=[index])
+        try:
+            logger.logLine('STARTHARVEST', '', id='repo')
+            status = loadStatus(self.filename)
+            self.assertEqual(None, status['lastHarvestDate'])
+            self.assertNotEqual(None, status['lastHarvestAttempt'])
+
+            logger.logError('Error 1', id='repo')
+            logger.logError('Error\n2', id='repo')
+            status = loadStatus(self.filename)
+            self.assertEqual(2, status['totalerrors'])
+            self.assertEqual(['Error 2', 'Error 1'], [e['error'] for e in status['recenterrors']])
+
+            self.invalidIds.append('id:3')
+            logger.logSuccess('Harvested/Uploaded/Deleted/Total: 10/8/2/100, ResumptionToken: ', id='repo')
+            status = loadStatus(self.filename)
+            self.assertEqual((8, 100, 0, []), (status['uploaded'], status['total'], status['totalerrors'], status['recenterrors']))
+            self.assertEqual(status['lastHarvestAttempt'], status['lastHarvestDate'])
+            self.assertEqual(3, status['invalid'])
+            self.assertEqual(['id:3', 'id:2', 'id:1'], status['recentinvalids'])
+        finally:
+            logger.close()
+
+    def testErrorsAreLimited(self):
+        index = StatusIndex(self.filename, self.eventsfile, invalidIds=[])
+        for i in range(120):
+            index.logLine('2006-03-11 12:14:14.000', 'ERROR', 'Error %s' % i)
+        self.assertEqual(101, index.status()['totalerrors'])
+        self.assertEqual(10, len(index.status()['recenterrors']))
+        self.assertEqual('Error 119', index.status()['recenterrors'][0]['error'])
@@ -37,7 +37,7 @@
 
 import unittest
 import datetime, tempfile, os, shutil
-from meresco.harvester.throughputanalyser import parseToTime, ThroughputAnalyser, ThroughputReport
+from meresco.harvester.throughputanalyser import parseToTime, ThroughputAnalyser, ThroughputReport, ThroughputRollup, rollupFilename
 
 class ThroughputAnalyserTest(unittest.TestCase):
     
@@ -111,6 +111,57 @@ class ThroughputAnalyserTest(unittest.TestCase):
         self.assertEqual(600, records)
         self.assertEqual(76.5, seconds)
         
+    def testAnalyseRepositoryAcrossSegments(self):
+        with open(os.path.join(self.testdir, 'repo1.events.1'), 'w') as r:
+            r.write("""[2006-08-31 01:00:00.000]	STARTHARVEST	[repo1]	Uploader connected ...
+[2006-08-31 01:00:10.000]	SUCCES	[repo1]	Harvested/Uploaded/Deleted/Total: 200/200/0/1200, ResumptionToken: r1
+""")
+        with open(os.path.join(self.testdir, 'repo1.events'), 'w') as r:
+            r.write("""[2006-08-31 01:00:15.500]	ENDHARVEST	[repo1]	
+""")
+        with open(os.path.join(self.testdir, 'repo1.events.index'), 'w') as r:
+            r.write('{"segments": [[1, 2]], "lines": 1, "size": 0}')
+        t = ThroughputAnalyser(eventpath = self.testdir)
+        records, seconds = t._analyseRepository('repo1', '2006-08-31')
+        self.assertEqual(200, records)
+        self.assertEqual(15.5, seconds)
+
+    def testRollupIsWrittenOnceAndUsedInsteadOfEvents(self):
+        self.testAnalyseRepository()
+        self.assertTrue(os.path.isfile(rollupFilename(self.testdir, 'repo1')))
+        with open(os.path.join(self.testdir, 'repo1.events'), 'w') as r:
+            r.write('')
+        t = ThroughputAnalyser(eventpath = self.testdir)
+        self.assertEqual((600, 76.5), t._analyseRepository('repo1', '2006-08-31'))
+        self.assertEqual((800, 92.0), t._analyseRepository('repo1', '2006-08-30'))
+
+    def testRollupUpdatedWhenHarvestEnds(self):
+        filename = rollupFilename(self.testdir, 'repo1')
+        rollup = ThroughputRollup.open(filename, os.path.join(self.testdir, 'repo1.events'))
+        rollup.logLine('2006-08-31 01:00:00.000', 'STARTHARVEST', '')
+        rollup.logLine('2006-08-31 01:00:10.000', 'SUCCES', 'Harvested/Uploaded/Deleted/Total: 200/190/10/1000, ResumptionToken: r1')
+        rollup.logLine('2006-08-31 01:00:20.000', 'SUCCES', 'Harvested/Uploaded/Deleted/Total: 100/100/0/1100, ResumptionToken: ')
+        self.assertEqual((0, 0.0, 0), ThroughputRollup.load(filename).total('2006-08-31'))
+        rollup.logLine('2006-08-31 01:00:30.000', 'ENDHARVEST', '')
+        self.assertEqual((300, 30.0, 1), ThroughputRollup.load(filename).total('2006-08-31'))
+
+    def testAnalysePerPeriod(self):
+        rollup = ThroughputRollup(filename=rollupFilename(self.testdir, 'repo1'))
+        for start, end, uploaded in [
+                ('2006-08-27 23:00:00.000', '2006-08-27 23:00:10.000', 100),
+                ('2006-08-28 01:00:00.000', '2006-08-28 01:00:10.000', 200),
+                ('2006-08-28 01:30:00.000', '2006-08-28 01:30:20.000', 300),
+                ('2006-08-28 02:00:00.000', '2006-08-28 02:00:10.000', 400),
+            ]:
+            rollup.logLine(start, 'STARTHARVEST', '')
+            rollup.logLine(start, 'SUCCES', 'Harvested/Uploaded/Deleted/Total: %s/%s/0/0, ResumptionToken: ' % (uploaded, uploaded))
+            rollup.logLine(end, 'ENDHARVEST', '')
+        t = ThroughputAnalyser(eventpath = self.testdir)
+        periods = lambda granularity: [(period, report.records, report.seconds) for period, report in t.analysePerPeriod(['repo1'], '2006-08-27', granularity=granularity)]
+        self.assertEqual([('2006-08-27 23', 100, 10.0), ('2006-08-28 01', 500, 30.0), ('2006-08-28 02', 400, 10.0)], periods('hour'))
+        self.assertEqual([('2006-08-27', 100, 10.0), ('2006-08-28', 900, 40.0)], periods('day'))
+        self.assertEqual([('2006-W34', 100, 10.0), ('2006-W35', 900, 40.0)], periods('week'))
+
     def testAnalyseNonExistingRepository(self):
         t = ThroughputAnalyser(eventpath = self.testdir)
         records, seconds = t._analyseRepository('repository', '2006-08-31')
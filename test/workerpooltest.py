@@ -0,0 +1,114 @@
+## begin license ##
+#
+# "Meresco Harvester" consists of two subsystems, namely an OAI-harvester and
+# a web-control panel.
+# "Meresco Harvester" is originally called "Sahara" and was developed for
+# SURFnet by:
+# Seek You Too B.V. (CQ2) http://www.cq2.nl
+#
+# Copyright (C) 2026 Seecr (Seek You Too B.V.) https://seecr.nl
+#
+# This file is part of "Meresco Harvester"
+#
+# "Meresco Harvester" is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# "Meresco Harvester" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "Meresco Harvester"; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+## end license ##
+
+
+from os import getpid, _exit
+from time import sleep, time
+
+from seecr.test import SeecrTestCase
+
+from meresco.harvester.workerpool import WorkerPool
+
+
+jobsInThisProcess = []
+
+def job(argument):
+    jobsInThisProcess.append(argument)
+    if argument == 'crash':
+        _exit(3)
+    if argument == 'hang':
+        sleep(60)
+    if argument == 'error':
+        raise ValueError('bad argument')
+    return getpid(), list(jobsInThisProcess)
+
+
+class WorkerPoolTest(SeecrTestCase):
+    def setUp(self):
+        super(WorkerPoolTest, self).setUp()
+        self.pool = WorkerPool(job, size=2, timeout=1)
+        self.pool.start()
+
+    def tearDown(self):
+        self.pool.stop()
+        super(WorkerPoolTest, self).tearDown()
+
+    def runJob(self, argument):
+        self.pool.submit(argument)
+        finished = []
+        while not finished:
+            finished = self.pool.wait()
+        self.assertEqual(1, len(finished))
+        return finished[0]
+
+    def testWorkersAreReused(self):
+        argument, (pid1, jobs1), error = self.runJob('a')
+        self.assertEqual(('a', None), (argument, error))
+        argument, (pid2, jobs2), error = self.runJob('b')
+        self.assertEqual(pid1, pid2)
+        self.assertEqual(['a', 'b'], jobs2)
+        self.assertNotEqual(getpid(), pid1)
+        self.assertEqual([], jobsInThisProcess)
+
+    def testConcurrentJobs(self):
+        self.pool.submit('a')
+        self.pool.submit('b')
+        self.assertEqual(0, self.pool.idle())
+        finished = []
+        while len(finished) < 2:
+            finished.extend(self.pool.wait())
+        self.assertEqual(['a', 'b'], sorted(argument for argument, result, error in finished))
+        self.assertEqual(2, len(set(result[0] for argument, result, error in finished)))
+        self.assertEqual(2, self.pool.idle())
+
+    def testErrorInJob(self):
+        self.assertEqual(('error', None, 'ValueError: bad argument'), self.runJob('error'))
+        argument, result, error = self.runJob('a')
+        self.assertEqual(None, error)
+
+    def testCrashedWorkerIsReplaced(self):
+        argument, result, error = self.runJob('crash')
+        self.assertEqual(None, result)
+        self.assertTrue('died with exitcode 3' in error, error)
+        argument, result, error = self.runJob('a')
+        self.assertEqual(['a'], result[1])
+
+    def testHangingWorkerIsReplaced(self):
+        argument, result, error = self.runJob('hang')
+        self.assertEqual(('hang', None), (argument, result))
+        self.assertTrue('timed out after 1 seconds' in error, error)
+        self.assertEqual(2, self.pool.idle())
+        argument, result, error = self.runJob('a')
+        self.assertEqual(None, error)
+
+    def testWaitWithTimeout(self):
+        self.pool.submit('hang')
+        t0 = time()
+        self.assertEqual([], self.pool.wait(timeout=0.1))
+        self.assertTrue(time() - t0 < 0.9)
+        self.assertEqual(1, self.pool.idle())